@@ -1,20 +1,23 @@
-from flask import Flask, request, send_file, jsonify, render_template, redirect
+from flask import Flask, request, send_file, jsonify, render_template, redirect, g
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from functools import wraps
-import os, jwt, pandas as pd, json
+import os, jwt, pandas as pd, json, pickle
 import networkx as nx
 import spacy, time
 from transformers import pipeline
 import torch
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 from flask_cors import CORS
 import sqlite3
 import csv
 import datetime
+from knowledge_base import KnowledgeBaseGraph, TripleStore, GraphVersionStore
+from semantic_search import (
+    normalize_text, parse_search_filters, parse_search_limits, parse_community_ids, parse_ann_effort,
+    load_graph_file, SearchEngineRegistry, MAX_BATCH_QUERIES, SEARCH_TARGETS, SEARCH_MODES, RANKINGS, KNN_K,
+    KB_INDEX_KEY, RANGE_PAGE_SIZE, ANN_INDEX_SUFFIXES, GRAPH_VIEW_STRATEGIES, sample_graph_view
+)
 
 
 app = Flask(__name__)
@@ -60,6 +63,10 @@ ALLOWED_EXTENSIONS = {"txt", "csv", "json", "xml"}
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_dataset_file(user_folder, filename):
+    """Uploads and saved graphs; graph version folders and ANN index files are internal"""
+    return os.path.isfile(os.path.join(user_folder, filename)) and not filename.endswith(ANN_INDEX_SUFFIXES)
+
 # ===============================================================
 # Authentication & Authorization
 # ===============================================================
@@ -111,120 +118,6 @@ except Exception as e:
     print(f"REBEL model not available: {e}")
     re_pipeline = None
 
-# ===============================================================
-# Semantic Search Engine
-# ===============================================================
-
-class SemanticSearchEngine:
-    def __init__(self):
-        self.model = None
-        self.node_embeddings = None
-        self.nodes = None
-        self.graph = None
-        self._initialize_model()
-
-    def _initialize_model(self):
-        try:
-            print("Initializing semantic search model...")
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
-            print("Semantic search model loaded")
-        except Exception as e:
-            print(f"Failed to load semantic search model: {e}")
-            self.model = None
-
-    def build_index(self, graph):
-        """Build semantic index from graph nodes"""
-        if self.model is None:
-            print("Cannot build index: model not loaded")
-            return 0
-
-        self.graph = graph
-        self.nodes = list(graph.nodes())
-
-        print(f"Building semantic index for {len(self.nodes)} nodes...")
-
-        if not self.nodes:
-            print("No nodes to index")
-            self.node_embeddings = np.array([])
-            return 0
-
-        try:
-            self.node_embeddings = self.model.encode(
-                self.nodes,
-                show_progress_bar=False,
-                convert_to_numpy=True
-            )
-
-            print(f"Semantic index built with {len(self.nodes)} nodes")
-            return len(self.nodes)
-
-        except Exception as e:
-            print(f"Error building semantic index: {e}")
-            self.node_embeddings = None
-            return 0
-
-    def search_nodes(self, query, top_k=5, min_score=0.3):
-        """Search for most similar nodes"""
-        if (self.model is None or
-            self.nodes is None or
-            self.node_embeddings is None or
-            len(self.node_embeddings) == 0):
-            return []
-
-        if not query or not query.strip():
-            return []
-
-        try:
-            query_embedding = self.model.encode([query.strip()])
-            similarities = cosine_similarity(query_embedding, self.node_embeddings)[0]
-            top_indices = np.argsort(similarities)[::-1][:top_k]
-
-            results = []
-            for idx in top_indices:
-                score = similarities[idx]
-                if score >= min_score:
-                    node_name = self.nodes[idx]
-                    degree = self.graph.degree(node_name) if self.graph and node_name in self.graph else 0
-
-                    results.append({
-                        'node': node_name,
-                        'score': float(score),
-                        'degree': degree,
-                        'rank': len(results) + 1
-                    })
-
-            return results
-
-        except Exception as e:
-            print(f"Search error: {e}")
-            return []
-
-    def search_to_subgraph(self, query, top_k=3, radius=1):
-        """Generate subgraph from search results"""
-        top_nodes = self.search_nodes(query, top_k, min_score=0.1)
-
-        if not top_nodes or not self.graph:
-            return None, []
-
-        node_names = [result['node'] for result in top_nodes]
-
-        subgraphs = []
-        for node in node_names:
-            if node in self.graph:
-                try:
-                    ego_graph = nx.ego_graph(self.graph, node, radius=radius, undirected=True)
-                    subgraphs.append(ego_graph)
-                except:
-                    continue
-
-        if subgraphs:
-            union_subgraph = nx.compose_all(subgraphs)
-            return union_subgraph, top_nodes
-        else:
-            return None, top_nodes
-
-search_engine = SemanticSearchEngine()
-
 # ===============================================================
 # Utility Functions
 # ===============================================================
@@ -305,6 +198,7 @@ def save_triples_to_kb(triples):
     cursor = conn.cursor()
     
     saved_count = 0
+    inserted = []
     for triple in triples:
         try:
             if isinstance(triple, dict) and "entity1" in triple and "relation" in triple and "entity2" in triple:
@@ -321,6 +215,7 @@ def save_triples_to_kb(triples):
                         "INSERT INTO triples (entity1, relation, entity2) VALUES (?, ?, ?)",
                         (e1, rel, e2)
                     )
+                    inserted.append((cursor.lastrowid, e1, rel, e2))
                     saved_count += 1
         except Exception as e:
             print(f"Error saving triple to KB: {e}")
@@ -328,6 +223,7 @@ def save_triples_to_kb(triples):
     
     conn.commit()
     conn.close()
+    kb_graph.apply(added=inserted)
     print(f"Saved {saved_count} new triples to knowledge base")
     return saved_count
 
@@ -362,6 +258,42 @@ def init_feedback_file():
 init_kb_database()
 init_feedback_file()
 
+# ===============================================================
+# Knowledge Base Graph
+# ===============================================================
+
+search_registry = SearchEngineRegistry()
+
+kb_graph = KnowledgeBaseGraph()
+triple_store = TripleStore(kb_graph)
+kb_graph.add_listener(triple_store.on_kb_change)
+
+def _sync_search_engine(change):
+    """Keep the resident KB semantic index current"""
+    engine = search_registry.get(KB_INDEX_KEY)
+    try:
+        if engine is not None and engine.graph is kb_graph.graph:
+            engine.apply_graph_change(change)
+    finally:
+        search_registry.release(engine)
+
+def request_engine(engine):
+    """Keep an engine handed out by search_registry held until the request ends"""
+    if engine is not None:
+        g.setdefault("search_engines", []).append(engine)
+    return engine
+
+def active_search_engine(user_id):
+    """The user's active index, held for the rest of the request"""
+    return request_engine(search_registry.active_engine(user_id))
+
+@app.teardown_request
+def release_search_engines(error=None):
+    for engine in g.pop("search_engines", []):
+        search_registry.release(engine)
+
+kb_graph.add_listener(_sync_search_engine)
+
 # ===============================================================
 # Core API Routes
 # ===============================================================
@@ -495,13 +427,15 @@ def list_datasets(current_user):
     user_folder = os.path.join(UPLOAD_FOLDER, str(current_user.id))
     if not os.path.exists(user_folder):
         return jsonify({"datasets": []})
-    return jsonify({"datasets": os.listdir(user_folder)})
+    return jsonify({"datasets": [f for f in os.listdir(user_folder) if is_dataset_file(user_folder, f)]})
 
 @app.route("/datasets/<filename>", methods=["DELETE"])
 @token_required
 def delete_dataset(current_user, filename):
     user_folder = os.path.join(UPLOAD_FOLDER, str(current_user.id))
     filepath = os.path.join(user_folder, filename)
+    if os.path.exists(filepath) and not is_dataset_file(user_folder, filename):
+        return jsonify({"error": f"{filename} is not a dataset file"}), 400
     if os.path.exists(filepath):
         os.remove(filepath)
         return jsonify({"message": f"{filename} deleted"})
@@ -672,6 +606,9 @@ def enhanced_csv_triple_extraction(df, filename):
 
     return triples
 
+GRAPH_VIEW_CACHE_SIZE = 32
+_graph_view_cache = {}
+
 @app.route("/datasets/extract/<filename>", methods=["POST"])
 @token_required
 def extract_triples(current_user, filename):
@@ -744,7 +681,7 @@ def extract_triples(current_user, filename):
     G = nx.DiGraph()
     for t in clean_triples:
         e1, rel, e2 = t["entity1"], t["relation"], t["entity2"]
-        G.add_edge(e1, e2, label=rel, relation=rel, source=t.get("source", "extraction"))
+        G.add_edge(e1, e2, label=rel, relation=rel, source=t.get("source", "extraction"), dataset=filename)
 
     base_name = os.path.splitext(filename)[0]
     graph_filename = f"{base_name}_graph.gpickle"
@@ -768,11 +705,27 @@ def extract_triples(current_user, filename):
             print(f"Error saving JSON graph: {json_error}")
             graph_saved = False
 
+    graph_version = None
+    graph_delta = {"added": 0, "removed": 0}
+    try:
+        graph_version, delta = GraphVersionStore(user_folder, base_name).commit(G)
+        graph_delta = {"added": len(delta["added"]), "removed": len(delta["removed"])}
+    except Exception as e:
+        print(f"Error recording graph version: {e}")
+
     search_loaded = False
     search_nodes = 0
     if graph_saved:
         try:
-            node_count = search_engine.build_index(G)
+            # A resident index for this file is synced with the new graph instead of rebuilt
+            engine = request_engine(search_registry.load(
+                current_user.id,
+                SearchEngineRegistry.graph_key(current_user.id, graph_path),
+                lambda: load_graph_file(graph_path),
+                index_path=graph_path,
+                graph=G
+            ))
+            node_count = engine.node_count
             search_loaded = True
             search_nodes = node_count
             print(f"Graph auto-loaded into search: {node_count} nodes")
@@ -788,7 +741,9 @@ def extract_triples(current_user, filename):
         "graph_file": graph_filename,
         "search_loaded": search_loaded,
         "search_nodes": search_nodes,
-        "kb_saved": kb_saved
+        "kb_saved": kb_saved,
+        "graph_version": graph_version,
+        "graph_delta": graph_delta
     }
 
     if G.number_of_nodes() > 0:
@@ -803,6 +758,148 @@ def extract_triples(current_user, filename):
         "graph_stats": stats
     }), 200
 
+@app.route("/graph/view", methods=["GET"])
+@token_required
+def graph_view(current_user):
+    """Budgeted, pre-laid-out sample of a saved graph (or the loaded search graph) for rendering"""
+    graph_name = request.args.get("graph", "").strip()
+    strategy = request.args.get("strategy", "degree")
+    max_nodes = max(1, min(request.args.get("max_nodes", 150, type=int), 1000))
+    max_edges = max(0, min(request.args.get("max_edges", 300, type=int), 3000))
+
+    if strategy not in GRAPH_VIEW_STRATEGIES:
+        return jsonify({"error": f"strategy must be one of {', '.join(GRAPH_VIEW_STRATEGIES)}"}), 400
+
+    try:
+        if graph_name:
+            graph_path = os.path.join(UPLOAD_FOLDER, str(current_user.id), secure_filename(graph_name))
+            if not os.path.exists(graph_path):
+                return jsonify({"error": "Graph file not found"}), 404
+            source_key = (graph_path, os.path.getmtime(graph_path))
+        else:
+            engine = active_search_engine(current_user.id)
+            if engine is None or engine.graph is None:
+                return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+            source_key = ("search", engine.version)
+
+        cache_key = source_key + (strategy, max_nodes, max_edges)
+        view = _graph_view_cache.get(cache_key)
+
+        if view is None:
+            if graph_name:
+                view = sample_graph_view(load_graph_file(graph_path), max_nodes, max_edges, strategy)
+            else:
+                with engine.graph_lock:
+                    view = sample_graph_view(engine.graph, max_nodes, max_edges, strategy)
+            if len(_graph_view_cache) >= GRAPH_VIEW_CACHE_SIZE:
+                _graph_view_cache.pop(next(iter(_graph_view_cache)))
+            _graph_view_cache[cache_key] = view
+
+        return jsonify(view)
+    except Exception as e:
+        return jsonify({"error": f"Graph view failed: {str(e)}"}), 500
+
+@app.route("/graphs/<base_name>/versions", methods=["GET"])
+@token_required
+def list_graph_versions(current_user, base_name):
+    """List stored snapshot versions of an extracted graph"""
+    user_folder = os.path.join(UPLOAD_FOLDER, str(current_user.id))
+    store = GraphVersionStore(user_folder, secure_filename(base_name))
+    versions = store.versions()
+    if not versions:
+        return jsonify({"error": "No versions found"}), 404
+    return jsonify({"graph": base_name, "versions": versions, "latest": len(versions)})
+
+@app.route("/graphs/<base_name>/versions/<int:version>", methods=["GET"])
+@token_required
+def get_graph_version(current_user, base_name, version):
+    """Materialize one version of an extracted graph"""
+    try:
+        user_folder = os.path.join(UPLOAD_FOLDER, str(current_user.id))
+        store = GraphVersionStore(user_folder, secure_filename(base_name))
+        triples = store.materialize(version)
+        if triples is None:
+            return jsonify({"error": "Version not found"}), 404
+
+        G = GraphVersionStore.triples_to_graph(triples)
+        return jsonify({
+            "graph": base_name,
+            "version": version,
+            "node_count": G.number_of_nodes(),
+            "edge_count": G.number_of_edges(),
+            "graph_data": nx.node_link_data(G)
+        })
+    except Exception as e:
+        return jsonify({"error": f"Failed to materialize version: {str(e)}"}), 500
+
+@app.route("/graphs/<base_name>/diff", methods=["GET"])
+@token_required
+def diff_graph_versions(current_user, base_name):
+    """Edge-level diff between two versions of an extracted graph"""
+    from_version = request.args.get("from", type=int)
+    to_version = request.args.get("to", type=int)
+    if from_version is None or to_version is None:
+        return jsonify({"error": "from and to versions required"}), 400
+
+    try:
+        user_folder = os.path.join(UPLOAD_FOLDER, str(current_user.id))
+        delta = GraphVersionStore(user_folder, secure_filename(base_name)).diff(from_version, to_version)
+        if delta is None:
+            return jsonify({"error": "Version not found"}), 404
+
+        return jsonify({
+            "graph": base_name,
+            "from": from_version,
+            "to": to_version,
+            "added": [{"entity1": e1, "relation": rel, "entity2": e2, "attributes": json.loads(attributes)}
+                      for e1, rel, e2, attributes in delta["added"]],
+            "removed": [{"entity1": e1, "relation": rel, "entity2": e2, "attributes": json.loads(attributes)}
+                        for e1, rel, e2, attributes in delta["removed"]]
+        })
+    except Exception as e:
+        return jsonify({"error": f"Diff failed: {str(e)}"}), 500
+
+@app.route("/graphs/<base_name>/versions/<int:version>/restore", methods=["POST"])
+@token_required
+def restore_graph_version(current_user, base_name, version):
+    """Make an old version current again (recorded as a new version)"""
+    try:
+        base_name = secure_filename(base_name)
+        user_folder = os.path.join(UPLOAD_FOLDER, str(current_user.id))
+        store = GraphVersionStore(user_folder, base_name)
+        triples = store.materialize(version)
+        if triples is None:
+            return jsonify({"error": "Version not found"}), 404
+
+        G = GraphVersionStore.triples_to_graph(triples)
+        # Overwrite whichever graph file extraction saved, so a later load picks up the restore
+        graph_filename = f"{base_name}_graph.gpickle"
+        graph_path = os.path.join(user_folder, graph_filename)
+        if os.path.exists(graph_path):
+            with open(graph_path, 'wb') as f:
+                pickle.dump(G, f)
+        else:
+            graph_filename = f"{base_name}_graph.json"
+            graph_path = os.path.join(user_folder, graph_filename)
+            with open(graph_path, 'w') as f:
+                json.dump(nx.node_link_data(G), f)
+        new_version, delta = store.commit(G)
+
+        # A resident index of this graph is synced rather than left on the replaced graph
+        engine = request_engine(search_registry.get(SearchEngineRegistry.graph_key(current_user.id, graph_path)))
+        if engine is not None:
+            engine.sync_graph(G)
+
+        return jsonify({
+            "message": f"Restored version {version} of {base_name} as version {new_version}",
+            "version": new_version,
+            "graph_file": graph_filename,
+            "added": len(delta["added"]),
+            "removed": len(delta["removed"])
+        })
+    except Exception as e:
+        return jsonify({"error": f"Restore failed: {str(e)}"}), 500
+
 # ===============================================================
 # Semantic Search Routes
 # ===============================================================
@@ -818,12 +915,20 @@ def semantic_status(current_user):
         if os.path.exists(user_folder):
             graph_files = [f for f in os.listdir(user_folder) if f.endswith('.gpickle') or f.endswith('_graph.json')]
 
+        engine = active_search_engine(current_user.id)
+        graph = engine.graph if engine is not None else None
+
         return jsonify({
             "graph_available": len(graph_files) > 0,
             "graph_files": graph_files,
-            "search_ready": search_engine.graph is not None and search_engine.graph.number_of_nodes() > 0,
-            "search_nodes": search_engine.graph.number_of_nodes() if search_engine.graph else 0,
-            "search_engine_ready": search_engine.model is not None
+            "search_ready": graph is not None and graph.number_of_nodes() > 0,
+            "search_nodes": graph.number_of_nodes() if graph is not None else 0,
+            "search_engine_ready": search_registry.model is not None,
+            "ann_index": engine.ann_index.name if engine is not None and engine.ann_index is not None else "exact",
+            "kb_graph_nodes": kb_graph.graph.number_of_nodes() if kb_graph.graph is not None else 0,
+            "kb_graph_loaded": graph is not None and graph is kb_graph.graph,
+            "active_index": search_registry.active.get(current_user.id),
+            "index_build": engine.build_stats if engine is not None else None
         })
     except Exception as e:
         return jsonify({"error": f"Status check failed: {str(e)}"}), 500
@@ -855,26 +960,56 @@ def load_semantic_graph(current_user):
         graph_files_with_mtime.sort(key=lambda x: x[2], reverse=True)
         latest_file, latest_path, mtime = graph_files_with_mtime[0]
 
-        print(f"Loading graph: {latest_file}")
+        requested = (request.get_json(silent=True) or {}).get("graph_file")
+        if requested:
+            latest_file = secure_filename(requested)
+            latest_path = os.path.join(user_folder, latest_file)
+            if not os.path.exists(latest_path):
+                return jsonify({"error": "Graph file not found"}), 404
 
-        if latest_file.endswith('.gpickle'):
-            G = nx.read_gpickle(latest_path)
-        else:
-            with open(latest_path, 'r') as f:
-                graph_data = json.load(f)
-            G = nx.node_link_graph(graph_data)
+        print(f"Loading graph: {latest_file}")
 
-        node_count = search_engine.build_index(G)
+        engine = request_engine(search_registry.load(
+            current_user.id,
+            SearchEngineRegistry.graph_key(current_user.id, latest_path),
+            lambda: load_graph_file(latest_path),
+            index_path=latest_path,
+            graph=load_graph_file(latest_path)
+        ))
+        node_count = engine.node_count
 
         return jsonify({
             "message": f"Graph '{latest_file}' loaded successfully with {node_count} nodes",
             "nodes_loaded": node_count,
-            "graph_file": latest_file
+            "graph_file": latest_file,
+            "index_build": engine.build_stats
         })
 
     except Exception as e:
         return jsonify({"error": f"Failed to load graph: {str(e)}"}), 500
 
+@app.route("/semantic/load_kb", methods=["POST"])
+@token_required
+def load_kb_graph(current_user):
+    """Load the merged knowledge base graph into semantic search"""
+    try:
+        engine = request_engine(search_registry.load(current_user.id, KB_INDEX_KEY, kb_graph.get_graph,
+                                                     graph_lock=kb_graph.lock))
+        node_count = engine.node_count
+        with kb_graph.lock:
+            edge_count = engine.graph.number_of_edges()
+            version = kb_graph.version
+
+        return jsonify({
+            "message": f"Knowledge base graph loaded successfully with {node_count} nodes",
+            "nodes_loaded": node_count,
+            "edges": edge_count,
+            "graph_version": version
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Failed to load knowledge base graph: {str(e)}"}), 500
+
 @app.route("/semantic/search", methods=["POST"])
 @token_required
 def semantic_search(current_user):
@@ -884,28 +1019,200 @@ def semantic_search(current_user):
         return jsonify({"error": "Query required"}), 400
 
     query = data["query"].strip()
-    top_k = data.get("top_k", 5)
+    mode = data.get("mode", "hybrid")
+    target = data.get("target", "nodes")
 
     if not query:
         return jsonify({"error": "Query cannot be empty"}), 400
 
-    if search_engine.graph is None:
+    limits, error = parse_search_limits(data.get("top_k", 5), data.get("min_score", 0.3))
+    if error:
+        return jsonify({"error": error}), 400
+    top_k, min_score = limits
+
+    ann_effort, error = parse_ann_effort(data.get("ann_effort"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+
+    if target not in SEARCH_TARGETS:
+        return jsonify({"error": f"target must be one of {', '.join(SEARCH_TARGETS)}"}), 400
+
+    filters, error = parse_search_filters(data.get("filters"))
+    if error:
+        return jsonify({"error": error}), 400
+    if filters and target == "triples":
+        return jsonify({"error": "filters apply to node search only"}), 400
+
+    ranking = data.get("rank_by", "similarity")
+    if ranking not in RANKINGS:
+        return jsonify({"error": f"rank_by must be one of {', '.join(RANKINGS)}"}), 400
+
+    engine = active_search_engine(current_user.id)
+    if engine is None or engine.graph is None:
         return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
 
-    if search_engine.model is None:
+    if engine.model is None:
         return jsonify({"error": "Semantic search model not loaded"}), 400
 
     try:
-        results = search_engine.search_nodes(query, top_k)
+        mode_used = engine.mode_used(mode)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if target == "triples":
+            results = engine.search_triples(query, top_k, min_score, effort=ann_effort, mode=mode)
+        else:
+            results = engine.search_nodes(query, top_k, min_score, effort=ann_effort, mode=mode, filters=filters,
+                                          ranking=ranking)
 
         return jsonify({
             "query": query,
+            "mode": mode,
+            "mode_used": mode_used,
+            "target": target,
             "results": results,
             "total_found": len(results)
         })
     except Exception as e:
         return jsonify({"error": f"Search failed: {str(e)}"}), 500
 
+@app.route("/semantic/search/range", methods=["POST"])
+@token_required
+def semantic_search_range(current_user):
+    """All nodes with semantic similarity >= min_score, best first, paged with offset/limit"""
+    data = request.get_json()
+    if not data or "query" not in data or "min_score" not in data:
+        return jsonify({"error": "query and min_score required"}), 400
+
+    query = str(data["query"]).strip()
+    if not query:
+        return jsonify({"error": "Query cannot be empty"}), 400
+
+    try:
+        min_score = float(data["min_score"])
+        limit = int(data.get("limit", RANGE_PAGE_SIZE))
+        offset = int(data.get("offset", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "min_score, limit and offset must be numbers"}), 400
+    if not -1.0 <= min_score <= 1.0:
+        return jsonify({"error": "min_score must be between -1 and 1"}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({"error": "limit must be positive and offset non-negative"}), 400
+
+    filters, error = parse_search_filters(data.get("filters"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    engine = active_search_engine(current_user.id)
+    if engine is None or engine.graph is None:
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    if engine.model is None:
+        return jsonify({"error": "Semantic search model not loaded"}), 400
+
+    try:
+        page = engine.search_range(query, min_score, limit, offset, filters)
+        next_offset = offset + len(page["results"])
+        return jsonify({
+            "query": query,
+            "min_score": min_score,
+            "results": page["results"],
+            "total_found": page["total"],
+            "truncated": page["truncated"],
+            "offset": offset,
+            "limit": limit,
+            "next_offset": next_offset if next_offset < page["total"] else None
+        })
+    except Exception as e:
+        return jsonify({"error": f"Range search failed: {str(e)}"}), 500
+
+@app.route("/semantic/search/batch", methods=["POST"])
+@token_required
+def semantic_search_batch(current_user):
+    """Run many semantic searches in one request (one encoder pass, one scoring pass)"""
+    data = request.get_json()
+    if not data or not isinstance(data.get("queries"), list) or not data["queries"]:
+        return jsonify({"error": "A non-empty list of queries is required"}), 400
+
+    if len(data["queries"]) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+    defaults, error = parse_search_limits(data.get("top_k", 5), data.get("min_score", 0.3))
+    if error:
+        return jsonify({"error": error}), 400
+    default_top_k, default_min_score = defaults
+    ann_effort, error = parse_ann_effort(data.get("ann_effort"))
+    if error:
+        return jsonify({"error": error}), 400
+    mode = data.get("mode", "hybrid")
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    target = data.get("target", "nodes")
+    if target not in SEARCH_TARGETS:
+        return jsonify({"error": f"target must be one of {', '.join(SEARCH_TARGETS)}"}), 400
+    filters, error = parse_search_filters(data.get("filters"))
+    if error:
+        return jsonify({"error": error}), 400
+    if filters and target == "triples":
+        return jsonify({"error": "filters apply to node search only"}), 400
+    ranking = data.get("rank_by", "similarity")
+    if ranking not in RANKINGS:
+        return jsonify({"error": f"rank_by must be one of {', '.join(RANKINGS)}"}), 400
+
+    searches = []
+    for position, item in enumerate(data["queries"]):
+        if isinstance(item, str):
+            searches.append((item, default_top_k, default_min_score))
+        elif isinstance(item, dict) and isinstance(item.get("query"), str):
+            limits, error = parse_search_limits(item.get("top_k", default_top_k),
+                                                item.get("min_score", default_min_score))
+            if error:
+                return jsonify({"error": f"queries[{position}]: {error}"}), 400
+            searches.append((item["query"],) + limits)
+        else:
+            return jsonify({"error": "Each query must be a string or an object with a query field"}), 400
+
+    engine = active_search_engine(current_user.id)
+    if engine is None or engine.graph is None:
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    if engine.model is None:
+        return jsonify({"error": "Semantic search model not loaded"}), 400
+
+    try:
+        mode_used = engine.mode_used(mode)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        start = time.perf_counter()
+        if target == "triples":
+            batch_results = engine.search_triples_batch(searches, effort=ann_effort, mode=mode)
+        else:
+            batch_results = engine.search_nodes_batch(searches, effort=ann_effort, mode=mode,
+                                                      filters=filters, ranking=ranking)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        return jsonify({
+            "results": [
+                {
+                    "query": query.strip(),
+                    "results": results,
+                    "total_found": len(results)
+                }
+                for (query, _, _), results in zip(searches, batch_results)
+            ],
+            "mode_used": mode_used,
+            "count": len(searches),
+            "elapsed_ms": round(elapsed_ms, 3)
+        })
+    except Exception as e:
+        return jsonify({"error": f"Batch search failed: {str(e)}"}), 500
+
 @app.route("/semantic/subgraph", methods=["POST"])
 @token_required
 def semantic_subgraph(current_user):
@@ -917,15 +1224,26 @@ def semantic_subgraph(current_user):
     query = data["query"].strip()
     top_k = data.get("top_k", 3)
     radius = data.get("radius", 1)
+    collapse = bool(data.get("collapse", False))
+    expand, error = parse_community_ids(data.get("expand"))
 
     if not query:
         return jsonify({"error": "Query cannot be empty"}), 400
+    if error:
+        return jsonify({"error": error}), 400
 
-    if search_engine.graph is None:
+    engine = active_search_engine(current_user.id)
+    if engine is None or engine.graph is None:
         return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
 
     try:
-        subgraph, top_nodes = search_engine.search_to_subgraph(query, top_k, radius)
+        # Serialized responses are cached per graph version; any graph or index change bumps it
+        cache_key = (engine.version, normalize_text(query), top_k, radius, collapse, expand)
+        payload = engine.subgraph_cache.get(cache_key)
+        if payload is not None:
+            return app.response_class(payload, mimetype="application/json")
+
+        subgraph, top_nodes = engine.search_to_subgraph(query, top_k, radius)
 
         response_data = {
             "query": query,
@@ -933,7 +1251,10 @@ def semantic_subgraph(current_user):
         }
 
         if subgraph is not None:
-            subgraph_data = nx.node_link_data(subgraph)
+            if collapse:
+                subgraph_data = engine.get_communities().summarize(subgraph, expand=expand)
+            else:
+                subgraph_data = nx.node_link_data(subgraph)
             response_data.update({
                 "subgraph": subgraph_data,
                 "node_count": subgraph.number_of_nodes(),
@@ -948,10 +1269,174 @@ def semantic_subgraph(current_user):
                 "subgraph_generated": False
             })
 
-        return jsonify(response_data)
+        payload = app.json.dumps(response_data)
+        engine.subgraph_cache.put(cache_key, payload)
+        return app.response_class(payload, mimetype="application/json")
     except Exception as e:
         return jsonify({"error": f"Subgraph generation failed: {str(e)}"}), 500
 
+@app.route("/semantic/indexes", methods=["GET"])
+@token_required
+@admin_required
+def semantic_indexes(current_user):
+    """Resident semantic indexes and their memory use"""
+    return jsonify(search_registry.stats())
+
+@app.route("/semantic/index/triples", methods=["POST"])
+@token_required
+def semantic_index_triples(current_user):
+    """Build (or sync) the edge index of the active graph ahead of the first triple search"""
+    engine = active_search_engine(current_user.id)
+    if engine is None or engine.graph is None:
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    try:
+        start = time.perf_counter()
+        index = engine.get_triple_index()
+        if index is None:
+            return jsonify({"error": "Semantic search model not loaded"}), 400
+        with engine.graph_lock:
+            edge_count = engine.graph.number_of_edges()
+        return jsonify({
+            "success": True,
+            "triples": engine.triple_count,
+            "edges": edge_count,
+            "build_time_ms": round((time.perf_counter() - start) * 1000, 2)
+        })
+    except Exception as e:
+        return jsonify({"error": f"Failed to build triple index: {str(e)}"}), 500
+
+@app.route("/semantic/index/report", methods=["GET"])
+@token_required
+def semantic_index_report(current_user):
+    """Memory use and recall impact of the active index's embedding precision"""
+    engine = active_search_engine(current_user.id)
+    if engine is None or not engine.is_ready():
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    try:
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+
+    try:
+        report = engine.precision_report(k=k)
+        if "error" in report:
+            return jsonify(report), 400
+        return jsonify(report)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Report failed: {str(e)}"}), 500
+
+@app.route("/semantic/index/benchmark", methods=["GET"])
+@token_required
+def semantic_index_benchmark(current_user):
+    """Recall vs latency vs memory of reduced-dimension embeddings on the active graph"""
+    engine = active_search_engine(current_user.id)
+    if engine is None or not engine.is_ready():
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    try:
+        dims = [int(d) for d in request.args.get("dims", "256,128,64").split(",") if d.strip()]
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        return jsonify({"error": "dims must be a comma-separated list of integers and k an integer"}), 400
+
+    try:
+        return jsonify(engine.reduction_benchmark(dims=dims, k=k))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Benchmark failed: {str(e)}"}), 500
+
+@app.route("/semantic/similar", methods=["GET"])
+@token_required
+def semantic_similar(current_user):
+    """Entities most similar to a node of the active graph (precomputed kNN graph)"""
+    node = request.args.get("node", "").strip()
+    top_k = request.args.get("top_k", KNN_K, type=int)
+    if not node:
+        return jsonify({"error": "node parameter required"}), 400
+
+    engine = active_search_engine(current_user.id)
+    if engine is None or not engine.is_ready():
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    try:
+        results, source = engine.similar_nodes(node, max(1, top_k))
+        if results is None:
+            return jsonify({"error": f"Node '{node}' not found in the loaded graph"}), 404
+        return jsonify({
+            "node": node,
+            "results": results,
+            "total_found": len(results),
+            "source": source
+        })
+    except Exception as e:
+        return jsonify({"error": f"Similarity lookup failed: {str(e)}"}), 500
+
+@app.route("/semantic/communities", methods=["GET"])
+@token_required
+def semantic_communities(current_user):
+    """Collapsed community overview of the loaded graph"""
+    engine = active_search_engine(current_user.id)
+    if engine is None or engine.graph is None:
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    expand, error = parse_community_ids(request.args.getlist("expand"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        communities = engine.get_communities()
+        with engine.graph_lock:
+            summary = communities.summarize(engine.graph, expand=expand)
+
+        return jsonify({
+            "method": communities.method,
+            "community_count": len(communities.members),
+            "communities": communities.overview(limit=request.args.get("limit", 50, type=int)),
+            "graph": summary,
+            "graph_version": engine.version
+        })
+    except Exception as e:
+        return jsonify({"error": f"Community detection failed: {str(e)}"}), 500
+
+@app.route("/semantic/communities/<int:community_id>", methods=["GET"])
+@token_required
+def semantic_community_detail(current_user, community_id):
+    """Expand one community into its member nodes and internal edges"""
+    engine = active_search_engine(current_user.id)
+    if engine is None or engine.graph is None:
+        return jsonify({"error": "No graph loaded. Please load a graph first."}), 400
+
+    max_nodes = request.args.get("max_nodes", 200, type=int)
+    if max_nodes < 1:
+        return jsonify({"error": "max_nodes must be a positive integer"}), 400
+
+    try:
+        communities = engine.get_communities()
+        if community_id < 0 or community_id >= len(communities.members):
+            return jsonify({"error": "Community not found"}), 404
+
+        members = communities.members[community_id]
+        with engine.graph_lock:
+            community_graph = engine.graph.subgraph(members[:max_nodes])
+            subgraph = nx.node_link_data(community_graph)
+            edge_count = community_graph.number_of_edges()
+
+        return jsonify({
+            "community": community_id,
+            "size": len(members),
+            "truncated": len(members) > max_nodes,
+            "subgraph": subgraph,
+            "node_count": len(subgraph["nodes"]),
+            "edge_count": edge_count
+        })
+    except Exception as e:
+        return jsonify({"error": f"Community expansion failed: {str(e)}"}), 500
+
 # ===============================================================
 # MILESTONE 4: Admin Dashboard & Feedback System (SECURED)
 # ===============================================================
@@ -1111,7 +1596,9 @@ def add_triple(current_user):
             (entity1, relation, entity2)
         )
         conn.commit()
+        triple_id = cursor.lastrowid
         conn.close()
+        kb_graph.add_triple(triple_id, entity1, relation, entity2)
         return redirect('/admin/kb')
     
     return render_template('add_triple.html')
@@ -1133,8 +1620,11 @@ def edit_triple(current_user, id):
             "UPDATE triples SET entity1=?, relation=?, entity2=? WHERE id=?",
             (entity1, relation, entity2, id)
         )
+        updated = cursor.rowcount
         conn.commit()
         conn.close()
+        if updated:
+            kb_graph.update_triple(id, entity1, relation, entity2)
         return redirect('/admin/kb')
     
     cursor.execute("SELECT * FROM triples WHERE id=?", (id,))
@@ -1156,6 +1646,7 @@ def delete_triple(current_user, id):
     cursor.execute("DELETE FROM triples WHERE id=?", (id,))
     conn.commit()
     conn.close()
+    kb_graph.remove_triple(id)
     return redirect('/admin/kb')
 
 @app.route("/admin/feedback")
@@ -1336,6 +1827,7 @@ def api_add_triple(current_user):
         conn.commit()
         triple_id = cursor.lastrowid
         conn.close()
+        kb_graph.add_triple(triple_id, entity1, relation, entity2)
 
         return jsonify({
             "message": "Triple added successfully",
@@ -1369,6 +1861,7 @@ def api_delete_triple(current_user, triple_id):
         cursor.execute("DELETE FROM triples WHERE id=?", (triple_id,))
         conn.commit()
         conn.close()
+        kb_graph.remove_triple(triple_id)
 
         return jsonify({"message": f"Triple {triple_id} deleted successfully"}), 200
 
@@ -1408,6 +1901,7 @@ def api_update_triple(current_user, triple_id):
         )
         conn.commit()
         conn.close()
+        kb_graph.update_triple(triple_id, entity1, relation, entity2)
 
         return jsonify({
             "message": f"Triple {triple_id} updated successfully",
@@ -1463,6 +1957,49 @@ def api_search_triples(current_user):
 
     except Exception as e:
         return jsonify({"error": f"Search failed: {str(e)}"}), 500
+
+@app.route("/api/kb/query", methods=["POST"])
+@token_required
+@admin_required
+def api_query_triples(current_user):
+    """Pattern query over the KB: constants, "?var" variables and "*" wildcards, joined across patterns"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get("patterns"), list) or not data["patterns"]:
+            return jsonify({"error": "A non-empty list of patterns is required"}), 400
+
+        patterns = []
+        for pattern in data["patterns"]:
+            if not isinstance(pattern, dict):
+                return jsonify({"error": "Each pattern must be an object with entity1, relation and entity2"}), 400
+            patterns.append(tuple(
+                str(pattern[key]).strip() if pattern.get(key) is not None else None
+                for key in ("entity1", "relation", "entity2")
+            ))
+
+        limit = max(1, min(int(data.get("limit", 1000)), 10000))
+
+        triple_store.ensure_loaded()
+        start = time.perf_counter()
+        has_variables = any(term and term.startswith("?") for pattern in patterns for term in pattern)
+        if len(patterns) == 1 and not has_variables:
+            results = triple_store.match_terms(*patterns[0], limit=limit)
+        else:
+            results = triple_store.query(patterns, limit=limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        return jsonify({
+            "patterns": data["patterns"],
+            "results": results,
+            "count": len(results),
+            "elapsed_ms": round(elapsed_ms, 3)
+        })
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Query failed: {str(e)}"}), 500
+
 # ===============================================================
 # Application Startup
 # ===============================================================
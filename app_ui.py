@@ -754,38 +754,52 @@ elif st.session_state.current_page == "🔗 Extract Knowledge Graph":
                                     directed=True
                                 )
 
-                                # Limit for performance
-                                display_triples = triples[:100]
-
-                                # Add nodes and edges
-                                all_nodes = set()
-                                for t in display_triples:
-                                    e1, rel, e2 = t["entity1"], t["relation"], t["entity2"]
-                                    all_nodes.add(e1)
-                                    all_nodes.add(e2)
-
-                                # Add nodes with sizing based on degree
-                                node_degrees = {}
-                                for t in display_triples:
-                                    e1, e2 = t["entity1"], t["entity2"]
-                                    node_degrees[e1] = node_degrees.get(e1, 0) + 1
-                                    node_degrees[e2] = node_degrees.get(e2, 0) + 1
-
-                                for node in all_nodes:
-                                    degree = node_degrees.get(node, 1)
-                                    size = max(20, min(50, degree * 5))
-                                    net.add_node(
-                                        node,
-                                        label=node[:25],
-                                        size=size,
-                                        color="#4B4DED",
-                                        title=f"{node}\nConnections: {degree}"
-                                    )
+                                # Ask the API for a representative, pre-laid-out sample of the graph
+                                graph_file = stats.get("graph_file", "")
+                                view_data, view_status = make_request(
+                                    f"graph/view?graph={graph_file}&strategy=degree&max_nodes=150&max_edges=300"
+                                )
 
-                                # Add edges
-                                for t in display_triples:
-                                    e1, rel, e2 = t["entity1"], t["relation"], t["entity2"]
-                                    net.add_edge(e1, e2, label=rel[:20], color="#666666", title=rel)
+                                if view_status == 200:
+                                    st.caption(
+                                        f"Showing {view_data.get('sampled_nodes', 0)} of {view_data.get('total_nodes', 0)} nodes "
+                                        f"and {view_data.get('sampled_edges', 0)} of {view_data.get('total_edges', 0)} edges"
+                                    )
+                                    for node in view_data.get("nodes", []):
+                                        degree = node.get("degree", 1)
+                                        net.add_node(
+                                            node["id"],
+                                            label=node["id"][:25],
+                                            size=max(20, min(50, degree * 5)),
+                                            color="#4B4DED",
+                                            title=f"{node['id']}\nConnections: {degree}",
+                                            x=node["x"],
+                                            y=node["y"],
+                                            physics=False
+                                        )
+                                    for edge in view_data.get("edges", []):
+                                        net.add_edge(edge["source"], edge["target"], label=edge["relation"][:20],
+                                                     color="#666666", title=edge["relation"])
+                                else:
+                                    # Fall back to drawing a prefix of the extracted triples
+                                    display_triples = triples[:100]
+                                    node_degrees = {}
+                                    for t in display_triples:
+                                        e1, e2 = t["entity1"], t["entity2"]
+                                        node_degrees[e1] = node_degrees.get(e1, 0) + 1
+                                        node_degrees[e2] = node_degrees.get(e2, 0) + 1
+
+                                    for node, degree in node_degrees.items():
+                                        net.add_node(
+                                            node,
+                                            label=node[:25],
+                                            size=max(20, min(50, degree * 5)),
+                                            color="#4B4DED",
+                                            title=f"{node}\nConnections: {degree}"
+                                        )
+                                    for t in display_triples:
+                                        e1, rel, e2 = t["entity1"], t["relation"], t["entity2"]
+                                        net.add_edge(e1, e2, label=rel[:20], color="#666666", title=rel)
 
                                 # Configure physics
                                 net.set_options("""
@@ -893,7 +907,8 @@ elif st.session_state.current_page == "🔍 Semantic Search":
                 if st.button("🔄 Load Graph", type="primary", use_container_width=True):
                     with st.spinner("Loading graph into semantic search..."):
                         try:
-                            load_resp = requests.post(f"{API_URL}/semantic/load_graph", headers=headers)
+                            load_resp = requests.post(f"{API_URL}/semantic/load_graph",
+                                                      json={"graph_file": selected_graph}, headers=headers)
                             if load_resp.status_code == 200:
                                 load_data = load_resp.json()
                                 st.success("✅ Graph loaded successfully!")
@@ -905,6 +920,20 @@ elif st.session_state.current_page == "🔍 Semantic Search":
                         except Exception as e:
                             st.error(f"❌ Load error: {e}")
 
+            if st.button("🧠 Load Entire Knowledge Base", use_container_width=True,
+                         help="Search across every triple saved to the knowledge base"):
+                with st.spinner("Loading knowledge base graph into semantic search..."):
+                    try:
+                        load_resp = requests.post(f"{API_URL}/semantic/load_kb", headers=headers)
+                        if load_resp.status_code == 200:
+                            st.success(f"✅ {load_resp.json().get('message', 'Knowledge base loaded')}")
+                            time.sleep(2)
+                            st.rerun()
+                        else:
+                            st.error(f"❌ Failed to load knowledge base: {load_resp.json().get('error', 'Unknown error')}")
+                    except Exception as e:
+                        st.error(f"❌ Load error: {e}")
+
             # Show current status
             col3, col4, col5 = st.columns(3)
 
@@ -996,8 +1025,8 @@ elif st.session_state.current_page == "🔍 Semantic Search":
         with col3:
             search_mode = st.radio(
                 "Search Mode",
-                ["🔎 Node Search", "🕸️ Subgraph Exploration"],
-                help="Search individual nodes or explore connected subgraphs"
+                ["🔎 Node Search", "🔗 Triple Search", "🕸️ Subgraph Exploration"],
+                help="Search individual nodes, relationships (entity - relation - entity), or explore connected subgraphs"
             )
 
         with col4:
@@ -1035,6 +1064,18 @@ elif st.session_state.current_page == "🔍 Semantic Search":
                                             col_b.metric("Connections", result['degree'])
                                             col_c.metric("Rank", i)
 
+                                            # Related entities come from the precomputed kNN graph (no model call)
+                                            related_resp = requests.get(
+                                                f"{API_URL}/semantic/similar",
+                                                params={"node": result['node'], "top_k": 5},
+                                                headers=headers
+                                            )
+                                            if related_resp.status_code == 200:
+                                                related = related_resp.json().get("results", [])
+                                                if related:
+                                                    st.markdown("**🔗 Related entities:** " + ", ".join(
+                                                        f"`{r['node']}` ({r['score']:.2f})" for r in related))
+
                                 else:
                                     st.info("🤷 No relevant nodes found. Try a different query.")
                             else:
@@ -1043,6 +1084,26 @@ elif st.session_state.current_page == "🔍 Semantic Search":
                         except Exception as e:
                             st.error(f"❌ Search error: {e}")
 
+                    elif search_mode == "🔗 Triple Search":
+                        search_data = {"query": search_query, "top_k": top_k, "target": "triples"}
+                        try:
+                            result_resp = requests.post(f"{API_URL}/semantic/search", json=search_data, headers=headers)
+                            if result_resp.status_code == 200:
+                                results = result_resp.json().get("results", [])
+
+                                if results:
+                                    st.success(f"🎉 Found {len(results)} relevant relationships")
+                                    for i, result in enumerate(results, 1):
+                                        st.write(f"**#{i}** `{result['entity1']}` → *{result['relation']}* → "
+                                                 f"`{result['entity2']}` - Score: {result['score']:.3f}")
+                                else:
+                                    st.info("🤷 No relevant relationships found. Try a different query.")
+                            else:
+                                error_data = result_resp.json()
+                                st.error(f"❌ Search failed: {error_data.get('error', 'Unknown error')}")
+                        except Exception as e:
+                            st.error(f"❌ Search error: {e}")
+
                     else:  # Subgraph Exploration
                         # Subgraph search
                         subgraph_data = {
@@ -0,0 +1,477 @@
+"""Knowledge base structures: the merged KB graph, its triple store and versioned extracted graphs."""
+import os, json
+import sqlite3
+import threading
+import datetime
+from collections import Counter, deque
+import networkx as nx
+
+class KnowledgeBaseGraph:
+    """Merged graph of all knowledge base triples, kept in sync with the triples table"""
+
+    def __init__(self, db_path='knowledge_base.db'):
+        self.db_path = db_path
+        self.graph = None
+        self.edges = {}
+        self.version = 0
+        self.listeners = []
+        self.lock = threading.RLock()
+        self.pending = deque()
+        self.dispatch_lock = threading.RLock()
+        self._dispatching = False
+
+    def load(self):
+        """Build the graph from the triples table (done once, then updated incrementally)"""
+        with self.lock:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, entity1, relation, entity2 FROM triples")
+            rows = cursor.fetchall()
+            conn.close()
+
+            self.graph = nx.MultiDiGraph()
+            self.edges = {}
+            for triple_id, e1, rel, e2 in rows:
+                self._add_edge(triple_id, e1, rel, e2)
+            self.version += 1
+
+        print(f"Knowledge base graph loaded: {self.graph.number_of_nodes()} nodes, {self.graph.number_of_edges()} edges")
+        return self.graph
+
+    def get_graph(self):
+        if self.graph is None:
+            self.load()
+        return self.graph
+
+    def add_listener(self, listener):
+        """
+        Register a callback receiving the change dict produced by apply(). Changes arrive one at
+        a time in version order, outside the graph lock; a listener that reads the graph itself
+        may see later edits, so it should skip changes at or below the version it has read.
+        """
+        self.listeners.append(listener)
+
+    def _dispatch(self):
+        """Deliver queued changes to the listeners, oldest first"""
+        with self.dispatch_lock:
+            if self._dispatching:
+                # A listener made an edit: the loop below delivers it once this change is done
+                return
+            self._dispatching = True
+            try:
+                while self.pending:
+                    change = self.pending.popleft()
+                    for listener in self.listeners:
+                        try:
+                            listener(change)
+                        except Exception as e:
+                            print(f"KB graph listener error: {e}")
+            finally:
+                self._dispatching = False
+
+    def _add_edge(self, triple_id, e1, rel, e2):
+        new_nodes = [n for n in (e1, e2) if n not in self.graph]
+        self.graph.add_edge(e1, e2, key=triple_id, label=rel, relation=rel, source="kb")
+        self.edges[triple_id] = (e1, rel, e2)
+        return new_nodes
+
+    def _remove_edge(self, triple_id):
+        e1, rel, e2 = self.edges.pop(triple_id)
+        if self.graph.has_edge(e1, e2, key=triple_id):
+            self.graph.remove_edge(e1, e2, key=triple_id)
+        orphaned = []
+        for node in {e1, e2}:
+            if node in self.graph and self.graph.degree(node) == 0:
+                self.graph.remove_node(node)
+                orphaned.append(node)
+        return (e1, rel, e2), orphaned
+
+    def apply(self, added=(), removed=()):
+        """Apply inserted (id, e1, rel, e2) rows and removed triple ids to the graph"""
+        with self.lock:
+            if self.graph is None:
+                # Not loaded yet: the first load() reads the committed rows anyway
+                return None
+
+            change = {"added_triples": [], "removed_triples": [], "added_nodes": [], "removed_nodes": []}
+
+            for triple_id in removed:
+                if triple_id not in self.edges:
+                    continue
+                (e1, rel, e2), orphaned = self._remove_edge(triple_id)
+                change["removed_triples"].append((triple_id, e1, rel, e2))
+                change["removed_nodes"].extend(orphaned)
+
+            for triple_id, e1, rel, e2 in added:
+                if triple_id in self.edges:
+                    continue
+                new_nodes = self._add_edge(triple_id, e1, rel, e2)
+                change["added_triples"].append((triple_id, e1, rel, e2))
+                change["added_nodes"].extend(new_nodes)
+
+            # A node removed and re-added in the same batch is simply still present
+            readded = set(change["added_nodes"]) & set(change["removed_nodes"])
+            if readded:
+                change["added_nodes"] = [n for n in change["added_nodes"] if n not in readded]
+                change["removed_nodes"] = [n for n in change["removed_nodes"] if n not in readded]
+
+            if not change["added_triples"] and not change["removed_triples"]:
+                return change
+
+            self.version += 1
+            change["version"] = self.version
+            self.pending.append(change)
+
+        self._dispatch()
+        return change
+
+    def add_triple(self, triple_id, e1, rel, e2):
+        return self.apply(added=[(triple_id, e1, rel, e2)])
+
+    def remove_triple(self, triple_id):
+        return self.apply(removed=[triple_id])
+
+    def update_triple(self, triple_id, e1, rel, e2):
+        return self.apply(added=[(triple_id, e1, rel, e2)], removed=[triple_id])
+
+class TripleStore:
+    """In-memory triple store with SPO/POS/OSP indexes over integer term ids"""
+
+    def __init__(self, kb):
+        self.kb = kb
+        self.loaded = False
+        self.version = 0
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.term_ids = {}
+        self.terms = []
+        self.rows = {}
+        self.counts = Counter()
+        self.position_counts = (Counter(), Counter(), Counter())
+        self.spo = {}
+        self.pos = {}
+        self.osp = {}
+
+    def load(self):
+        """Index every KB triple; the KB graph keeps us updated afterwards"""
+        with self.kb.lock:
+            self.kb.get_graph()
+            with self.lock:
+                self._reset()
+                for triple_id, (e1, rel, e2) in self.kb.edges.items():
+                    self._insert(triple_id, e1, rel, e2)
+                self.version = self.kb.version
+                self.loaded = True
+        print(f"Triple store loaded: {len(self.counts)} triples, {len(self.terms)} terms")
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def term_id(self, term):
+        return self.term_ids.get(term)
+
+    def _intern(self, term):
+        tid = self.term_ids.get(term)
+        if tid is None:
+            tid = len(self.terms)
+            self.term_ids[term] = tid
+            self.terms.append(term)
+        return tid
+
+    def _insert(self, triple_id, e1, rel, e2):
+        key = (self._intern(e1), self._intern(rel), self._intern(e2))
+        self.rows[triple_id] = key
+        self.counts[key] += 1
+        if self.counts[key] > 1:
+            return
+        s, p, o = key
+        self.spo.setdefault(s, {}).setdefault(p, set()).add(o)
+        self.pos.setdefault(p, {}).setdefault(o, set()).add(s)
+        self.osp.setdefault(o, {}).setdefault(s, set()).add(p)
+        for counter, term in zip(self.position_counts, key):
+            counter[term] += 1
+
+    def _delete(self, triple_id):
+        key = self.rows.pop(triple_id, None)
+        if key is None:
+            return
+        self.counts[key] -= 1
+        if self.counts[key] > 0:
+            return
+        del self.counts[key]
+        s, p, o = key
+        for index, a, b, c in ((self.spo, s, p, o), (self.pos, p, o, s), (self.osp, o, s, p)):
+            index[a][b].discard(c)
+            if not index[a][b]:
+                del index[a][b]
+                if not index[a]:
+                    del index[a]
+        for counter, term in zip(self.position_counts, key):
+            counter[term] -= 1
+            if not counter[term]:
+                del counter[term]
+
+    def on_kb_change(self, change):
+        with self.lock:
+            # A load() that ran after the edit already indexed it
+            if not self.loaded or change["version"] <= self.version:
+                return
+            self.version = change["version"]
+            for triple_id, e1, rel, e2 in change["removed_triples"]:
+                self._delete(triple_id)
+            for triple_id, e1, rel, e2 in change["added_triples"]:
+                self._insert(triple_id, e1, rel, e2)
+
+    def match(self, s=None, p=None, o=None):
+        """Yield (s, p, o) id tuples matching a pattern; None is a wildcard"""
+        if s is not None and p is not None:
+            objects = self.spo.get(s, {}).get(p, ())
+            if o is not None:
+                if o in objects:
+                    yield (s, p, o)
+                return
+            for obj in objects:
+                yield (s, p, obj)
+        elif p is not None:
+            by_object = self.pos.get(p, {})
+            if o is not None:
+                for subj in by_object.get(o, ()):
+                    yield (subj, p, o)
+                return
+            for obj, subjects in by_object.items():
+                for subj in subjects:
+                    yield (subj, p, obj)
+        elif o is not None:
+            by_subject = self.osp.get(o, {})
+            if s is not None:
+                for pred in by_subject.get(s, ()):
+                    yield (s, pred, o)
+                return
+            for subj, predicates in by_subject.items():
+                for pred in predicates:
+                    yield (subj, pred, o)
+        elif s is not None:
+            for pred, objects in self.spo.get(s, {}).items():
+                for obj in objects:
+                    yield (s, pred, obj)
+        else:
+            for subj, by_predicate in self.spo.items():
+                for pred, objects in by_predicate.items():
+                    for obj in objects:
+                        yield (subj, pred, obj)
+
+    def _estimate(self, pattern, bound):
+        """Rough result size of a pattern, used to order joins (smallest first)"""
+        s, p, o = (term if kind == "const" else None for kind, term in pattern)
+        if s is not None and p is not None:
+            size = len(self.spo.get(s, {}).get(p, ()))
+        elif p is not None and o is not None:
+            size = len(self.pos.get(p, {}).get(o, ()))
+        elif s is not None and o is not None:
+            size = len(self.osp.get(o, {}).get(s, ()))
+        elif s is not None or p is not None or o is not None:
+            size = min(counter[term] for counter, term in zip(self.position_counts, (s, p, o)) if term is not None)
+        else:
+            size = len(self.counts)
+        joined = sum(1 for kind, term in pattern if kind == "var" and term in bound)
+        return size / (10 ** joined)
+
+    def query(self, patterns, limit=1000, max_intermediate=1000000):
+        """
+        Join triple patterns; each pattern is an (entity1, relation, entity2) tuple whose
+        items are constants, "?name" variables, or None/"*" wildcards.
+        Returns distinct bindings of the named variables; a query without named variables
+        returns [{}] when every pattern matches and [] otherwise.
+        """
+        if not patterns:
+            return []
+        with self.lock:
+            parsed = []
+            for pattern in patterns:
+                terms = []
+                for position, term in enumerate(pattern):
+                    if term is None or term in ("", "*"):
+                        terms.append(("var", f"?_{len(parsed)}_{position}"))
+                    elif term.startswith("?") and len(term) > 1:
+                        terms.append(("var", term))
+                    else:
+                        tid = self.term_id(term)
+                        if tid is None:
+                            return []
+                        terms.append(("const", tid))
+                parsed.append(terms)
+
+            solutions = [{}]
+            bound = set()
+            remaining = list(parsed)
+            while remaining and solutions:
+                pattern = min(remaining, key=lambda p: self._estimate(p, bound))
+                remaining.remove(pattern)
+
+                next_solutions = []
+                for binding in solutions:
+                    lookup = [term if kind == "const" else binding.get(term) for kind, term in pattern]
+                    for triple in self.match(*lookup):
+                        extended = dict(binding)
+                        consistent = True
+                        for (kind, name), value in zip(pattern, triple):
+                            if kind == "var":
+                                if extended.setdefault(name, value) != value:
+                                    consistent = False
+                                    break
+                        if consistent:
+                            next_solutions.append(extended)
+                    if len(next_solutions) > max_intermediate:
+                        raise ValueError("Query too broad: add constants or more selective patterns")
+                solutions = next_solutions
+                bound.update(term for kind, term in pattern if kind == "var")
+
+            results = []
+            seen = set()
+            for binding in solutions:
+                named = tuple(sorted((name, value) for name, value in binding.items() if not name.startswith("?_")))
+                if named in seen:
+                    continue
+                seen.add(named)
+                results.append({name[1:]: self.terms[value] for name, value in named})
+                if len(results) >= limit:
+                    break
+            return results
+
+    def match_terms(self, entity1=None, relation=None, entity2=None, limit=1000):
+        """Triples matching a single pattern of constants and wildcards"""
+        with self.lock:
+            ids = []
+            for term in (entity1, relation, entity2):
+                if term is None or term in ("", "*") or term.startswith("?"):
+                    ids.append(None)
+                else:
+                    tid = self.term_id(term)
+                    if tid is None:
+                        return []
+                    ids.append(tid)
+
+            results = []
+            for s, p, o in self.match(*ids):
+                results.append({"entity1": self.terms[s], "relation": self.terms[p], "entity2": self.terms[o]})
+                if len(results) >= limit:
+                    break
+            return results
+
+GRAPH_REBASE_INTERVAL = 10
+# Attributes of edges recorded before versions kept them
+LEGACY_EDGE_ATTRIBUTES = json.dumps({"source": "extraction"})
+
+class GraphVersionStore:
+    """
+    Versioned snapshots of an extracted graph, stored as a full base plus edge deltas. Each edge
+    is an (entity1, relation, entity2, attributes) row, attributes being the canonical JSON of
+    its other edge attributes (source, dataset), so a restored graph keeps them.
+    """
+
+    def __init__(self, user_folder, base_name):
+        self.folder = os.path.join(user_folder, f"{base_name}_versions")
+        self.manifest_path = os.path.join(self.folder, "manifest.json")
+
+    def _manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"versions": []}
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def _write(self, name, data):
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, name), 'w') as f:
+            json.dump(data, f)
+
+    def _read(self, name):
+        with open(os.path.join(self.folder, name), 'r') as f:
+            return json.load(f)
+
+    def versions(self):
+        return self._manifest()["versions"]
+
+    @staticmethod
+    def edge_attributes(data):
+        extra = {key: value for key, value in data.items() if key not in ("label", "relation")}
+        return json.dumps(extra, sort_keys=True, default=str)
+
+    @staticmethod
+    def graph_triples(G):
+        return {(u, data.get("relation", data.get("label", "")), v, GraphVersionStore.edge_attributes(data))
+                for u, v, data in G.edges(data=True)}
+
+    @staticmethod
+    def triples_to_graph(triples):
+        G = nx.DiGraph()
+        for e1, rel, e2, attributes in triples:
+            G.add_edge(e1, e2, label=rel, relation=rel, **json.loads(attributes))
+        return G
+
+    @staticmethod
+    def _row(row):
+        return tuple(row) if len(row) == 4 else (*row, LEGACY_EDGE_ATTRIBUTES)
+
+    def materialize(self, version):
+        """Triple set of a version: its nearest base with the following deltas applied"""
+        entries = self.versions()
+        if version < 1 or version > len(entries):
+            return None
+
+        base = max(v for v in range(1, version + 1) if entries[v - 1]["type"] == "base")
+        triples = {self._row(t) for t in self._read(entries[base - 1]["file"])["triples"]}
+        for v in range(base + 1, version + 1):
+            delta = self._read(entries[v - 1]["file"])
+            triples.difference_update(self._row(t) for t in delta["removed"])
+            triples.update(self._row(t) for t in delta["added"])
+        return triples
+
+    def diff(self, from_version, to_version):
+        old = self.materialize(from_version)
+        new = self.materialize(to_version)
+        if old is None or new is None:
+            return None
+        return {"added": sorted(new - old), "removed": sorted(old - new)}
+
+    def commit(self, G):
+        """Record G as a new version if it differs from the latest; returns (version, delta)"""
+        manifest = self._manifest()
+        entries = manifest["versions"]
+        triples = self.graph_triples(G)
+        created_at = datetime.datetime.utcnow().isoformat()
+
+        if not entries:
+            added, removed = sorted(triples), []
+        else:
+            previous = self.materialize(len(entries))
+            added, removed = sorted(triples - previous), sorted(previous - triples)
+            if not added and not removed:
+                return len(entries), {"added": [], "removed": []}
+
+        version = len(entries) + 1
+        last_base = max((e["version"] for e in entries if e["type"] == "base"), default=0)
+
+        if not entries or version - last_base >= GRAPH_REBASE_INTERVAL:
+            # Start a new base so materializing never replays a long delta chain
+            name = f"v{version}.base.json"
+            self._write(name, {"triples": sorted(triples)})
+            entry_type = "base"
+        else:
+            name = f"v{version}.delta.json"
+            self._write(name, {"added": added, "removed": removed})
+            entry_type = "delta"
+
+        entries.append({
+            "version": version,
+            "type": entry_type,
+            "file": name,
+            "created_at": created_at,
+            "edges": len(triples),
+            "added": len(added),
+            "removed": len(removed)
+        })
+        self._write("manifest.json", manifest)
+        return version, {"added": added, "removed": removed}
@@ -0,0 +1,3132 @@
+"""Semantic search over knowledge graphs: embedding, ANN indexes and the engine registry.
+
+Kept free of the Flask app and the extraction models, and importing it loads no model
+(sentence-transformers is imported when an encoder is first created), so the offline
+query CLI at the bottom of this file, the shard server (--serve-shard), encode and shard
+worker processes (--worker) and tests can use it on their own.
+"""
+import os, json, time, argparse, contextlib
+import pickle
+import networkx as nx
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+import threading
+import sys
+import socket
+import subprocess
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener, wait
+import atexit
+import queue
+from concurrent.futures import Future
+import hashlib
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+import itertools
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+# ===============================================================
+# Worker Processes
+# ===============================================================
+
+def start_worker(role, *args):
+    """
+    Start `python semantic_search.py --worker role fd args...` on one end of a socket pair and
+    return (process, connection). Workers import only this module, never the Flask app that
+    started them, and exit when the connection closes.
+    """
+    parent, child = socket.socketpair()
+    command = [sys.executable, os.path.abspath(__file__), "--worker", role, str(child.fileno())]
+    process = subprocess.Popen(command + [str(arg) for arg in args], pass_fds=(child.fileno(),))
+    child.close()
+    return process, Connection(parent.detach())
+
+def run_worker(argv):
+    role, fd, args = argv[0], int(argv[1]), argv[2:]
+    WORKER_ROLES[role](Connection(fd), *args)
+    return 0
+
+# ===============================================================
+# Approximate Nearest Neighbor Indexes
+# ===============================================================
+
+ANN_BACKEND = os.getenv("KNOWMAP_ANN_BACKEND", "ivf")          # 'ivf', 'hnsw' or 'exact'
+ANN_MIN_NODES = int(os.getenv("KNOWMAP_ANN_MIN_NODES", "20000"))  # below this, exact search is fast enough
+ANN_EFFORT = int(os.getenv("KNOWMAP_ANN_EFFORT", "0"))         # recall/latency knob, 0 = backend default
+SEARCH_SHARDS = int(os.getenv("KNOWMAP_SEARCH_SHARDS", "0"))     # local worker processes, 0/1 = unsharded
+SHARD_ADDRESSES = [a for a in os.getenv("KNOWMAP_SHARD_ADDRESSES", "").split(",") if a.strip()]  # host:port,...
+SHARD_AUTHKEY = os.getenv("KNOWMAP_SHARD_AUTHKEY", "").encode("utf-8")  # required for shard servers
+SHARD_MIN_NODES = int(os.getenv("KNOWMAP_SHARD_MIN_NODES", "100000"))
+SHARD_SCORE_BLOCK = 65536
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first, without sorting the whole array"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+class IVFIndex:
+    """Inverted-file index: k-means centroids with one posting list of node rows per centroid"""
+
+    name = "ivf"
+
+    def __init__(self, centroids, order, offsets, default_nprobe=None):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.default_nprobe = default_nprobe or max(1, len(centroids) // 32)
+        self.vectors = None
+        self.scale = None
+        self.extra = {}
+        self.bounds = None
+
+    @classmethod
+    def build(cls, vectors, nlist=None, train_size=100000, block_size=65536):
+        n = len(vectors)
+        nlist = nlist or int(min(65536, max(16, 4 * np.sqrt(n))))
+        rng = np.random.default_rng(42)
+        sample = vectors[rng.choice(n, size=min(n, max(train_size, nlist * 4)), replace=False)]
+
+        kmeans = MiniBatchKMeans(n_clusters=nlist, random_state=42, batch_size=4096, n_init=1)
+        kmeans.fit(sample)
+        centroids = normalize_rows(kmeans.cluster_centers_)
+
+        assignments = np.empty(n, dtype=np.int32)
+        for start in range(0, n, block_size):
+            assignments[start:start + block_size] = np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+
+        index = cls(centroids, order, offsets)
+        index.vectors = vectors
+        return index
+
+    def attach(self, vectors, scale=None):
+        self.vectors = vectors
+        self.scale = scale
+
+    def memory_bytes(self):
+        # Vectors are shared with the engine and counted there
+        bounds = sum(b.nbytes for b in self.bounds) if self.bounds is not None else 0
+        return (self.centroids.nbytes + self.order.nbytes + self.offsets.nbytes + bounds +
+                8 * sum(len(r) for r in self.extra.values()))
+
+    def _posting_list(self, c):
+        rows = self.order[self.offsets[c]:self.offsets[c + 1]]
+        if c in self.extra:
+            rows = np.concatenate([rows, np.asarray(self.extra[c], dtype=np.int64)])
+        return rows
+
+    def neighbor_blocks(self, nprobe=None):
+        """(member rows, candidate rows) per cluster: its members against its nprobe nearest clusters"""
+        nprobe = min(nprobe or self.default_nprobe, len(self.centroids))
+        for c in range(len(self.centroids)):
+            rows = self._posting_list(c)
+            if not len(rows):
+                continue
+            near = np.argpartition(-(self.centroids @ self.centroids[c]), nprobe - 1)[:nprobe]
+            yield rows, np.concatenate([self._posting_list(n) for n in near])
+
+    def add(self, rows, vectors):
+        """Append new rows to the posting list of their nearest centroid"""
+        clusters = np.argmax(vectors @ self.centroids.T, axis=1)
+        for row, c in zip(rows, clusters):
+            self.extra.setdefault(int(c), []).append(int(row))
+        if self.bounds is not None:
+            self._widen_bounds(clusters, self._stored(np.asarray(rows, dtype=np.int64)))
+
+    def _stored(self, rows):
+        block = self.vectors[rows].astype(np.float32)
+        return block * self.scale if self.scale is not None else block
+
+    def _widen_bounds(self, clusters, block):
+        norms, angles = self.bounds
+        lengths = np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+        cosines = np.clip(np.einsum("ij,ij->i", block, self.centroids[clusters]) / lengths, -1.0, 1.0)
+        np.maximum.at(norms, clusters, lengths)
+        np.maximum.at(angles, clusters, np.arccos(cosines))
+
+    def cluster_bounds(self, block_size=65536):
+        """Per-cluster (largest member norm, widest member angle to the centroid), computed on first use"""
+        if self.bounds is None:
+            self.bounds = (np.zeros(len(self.centroids), dtype=np.float32),
+                           np.zeros(len(self.centroids), dtype=np.float32))
+            rows = np.concatenate([self.order] + [np.asarray(r, dtype=np.int64) for r in self.extra.values()])
+            clusters = np.concatenate([np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))] +
+                                      [np.full(len(r), c) for c, r in self.extra.items()])
+            for start in range(0, len(rows), block_size):
+                self._widen_bounds(clusters[start:start + block_size], self._stored(rows[start:start + block_size]))
+        return self.bounds
+
+    def range_search(self, query_vector, threshold, mask=None):
+        """
+        (rows, scores) of every row scoring >= threshold, unordered. Exact: by the triangle inequality
+        on angles, no member of a cluster can score above norm * cos(angle(query, centroid) - widest
+        member angle), so only clusters whose bound reaches the threshold are scanned.
+        """
+        norms, angles = self.cluster_bounds()
+        query_angles = np.arccos(np.clip(self.centroids @ query_vector, -1.0, 1.0))
+        bound = norms * np.cos(np.clip(query_angles - angles, 0.0, np.pi))
+        probe = np.flatnonzero(bound >= threshold - 1e-4)
+        if len(probe) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        candidates = np.concatenate([self._posting_list(c) for c in probe])
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if self.scale is not None:
+            query_vector = query_vector * self.scale
+        scores = self.vectors[candidates].astype(np.float32, copy=False) @ query_vector
+        keep = scores >= threshold
+        return candidates[keep], scores[keep]
+
+    def remove(self, rows):
+        # Removed rows are filtered with the engine's liveness mask until compaction
+        pass
+
+    def compact(self, keep):
+        """Renumber posting lists after the engine drops tombstoned rows"""
+        total_rows = len(self.order) + sum(len(rows) for rows in self.extra.values())
+        mapping = np.full(total_rows, -1, dtype=np.int64)
+        mapping[keep] = np.arange(len(keep))
+        lists = [mapping[self._posting_list(c)] for c in range(len(self.centroids))]
+        lists = [rows[rows >= 0] for rows in lists]
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in lists], out=offsets[1:])
+        order = np.concatenate(lists) if lists else np.array([], dtype=np.int64)
+        return IVFIndex(self.centroids, order, offsets, self.default_nprobe)
+
+    def search(self, query_vector, k, effort=None, mask=None):
+        nprobe = min(effort or self.default_nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query_vector
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        candidates = np.concatenate([self._posting_list(c) for c in probe])
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+            if len(candidates) < k and nprobe < len(self.centroids):
+                # The mask left too few rows in the probed clusters: keep doubling the probe
+                # (up to every cluster, an exact scan) until k matching rows are candidates
+                ranked = np.argsort(-centroid_scores, kind="stable")
+                probed = set(probe.tolist())
+                found = [candidates]
+                while sum(len(rows) for rows in found) < k and nprobe < len(ranked):
+                    for c in ranked[nprobe:2 * nprobe].tolist():
+                        if c not in probed:
+                            probed.add(c)
+                            rows = self._posting_list(c)
+                            found.append(rows[mask[rows]])
+                    nprobe *= 2
+                candidates = np.concatenate(found)
+        if len(candidates) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        if self.scale is not None:
+            query_vector = query_vector * self.scale
+        scores = self.vectors[candidates].astype(np.float32, copy=False) @ query_vector
+        top = top_k_indices(scores, k)
+        return candidates[top], scores[top]
+
+    def save(self, path, fingerprint):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 fingerprint=np.array(fingerprint))
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            return cls(data["centroids"], data["order"], data["offsets"])
+
+class HNSWIndex:
+    """Hierarchical navigable small-world graph index (requires the optional hnswlib package)"""
+
+    name = "hnsw"
+
+    def __init__(self, index, default_ef=64):
+        self.index = index
+        self.default_ef = default_ef
+        self.deleted = 0
+
+    @classmethod
+    def build(cls, vectors, m=16, ef_construction=200):
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=len(vectors), ef_construction=ef_construction, M=m)
+        index.add_items(vectors, np.arange(len(vectors)))
+        return cls(index)
+
+    def attach(self, vectors, scale=None):
+        pass
+
+    def memory_bytes(self):
+        # hnswlib keeps its own copy of the vectors plus roughly 2*M links per element
+        return self.index.get_max_elements() * (self.index.dim * 4 + 2 * self.index.M * 4 + 8)
+
+    def add(self, rows, vectors):
+        needed = self.index.get_current_count() + len(rows)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, int(self.index.get_max_elements() * 1.5)))
+        self.index.add_items(vectors, np.asarray(rows))
+
+    def remove(self, rows):
+        for row in rows:
+            self.index.mark_deleted(int(row))
+        self.deleted += len(rows)
+
+    def compact(self, keep):
+        # Labels are row numbers, so renumbering rows means rebuilding the graph
+        return None
+
+    def search(self, query_vector, k, effort=None, mask=None):
+        k = min(k, self.index.get_current_count() - self.deleted)
+        if mask is not None:
+            k = min(k, int(mask.sum()))
+        if k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        self.index.set_ef(max(effort or self.default_ef, k))
+        if mask is not None:
+            labels, distances = self.index.knn_query(query_vector, k=k, filter=lambda label: bool(mask[label]))
+        else:
+            labels, distances = self.index.knn_query(query_vector, k=k)
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def save(self, path, fingerprint):
+        self.index.save_index(path)
+        with open(path + ".meta.json", "w") as f:
+            json.dump({"fingerprint": fingerprint, "dim": self.index.dim,
+                       "count": self.index.get_current_count()}, f)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        if not os.path.exists(path) or not os.path.exists(path + ".meta.json"):
+            return None
+        with open(path + ".meta.json") as f:
+            meta = json.load(f)
+        if meta["fingerprint"] != fingerprint:
+            return None
+        index = hnswlib.Index(space="ip", dim=meta["dim"])
+        index.load_index(path, max_elements=meta["count"])
+        return cls(index)
+
+class ShardStore:
+    """
+    The rows of one shard, scored exactly. Rows only ever arrive in increasing global order,
+    so each shard's row ids stay sorted.
+    """
+
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, scale):
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.blocks = []
+        self.scale = scale
+        self._vectors = None
+
+    @property
+    def vectors(self):
+        if self._vectors is None:
+            self._vectors = np.concatenate(self.blocks) if self.blocks else None
+            self.blocks = [self._vectors] if self._vectors is not None else []
+        return self._vectors
+
+    def append(self, rows, stored):
+        self.rows = np.concatenate([self.rows, rows])
+        self.blocks.append(stored)
+        self._vectors = None
+
+    def _scores(self, query_vectors, packed, size):
+        if self.scale is not None:
+            query_vectors = query_vectors * self.scale
+        scores = np.empty((len(query_vectors), len(self.rows)), dtype=np.float32)
+        for start in range(0, len(self.rows), SHARD_SCORE_BLOCK):
+            block = self.vectors[start:start + SHARD_SCORE_BLOCK].astype(np.float32, copy=False)
+            scores[:, start:start + len(block)] = query_vectors @ block.T
+        if packed is not None:
+            scores[:, ~np.unpackbits(packed, count=size).astype(bool)[self.rows]] = -np.inf
+        return scores
+
+    def search(self, query_vectors, ks, packed, size):
+        replies = []
+        for row_scores, k in zip(self._scores(query_vectors, packed, size), ks):
+            top = top_k_indices(row_scores, k)
+            top = top[np.isfinite(row_scores[top])]
+            replies.append((self.rows[top], row_scores[top]))
+        return replies
+
+    def range(self, query_vector, threshold, packed, size):
+        scores = self._scores(query_vector[None, :], packed, size)[0]
+        keep = np.flatnonzero(scores >= threshold)
+        if len(keep) > RANGE_MAX_RESULTS:
+            # One past the engine's cap is enough for it to report truncation
+            keep = keep[top_k_indices(scores[keep], RANGE_MAX_RESULTS + 1)]
+        return self.rows[keep], scores[keep]
+
+    def fetch(self, wanted):
+        """(positions in wanted, stored vectors) of the wanted rows this shard holds"""
+        found = np.searchsorted(self.rows, wanted)
+        found = np.minimum(found, max(len(self.rows) - 1, 0))
+        hit = np.flatnonzero(self.rows[found] == wanted) if len(self.rows) else np.zeros(0, dtype=np.int64)
+        return hit, (self.vectors[found[hit]] if len(hit) else None)
+
+    def compact(self, packed, size):
+        """Drop rows outside the keep mask and renumber the rest as the engine does"""
+        keep_rows = np.unpackbits(packed, count=size).astype(bool)
+        renumber = np.cumsum(keep_rows) - 1
+        keep = keep_rows[self.rows]
+        if self.vectors is not None:
+            self.blocks = [np.ascontiguousarray(self.vectors[keep])]
+            self._vectors = None
+        self.rows = renumber[self.rows[keep]]
+        return len(self.rows)
+
+    def nbytes(self):
+        return self.rows.nbytes + sum(block.nbytes for block in self.blocks)
+
+def shard_worker(conn):
+    """
+    Serve one ShardStore over a connection. Requests are (op, *args) tuples naming a
+    ShardStore method in SHARD_OPS; 'reset' and 'append' are not answered, the others are.
+    """
+    store = ShardStore()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        op = message[0]
+        if op == "close":
+            break
+        if op in ("reset", "append"):
+            getattr(store, op)(*message[1:])
+        elif op in SHARD_OPS:
+            conn.send(getattr(store, op)(*message[1:]))
+    conn.close()
+
+SHARD_OPS = ("reset", "append", "search", "range", "fetch", "compact", "nbytes")
+
+def shard_address(address):
+    """(host, port) of 'host:port', or of a bare port on localhost"""
+    host, _, port = address.strip().rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def serve_shard(address, authkey=None):
+    """
+    Serve shards to remote ShardedIndexes: python semantic_search.py --serve-shard [host:]port.
+    A bare port binds localhost only. Requests are pickled, so the server refuses to start
+    without KNOWMAP_SHARD_AUTHKEY and clients must prove they hold it before anything is
+    unpickled. Each connection is an independent shard served on its own thread.
+    """
+    authkey = SHARD_AUTHKEY if authkey is None else authkey
+    if not authkey:
+        print("Refusing to serve shards: set KNOWMAP_SHARD_AUTHKEY to a shared secret")
+        return 1
+    with Listener(shard_address(address), authkey=authkey) as listener:
+        print(f"Shard server listening on {listener.address[0]}:{listener.address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError) as e:
+                print(f"Rejected shard connection: {e}")
+                continue
+            threading.Thread(target=shard_worker, args=(conn,), name="shard", daemon=True).start()
+
+class ShardedIndex:
+    """
+    Scatter-gather search over index shards held by local worker processes (or shard servers
+    at SHARD_ADDRESSES). The shards hold the only copy of the stored rows: the engine drops
+    its own once they are loaded and fetches rows from them when it needs one. Rows are
+    partitioned contiguously, added rows go to the smallest shard, and each query's per-shard
+    top-k lists are merged. Shards score exactly, in parallel.
+    """
+
+    name = "sharded"
+
+    def __init__(self, connections, processes=()):
+        self.connections = connections
+        self.processes = list(processes)
+        self.counts = [0] * len(connections)
+        self.dim = None
+        self.dtype = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, vectors=None, shards=None, addresses=None, authkey=None):
+        addresses = SHARD_ADDRESSES if addresses is None else addresses
+        if addresses:
+            authkey = SHARD_AUTHKEY if authkey is None else authkey
+            if not authkey:
+                raise ValueError("KNOWMAP_SHARD_AUTHKEY must be set to use shard servers")
+            return cls([Client(shard_address(address), authkey=authkey) for address in addresses])
+
+        # Fresh interpreters rather than forks: the API forks after its worker threads are running
+        workers = [start_worker("shard") for _ in range(shards or SEARCH_SHARDS)]
+        print(f"Started {len(workers)} search shard workers")
+        return cls([conn for _, conn in workers], [process for process, _ in workers])
+
+    def attach(self, vectors, scale=None):
+        """Load the stored rows into the shards; once loaded they are kept there"""
+        if not self.loaded:
+            self._load(vectors, scale)
+
+    def _load(self, vectors, scale):
+        bounds = np.linspace(0, len(vectors), len(self.connections) + 1).astype(np.int64)
+        with self.lock:
+            for i, conn in enumerate(self.connections):
+                conn.send(("reset", scale))
+                for start in range(bounds[i], bounds[i + 1], INDEX_BATCH_SIZE):
+                    end = min(bounds[i + 1], start + INDEX_BATCH_SIZE)
+                    conn.send(("append", np.arange(start, end), np.asarray(vectors[start:end])))
+                self.counts[i] = int(bounds[i + 1] - bounds[i])
+        self.dim, self.dtype = vectors.shape[1], vectors.dtype
+        self.loaded = True
+
+    def _broadcast(self, message):
+        with self.lock:
+            for conn in self.connections:
+                conn.send(message)
+            return [conn.recv() for conn in self.connections]
+
+    @staticmethod
+    def _pack(mask):
+        return (np.packbits(mask), len(mask)) if mask is not None else (None, 0)
+
+    def memory_bytes(self):
+        """Stored rows and row ids held by the shards, as reported by each of them"""
+        return sum(self._broadcast(("nbytes",))) if self.loaded else 0
+
+    def add(self, rows, stored):
+        """Append already-stored (possibly reduced-precision) rows to the smallest shard"""
+        shard = int(np.argmin(self.counts))
+        rows = np.asarray(rows, dtype=np.int64)
+        with self.lock:
+            self.connections[shard].send(("append", rows, np.asarray(stored)))
+        self.counts[shard] += len(rows)
+
+    def fetch(self, rows):
+        """Stored vectors of rows, gathered from the shards holding them"""
+        rows = np.asarray(rows, dtype=np.int64)
+        stored = np.empty((len(rows), self.dim), dtype=self.dtype)
+        for positions, vectors in self._broadcast(("fetch", rows)):
+            if len(positions):
+                stored[positions] = vectors
+        return stored
+
+    def remove(self, rows):
+        # Deleted rows are masked at query time
+        pass
+
+    def compact(self, keep):
+        """Drop the rows not in keep on every shard and renumber the rest"""
+        alive = np.zeros(sum(self.counts), dtype=bool)
+        alive[keep] = True
+        self.counts = self._broadcast(("compact",) + self._pack(alive))
+        return self
+
+    def search_batch(self, query_vectors, ks, mask=None):
+        """(rows, scores) per query: every shard's top-k, merged"""
+        replies = self._broadcast(("search", np.asarray(query_vectors, dtype=np.float32), list(ks)) + self._pack(mask))
+        results = []
+        for i, k in enumerate(ks):
+            rows = np.concatenate([reply[i][0] for reply in replies])
+            scores = np.concatenate([reply[i][1] for reply in replies])
+            top = top_k_indices(scores, k)
+            results.append((rows[top], scores[top]))
+        return results
+
+    def search(self, query_vector, k, effort=None, mask=None):
+        return self.search_batch(query_vector[None, :], [k], mask)[0]
+
+    def range_search(self, query_vector, threshold, mask=None):
+        """(rows, scores) of every row scoring >= threshold, unordered"""
+        replies = self._broadcast(("range", np.asarray(query_vector, dtype=np.float32), threshold) + self._pack(mask))
+        return np.concatenate([rows for rows, _ in replies]), np.concatenate([scores for _, scores in replies])
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                try:
+                    conn.send(("close",))
+                    conn.close()
+                except Exception:
+                    pass
+        for process in self.processes:
+            try:
+                process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+ANN_INDEX_TYPES = {"ivf": (IVFIndex, ".ivf.npz"), "hnsw": (HNSWIndex, ".hnsw.bin")}
+# Files build_ann_index persists next to a graph (HNSW also writes <path>.meta.json)
+ANN_INDEX_SUFFIXES = tuple(suffix for _, suffix in ANN_INDEX_TYPES.values()) + (".meta.json",)
+
+def build_ann_index(vectors, labels, index_path=None, backend=None, salt=""):
+    """
+    Load a persisted ANN index matching these labels, or build (and persist) a new one.
+    salt identifies the vector space (model, projection), so a changed encoder never reuses an index.
+    """
+    if (SEARCH_SHARDS > 1 or SHARD_ADDRESSES) and len(vectors) >= SHARD_MIN_NODES:
+        # Loaded with the stored rows by the caller's attach()
+        return ShardedIndex.build()
+
+    backend = backend or ANN_BACKEND
+    if backend == "hnsw" and hnswlib is None:
+        print("hnswlib not installed, falling back to IVF index")
+        backend = "ivf"
+    if backend not in ANN_INDEX_TYPES or len(vectors) < ANN_MIN_NODES:
+        return None
+
+    index_cls, suffix = ANN_INDEX_TYPES[backend]
+    digest = hashlib.sha1(f"{salt}|{vectors.shape[1]}\n".encode("utf-8"))
+    digest.update("\n".join(str(label) for label in labels).encode("utf-8"))
+    fingerprint = digest.hexdigest()
+    path = os.path.splitext(index_path)[0] + suffix if index_path else None
+
+    index = None
+    if path:
+        try:
+            index = index_cls.load(path, fingerprint)
+        except Exception as e:
+            print(f"Could not load ANN index {path}: {e}")
+
+    if index is not None:
+        print(f"Loaded {backend} index from {path}")
+    else:
+        start = time.time()
+        index = index_cls.build(vectors)
+        print(f"Built {backend} index over {len(vectors)} vectors in {time.time() - start:.2f}s")
+        if path:
+            try:
+                index.save(path, fingerprint)
+            except Exception as e:
+                print(f"Could not save ANN index {path}: {e}")
+
+    index.attach(vectors)
+    return index
+
+# ===============================================================
+# Embedding Cache
+# ===============================================================
+
+EMBEDDING_CACHE_DIR = os.getenv("KNOWMAP_EMBEDDING_CACHE", "embedding_cache")
+QUERY_CACHE_SIZE = int(os.getenv("KNOWMAP_QUERY_CACHE_SIZE", "10000"))
+RESULT_CACHE_SIZE = int(os.getenv("KNOWMAP_RESULT_CACHE_SIZE", "2048"))
+SUBGRAPH_CACHE_SIZE = int(os.getenv("KNOWMAP_SUBGRAPH_CACHE_SIZE", "256"))
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+class LRUCache:
+    """Thread-safe bounded mapping that drops the least recently used entry when full"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        return {"size": len(self.data), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+class EmbeddingCache:
+    """
+    Append-only on-disk store of normalized embeddings keyed by a hash of the normalized text.
+    Vectors live in a raw float32 file that is memory-mapped, so only looked-up rows are paged in.
+    Row i of vectors.f32 belongs to line i of keys.txt; appends from several processes (gunicorn
+    workers sharing the folder) are serialized with an flock on append.lock.
+    """
+
+    def __init__(self, model_name, cache_dir=EMBEDDING_CACHE_DIR):
+        slug = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+        self.folder = os.path.join(cache_dir, slug)
+        self.vectors_path = os.path.join(self.folder, "vectors.f32")
+        self.keys_path = os.path.join(self.folder, "keys.txt")
+        self.meta_path = os.path.join(self.folder, "meta.json")
+        self.lock_path = os.path.join(self.folder, "append.lock")
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.count = 0
+        self.keys_offset = 0
+        self.dim = None
+        self.vectors = None
+        self._load()
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        self._sync()
+        self._remap()
+        print(f"Embedding cache: {self.count} vectors in {self.folder}")
+
+    def _stored_rows(self):
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _sync(self):
+        """Index keys appended since the last sync (possibly by another process)"""
+        if self.dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self.keys_offset)
+            tail = f.read()
+        # Only whole lines count; a torn key write is finished (or cut off) by the next append
+        complete = tail[:tail.rfind(b"\n") + 1]
+        # Keys are written after their vectors, so a complete key line normally has its row on disk
+        stored = self._stored_rows()
+        for line in complete.splitlines(keepends=True):
+            if self.count >= stored:
+                break
+            self.rows.setdefault(line.decode("utf-8").strip(), self.count)
+            self.count += 1
+            self.keys_offset += len(line)
+
+    def _remap(self):
+        count = self.count
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim)) if count else None
+
+    def _append(self, keys, vectors):
+        with self._file_lock():
+            if self.dim is None:
+                self._sync()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            self._sync()
+
+            # Cut off what a crashed append left behind: vector rows without keys, a partial key line
+            start = self.count
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(start * 4 * self.dim)
+            with open(self.keys_path, "ab") as f:
+                f.truncate(self.keys_offset)
+
+            fresh = [i for i, key in enumerate(keys) if key not in self.rows]
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[fresh], dtype=np.float32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write("".join(f"{keys[i]}\n" for i in fresh).encode("utf-8"))
+            self._sync()
+        self._remap()
+
+    def lookup(self, texts):
+        """Cached embeddings for texts, or None if any of them has not been encoded yet"""
+        with self.lock:
+            rows = [self.rows.get(self.key(text)) for text in texts]
+            if any(row is None for row in rows):
+                return None
+            return np.asarray(self.vectors[rows], dtype=np.float32)
+
+    def fill(self, texts, encode_chunks):
+        """
+        Encode every uncached text in one pass. encode_chunks(list_of_texts) yields (positions,
+        raw embeddings) chunks, each stored as it arrives; returns the number of texts encoded.
+        """
+        with self.lock:
+            missing = {}
+            for text in texts:
+                key = self.key(text)
+                if key not in self.rows and key not in missing:
+                    missing[key] = text
+        if not missing:
+            return 0
+
+        start = time.time()
+        keys, pending = list(missing.keys()), list(missing.values())
+        for positions, encoded in encode_chunks(pending):
+            with self.lock:
+                self._append([keys[i] for i in positions], normalize_rows(encoded))
+        print(f"Encoded {len(keys)} new of {len(texts)} texts in {time.time() - start:.2f}s")
+        return len(keys)
+
+    def get(self, texts, encode):
+        """Normalized embeddings for texts, calling encode(list_of_texts) only for unseen ones"""
+        keys = [self.key(text) for text in texts]
+        with self.lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self.rows and key not in missing:
+                    missing[key] = text
+
+            if missing:
+                start = time.time()
+                encoded = normalize_rows(encode(list(missing.values())))
+                try:
+                    self._append(list(missing.keys()), encoded)
+                except Exception as e:
+                    print(f"Could not write embedding cache: {e}")
+                    fresh = dict(zip(missing.keys(), encoded))
+                    return np.array([fresh[key] if key in fresh else self.vectors[self.rows[key]] for key in keys],
+                                    dtype=np.float32)
+                print(f"Encoded {len(missing)} new of {len(texts)} texts in {time.time() - start:.2f}s")
+
+            return np.asarray(self.vectors[[self.rows[key] for key in keys]], dtype=np.float32)
+
+# ===============================================================
+# Lexical Index
+# ===============================================================
+
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("KNOWMAP_LEXICAL_WEIGHT", "0.5"))  # 0 disables lexical fusion
+LEXICAL_FAST_PATH_MAX_CHARS = 24
+LEXICAL_MAX_TRIGRAM_POSTING = 50000   # trigrams this common carry no signal and are skipped
+BM25_K1, BM25_B = 1.2, 0.75
+IDENTIFIER_PATTERN = re.compile(r"^[^\s]*(\d|_|[A-Z]{2})[^\s]*$")
+
+def lexical_tokens(text):
+    # Underscores split too, so 'has_alpha_3_code' matches 'alpha 3'
+    return re.findall(r"[^\W_]+", normalize_text(text).casefold())
+
+def label_trigrams(text):
+    padded = f"  {normalize_text(text).casefold()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def looks_like_identifier(query):
+    """Short single-token queries with digits, underscores or capitals (ISO codes, acronyms, ids)"""
+    query = query.strip()
+    return len(query) <= LEXICAL_FAST_PATH_MAX_CHARS and bool(IDENTIFIER_PATTERN.match(query))
+
+class LexicalIndex:
+    """
+    BM25 over node-label tokens, an exact-label lookup, and a character-trigram index used when
+    no query token is indexed (typos, partial identifiers). Scores are scaled to [0, 1].
+    The trigram index is several times larger than the rest, so it is only built on first use.
+    """
+
+    def __init__(self, labels=()):
+        self.postings = {}      # token -> {row: term frequency}
+        self.exact = {}         # casefolded label -> set of rows
+        self.labels = {}        # row -> label
+        self.lengths = {}       # row -> token count
+        self.total_length = 0
+        self.trigrams = None    # trigram -> set of rows
+        self.gram_counts = None # row -> trigram count
+        self.add(range(len(labels)), labels)
+
+    def memory_bytes(self):
+        # Rough estimate of the Python dict/set overhead per posting entry
+        entries = sum(len(p) for p in self.postings.values())
+        if self.trigrams is not None:
+            entries += sum(len(p) for p in self.trigrams.values())
+        return entries * 80 + len(self.labels) * 250
+
+    def _index_trigrams(self, row, label):
+        grams = label_trigrams(label)
+        for trigram in grams:
+            self.trigrams.setdefault(trigram, set()).add(row)
+        self.gram_counts[row] = len(grams)
+
+    def add(self, rows, labels):
+        for row, label in zip(rows, labels):
+            tokens = lexical_tokens(label)
+            for token, count in Counter(tokens).items():
+                self.postings.setdefault(token, {})[row] = count
+            self.exact.setdefault(normalize_text(label).casefold(), set()).add(row)
+            self.labels[row] = label
+            self.lengths[row] = len(tokens)
+            self.total_length += len(tokens)
+            if self.trigrams is not None:
+                self._index_trigrams(row, label)
+
+    def remove(self, rows):
+        for row in rows:
+            label = self.labels.pop(row, None)
+            if label is None:
+                continue
+            for token in set(lexical_tokens(label)):
+                self.postings.get(token, {}).pop(row, None)
+            self.exact.get(normalize_text(label).casefold(), set()).discard(row)
+            self.total_length -= self.lengths.pop(row)
+            if self.trigrams is not None:
+                for trigram in label_trigrams(label):
+                    self.trigrams.get(trigram, set()).discard(row)
+                self.gram_counts.pop(row, None)
+
+    def exact_rows(self, query):
+        return sorted(self.exact.get(normalize_text(query).casefold(), ()))
+
+    def _bm25(self, tokens):
+        count = len(self.lengths)
+        average = self.total_length / count if count else 1.0
+        scores = {}
+        for token in set(tokens):
+            posting = self.postings.get(token)
+            if not posting:
+                continue
+            idf = np.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for row, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[row] / average)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def _trigram(self, query):
+        if self.trigrams is None:
+            self.trigrams, self.gram_counts = {}, {}
+            for row, label in self.labels.items():
+                self._index_trigrams(row, label)
+
+        grams = label_trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            posting = self.trigrams.get(gram)
+            if posting and len(posting) <= LEXICAL_MAX_TRIGRAM_POSTING:
+                shared.update(posting)
+        # Jaccard similarity of the trigram sets
+        return {row: hits / (len(grams) + self.gram_counts[row] - hits)
+                for row, hits in shared.items() if hits >= len(grams) / 3}
+
+    def search(self, query, k, mask=None):
+        """(rows, scores) of the best lexical matches; exact label matches score 1.0"""
+        tokens = lexical_tokens(query)
+        scores = self._bm25(tokens) if tokens else {}
+        if scores:
+            best = max(scores.values())
+            scores = {row: 0.8 * score / best for row, score in scores.items()}
+        else:
+            scores = {row: 0.8 * min(score, 1.0) for row, score in self._trigram(query).items()}
+        for row in self.exact_rows(query):
+            scores[row] = 1.0
+        if mask is not None:
+            scores = {row: score for row, score in scores.items() if mask[row]}
+
+        if not scores:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        rows = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        values = np.fromiter(scores.values(), dtype=np.float32, count=len(scores))
+        top = top_k_indices(values, k)
+        return rows[top], values[top]
+
+# ===============================================================
+# Semantic Search Engine
+# ===============================================================
+
+LOUVAIN_MAX_NODES = 200000
+
+class CommunityIndex:
+    """Community partition of a graph, used to collapse large views into super-nodes"""
+
+    def __init__(self, graph, method=None, degrees=None):
+        """`degrees` ranks members when `graph` is an undirected snapshot of the original graph"""
+        undirected = nx.Graph(graph) if graph.is_directed() or graph.is_multigraph() else graph
+        degree = degrees.get if degrees is not None else graph.degree
+        if method is None:
+            method = 'louvain' if undirected.number_of_nodes() <= LOUVAIN_MAX_NODES else 'label_propagation'
+
+        start = time.time()
+        if method == 'label_propagation':
+            communities = nx.community.label_propagation_communities(undirected)
+        else:
+            communities = nx.community.louvain_communities(undirected, seed=42)
+
+        self.method = method
+        self.members = [sorted(c, key=degree, reverse=True) for c in sorted(communities, key=len, reverse=True)]
+        self.membership = {}
+        for cid, members in enumerate(self.members):
+            for node in members:
+                self.membership[node] = cid
+        print(f"Detected {len(self.members)} communities ({method}) in {time.time() - start:.2f}s")
+
+    def community_of(self, node):
+        return self.membership.get(node, -1)
+
+    def overview(self, limit=50):
+        """Largest communities with their sizes and best-connected members"""
+        return [
+            {
+                "community": cid,
+                "size": len(members),
+                "top_nodes": members[:5]
+            }
+            for cid, members in enumerate(self.members[:limit])
+        ]
+
+    def summarize(self, graph, expand=(), top_nodes=5):
+        """Collapse graph into community super-nodes, keeping communities in expand as plain nodes"""
+        expand = set(expand)
+
+        def group(node):
+            cid = self.community_of(node)
+            return (node, cid) if cid in expand else (f"community:{cid}", cid)
+
+        nodes = {}
+        members_in_view = {}
+        for node in graph.nodes():
+            key, cid = group(node)
+            if key == node:
+                nodes[key] = {"id": node, "type": "node", "community": cid, "degree": graph.degree(node)}
+            else:
+                if key not in nodes:
+                    nodes[key] = {
+                        "id": key,
+                        "type": "community",
+                        "community": cid,
+                        "size": len(self.members[cid]) if cid >= 0 else 0,
+                        "count": 0,
+                        "internal_edges": 0
+                    }
+                    members_in_view[key] = []
+                nodes[key]["count"] += 1
+                members_in_view[key].append(node)
+
+        for key, members in members_in_view.items():
+            members.sort(key=graph.degree, reverse=True)
+            nodes[key]["top_nodes"] = members[:top_nodes]
+
+        links = {}
+        relations = {}
+        for u, v, data in graph.edges(data=True):
+            su, sv = group(u)[0], group(v)[0]
+            if su == sv and nodes[su]["type"] == "community":
+                nodes[su]["internal_edges"] += 1
+                continue
+            if (su, sv) not in links:
+                links[(su, sv)] = {"source": su, "target": sv, "count": 0}
+                relations[(su, sv)] = Counter()
+            links[(su, sv)]["count"] += 1
+            relations[(su, sv)][data.get("relation", data.get("label", ""))] += 1
+
+        for key, link in links.items():
+            link["relations"] = dict(relations[key].most_common(3))
+
+        return {
+            "directed": graph.is_directed(),
+            "collapsed": True,
+            "nodes": list(nodes.values()),
+            "links": list(links.values())
+        }
+
+GRAPH_VIEW_STRATEGIES = ("degree", "relation", "kcore")
+
+def sample_graph_view(G, max_nodes=150, max_edges=300, strategy="degree"):
+    """Pick a representative, budgeted subset of G and lay it out for rendering"""
+    degree = dict(G.degree())
+
+    if strategy == "kcore":
+        simple = nx.Graph(G)
+        simple.remove_edges_from(nx.selfloop_edges(simple))
+        core = nx.core_number(simple)
+        ranked = sorted(G.nodes(), key=lambda n: (core.get(n, 0), degree[n]), reverse=True)
+        selected = set(ranked[:max_nodes])
+
+    elif strategy == "relation":
+        # Round-robin over relation types so rare relations are still represented
+        by_relation = {}
+        for u, v, data in G.edges(data=True):
+            by_relation.setdefault(data.get("relation", data.get("label", "")), []).append((u, v))
+        for edges in by_relation.values():
+            edges.sort(key=lambda e: degree[e[0]] + degree[e[1]], reverse=True)
+
+        selected = set()
+        position = 0
+        while len(selected) < max_nodes and by_relation:
+            exhausted = []
+            for relation, edges in by_relation.items():
+                if position >= len(edges):
+                    exhausted.append(relation)
+                    continue
+                u, v = edges[position]
+                if len(selected) + len({u, v} - selected) > max_nodes:
+                    continue
+                selected.update((u, v))
+            for relation in exhausted:
+                del by_relation[relation]
+            position += 1
+
+    else:
+        strategy = "degree"
+        selected = set(sorted(G.nodes(), key=degree.get, reverse=True)[:max_nodes])
+
+    sample = G.subgraph(selected)
+    edges = sorted(sample.edges(data=True), key=lambda e: degree[e[0]] + degree[e[1]], reverse=True)[:max_edges]
+
+    layout = nx.spring_layout(sample, seed=42, iterations=50, scale=1000) if sample.number_of_nodes() else {}
+
+    return {
+        "strategy": strategy,
+        "total_nodes": G.number_of_nodes(),
+        "total_edges": G.number_of_edges(),
+        "sampled_nodes": sample.number_of_nodes(),
+        "sampled_edges": len(edges),
+        "nodes": [
+            {
+                "id": node,
+                "degree": degree[node],
+                "x": float(layout[node][0]),
+                "y": float(layout[node][1])
+            }
+            for node in sample.nodes()
+        ],
+        "edges": [
+            {
+                "source": u,
+                "target": v,
+                "relation": data.get("relation", data.get("label", ""))
+            }
+            for u, v, data in edges
+        ]
+    }
+
+def parse_community_ids(values):
+    """
+    Validate the community ids to expand: integers, or digit strings from a query string.
+    Returns (sorted tuple of ids, error message or None).
+    """
+    if values is None:
+        return (), None
+    if not isinstance(values, list):
+        return (), "expand must be a list of community ids"
+    ids = set()
+    for value in values:
+        if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+            value = int(value)
+        if not isinstance(value, int) or isinstance(value, bool):
+            return (), "expand must be a list of integer community ids"
+        ids.add(value)
+    return tuple(sorted(ids)), None
+
+COMPACT_TOMBSTONE_RATIO = 0.25
+EXACT_SCORE_BLOCK = 64 * 1024 * 1024 // 4   # float32 scores computed per exact-search chunk
+MAX_BATCH_QUERIES = 1000
+MAX_TOP_K = 1000
+MAX_ANN_EFFORT = 10000
+MAX_REPORT_K = 100
+INDEX_BATCH_SIZE = int(os.getenv("KNOWMAP_INDEX_BATCH_SIZE", "50000"))
+SEARCH_TARGETS = ("nodes", "triples")
+FILTER_SUBSET_FRACTION = 0.5      # exact search scores only the matching rows below this selectivity
+FILTER_ANN_SUBSET_FRACTION = 0.05 # ...and bypasses the ANN index below this one
+FILTER_MASK_CACHE_SIZE = 64
+KNN_K = int(os.getenv("KNOWMAP_KNN_K", "10"))
+KNN_BACKGROUND = os.getenv("KNOWMAP_KNN_BACKGROUND", "1") == "1"  # compute neighbors after each index build
+KNN_NPROBE_FACTOR = 2   # the kNN job probes this many times the IVF search default of clusters
+RANKINGS = ("similarity", "degree", "pagerank")
+CENTRALITY_WEIGHT = float(os.getenv("KNOWMAP_CENTRALITY_WEIGHT", "0.2"))
+CENTRALITY_FETCH_FACTOR = 4   # centrality ranking re-ranks this many times top_k similar nodes
+SEARCH_MODES = ("hybrid", "semantic", "lexical")
+RANGE_MAX_RESULTS = int(os.getenv("KNOWMAP_RANGE_MAX_RESULTS", "10000"))  # matches kept per range query
+RANGE_PAGE_SIZE = 100
+RANGE_CACHE_SIZE = 32         # full match lists kept so later pages skip the search
+RANGE_INITIAL_K = 256         # ANN backends without range queries double k until the threshold is crossed
+RANGE_RESCORE_MARGIN = 0.05   # reduced-precision range search shortlists this far below the threshold
+EMBEDDING_PRECISION = os.getenv("KNOWMAP_EMBEDDING_PRECISION", "float32")  # 'float32', 'float16' or 'int8'
+EMBEDDING_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+RESCORE_FACTOR = 4     # reduced-precision search re-scores this many times top_k candidates in float32
+DEQUANTIZE_BLOCK = 65536
+# A sentence-transformers model name or a local model directory
+DEFAULT_MODEL_NAME = os.getenv("KNOWMAP_EMBEDDING_MODEL", 'all-MiniLM-L6-v2')
+REDUCE_DIM = int(os.getenv("KNOWMAP_REDUCE_DIM", "0"))       # 0 keeps the model's dimensionality
+REDUCE_METHOD = os.getenv("KNOWMAP_REDUCE_METHOD", "pca")     # 'pca' or 'random'
+REDUCE_FIT_SAMPLE = 50000
+
+# Versions are unique across engines so caches can key on the version alone
+_graph_versions = itertools.count(1)
+
+def load_embedding_model(model_name=DEFAULT_MODEL_NAME):
+    """Load the sentence encoder and its embedding cache; returns (model, cache)"""
+    try:
+        from sentence_transformers import SentenceTransformer
+        source = "local directory" if os.path.isdir(model_name) else "model hub"
+        print(f"Initializing semantic search model {model_name} ({source})...")
+        model = SentenceTransformer(model_name)
+        print("Semantic search model loaded")
+    except Exception as e:
+        print(f"Failed to load semantic search model: {e}")
+        return None, None
+
+    try:
+        cache = EmbeddingCache(model_name)
+    except Exception as e:
+        print(f"Embedding cache unavailable: {e}")
+        cache = None
+    return model, cache
+
+class VectorReducer:
+    """
+    Linear projection of normalized embeddings to fewer dimensions: PCA fitted on a sample of
+    the indexed vectors, or a fixed-seed Gaussian random projection. Outputs are re-normalized.
+    """
+
+    def __init__(self, method=REDUCE_METHOD, dim=REDUCE_DIM):
+        if method not in ("pca", "random"):
+            raise ValueError(f"Unknown reduction method '{method}'")
+        self.method = method
+        self.dim = dim
+        self.mean = None
+        self.components = None
+
+    @property
+    def signature(self):
+        return f"{self.method}-{self.dim}"
+
+    def fit(self, vectors):
+        rng = np.random.default_rng(42)
+        self.dim = min(self.dim, vectors.shape[1])
+        if self.method == "pca":
+            sample = vectors
+            if len(vectors) > REDUCE_FIT_SAMPLE:
+                sample = vectors[rng.choice(len(vectors), REDUCE_FIT_SAMPLE, replace=False)]
+            self.mean = sample.mean(axis=0).astype(np.float32)
+            _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+            self.dim = min(self.dim, len(vt))
+            self.components = np.ascontiguousarray(vt[:self.dim].T, dtype=np.float32)
+        else:
+            self.mean = np.zeros(vectors.shape[1], dtype=np.float32)
+            self.components = (rng.standard_normal((vectors.shape[1], self.dim)) / np.sqrt(self.dim)).astype(np.float32)
+        return self
+
+    def transform(self, vectors):
+        return normalize_rows((vectors - self.mean) @ self.components)
+
+QUERY_BATCH_WINDOW_MS = float(os.getenv("KNOWMAP_QUERY_BATCH_WINDOW_MS", "3"))  # 0 disables micro-batching
+QUERY_BATCH_MAX = int(os.getenv("KNOWMAP_QUERY_BATCH_MAX", "64"))
+
+class MicroBatchEncoder:
+    """
+    Funnels concurrent query encodes through one worker thread. Requests arriving within
+    window_ms of the first queued one (up to max_batch texts) share a single forward pass,
+    instead of many batch-size-1 passes competing for the same cores.
+    """
+
+    def __init__(self, model, window_ms=QUERY_BATCH_WINDOW_MS, max_batch=QUERY_BATCH_MAX):
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        self.worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+        self.worker.start()
+
+    def encode(self, texts):
+        """Raw (unnormalized) embeddings for texts, blocking until their batch has run"""
+        future = Future()
+        self.requests.put((list(texts), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+        try:
+            encoded = self.model.encode(unique, show_progress_bar=False, convert_to_numpy=True)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        rows = {text: row for row, text in enumerate(unique)}
+        for texts, future in batch:
+            future.set_result(encoded[[rows[text] for text in texts]])
+        self.batches += 1
+        self.texts += len(unique)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch": round(self.texts / self.batches, 2) if self.batches else 0
+        }
+
+ENCODE_PROCESSES = os.getenv("KNOWMAP_ENCODE_PROCESSES", "0")  # worker count, 'auto', or 0 to encode in-process
+PARALLEL_ENCODE_MIN = int(os.getenv("KNOWMAP_PARALLEL_ENCODE_MIN", "20000"))
+ENCODE_CHUNK_MIN = 1000
+
+def encode_worker(conn, model_name, index):
+    """Encode each list of texts received on conn with a private copy of the model"""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    if model.device.type == "cuda":
+        import torch
+        model.to(f"cuda:{int(index) % torch.cuda.device_count()}")
+    while True:
+        try:
+            texts = conn.recv()
+        except EOFError:
+            break
+        if texts is None:
+            break
+        try:
+            conn.send(model.encode(texts, show_progress_bar=False, convert_to_numpy=True))
+        except Exception as e:
+            conn.send(RuntimeError(f"encode worker {index}: {e}"))
+    conn.close()
+
+class ParallelEncoder:
+    """
+    Bulk encoding for index builds on worker processes that each load their own copy of the
+    model. Workers are started on first use and kept for later builds. Texts are sorted by
+    length so each chunk pads to a similar length, and every chunk is queued up front so
+    workers never wait on the caller.
+    """
+
+    def __init__(self, model_name, processes=ENCODE_PROCESSES):
+        self.model_name = model_name
+        self.processes = processes
+        self.pool = []
+        self.lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return len(self.pool)
+
+    def _start(self):
+        if str(self.processes) == "auto":
+            import torch
+            count = torch.cuda.device_count() or 4  # every GPU, else sentence-transformers' CPU default
+        else:
+            count = int(self.processes)
+        self.pool = [start_worker("encode", self.model_name, i) for i in range(max(1, count))]
+        atexit.register(self.stop)
+        print(f"Started encoding pool with {self.workers} workers")
+
+    def encode_chunks(self, texts):
+        """Yield (positions, raw embeddings) for chunks of texts, in the order workers finish them"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        with self.lock:
+            if not self.pool:
+                self._start()
+            chunk_size = max(ENCODE_CHUNK_MIN, -(-len(texts) // (self.workers * 4)))
+            pending = [order[start:start + chunk_size] for start in range(0, len(order), chunk_size)][::-1]
+            idle = [conn for _, conn in self.pool]
+            busy = {}
+            try:
+                while pending or busy:
+                    while pending and idle:
+                        conn = idle.pop()
+                        busy[conn] = pending.pop()
+                        conn.send([texts[i] for i in busy[conn]])
+                    for conn in wait(list(busy)):
+                        positions = busy.pop(conn)
+                        encoded = conn.recv()
+                        if isinstance(encoded, Exception):
+                            raise encoded
+                        idle.append(conn)
+                        yield np.asarray(positions, dtype=np.int64), encoded
+            except BaseException:
+                # Replies still in flight would be read by the next call; start over with fresh workers
+                if busy:
+                    self._stop()
+                raise
+
+    def encode(self, texts):
+        result = None
+        for positions, encoded in self.encode_chunks(texts):
+            if result is None:
+                result = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            result[positions] = encoded
+        return result
+
+    def _stop(self):
+        for process, conn in self.pool:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.pool = []
+
+    def stop(self):
+        with self.lock:
+            self._stop()
+
+def parse_search_filters(spec):
+    """
+    Validate a filters object ({min_degree, max_degree, relation, dataset}); relation and dataset
+    take a name or a list of names. Returns (hashable filter tuple or None, error message or None).
+    """
+    if not spec:
+        return None, None
+    if not isinstance(spec, dict):
+        return None, "filters must be an object"
+
+    unknown = set(spec) - {"min_degree", "max_degree", "relation", "dataset"}
+    if unknown:
+        return None, f"Unknown filters: {', '.join(sorted(unknown))}"
+
+    filters = {}
+    for field in ("min_degree", "max_degree"):
+        if spec.get(field) is not None:
+            if not isinstance(spec[field], int) or isinstance(spec[field], bool):
+                return None, f"{field} must be an integer"
+            filters[field] = spec[field]
+    for field in ("relation", "dataset"):
+        values = spec.get(field)
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else values
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            return None, f"{field} must be a string or a list of strings"
+        filters[field] = tuple(sorted(set(values)))
+    return (tuple(sorted(filters.items())) or None), None
+
+def parse_search_limits(top_k, min_score):
+    """
+    Validate a query's top_k (1..MAX_TOP_K) and min_score (-1..1).
+    Returns ((top_k, min_score) or None, error message or None).
+    """
+    try:
+        top_k, min_score = int(top_k), float(min_score)
+    except (TypeError, ValueError):
+        return None, "top_k and min_score must be numbers"
+    if not 1 <= top_k <= MAX_TOP_K:
+        return None, f"top_k must be between 1 and {MAX_TOP_K}"
+    if not -1.0 <= min_score <= 1.0:
+        return None, "min_score must be between -1 and 1"
+    return (top_k, min_score), None
+
+def parse_ann_effort(effort):
+    """Validate an optional ANN effort (1..MAX_ANN_EFFORT). Returns (effort or None, error message or None)."""
+    if effort is None:
+        return None, None
+    if isinstance(effort, bool) or not isinstance(effort, (int, str)):
+        return None, "ann_effort must be an integer"
+    try:
+        effort = int(effort)
+    except ValueError:
+        return None, "ann_effort must be an integer"
+    if not 1 <= effort <= MAX_ANN_EFFORT:
+        return None, f"ann_effort must be between 1 and {MAX_ANN_EFFORT}"
+    return effort, None
+
+class NodeFeatureIndex:
+    """
+    Row-aligned node features of the loaded graph: the degree of every row, plus (built on first
+    use) PageRank and the rows touching each relation and each dataset (edge 'dataset', else
+    'source' attribute). Filters combine these into a boolean row mask, cached per filter.
+    Kept for the life of the loaded graph: update() recomputes the nodes an edit touched, while
+    PageRank serves the last computed ranks and is recomputed in the background, warm-started
+    from them.
+    """
+
+    def __init__(self, graph, nodes, graph_lock=None):
+        self.graph = graph
+        self.graph_lock = graph_lock if graph_lock is not None else threading.RLock()
+        self.lock = threading.Lock()
+        self._ranks = None
+        self._ranks_stale = False
+        self._rank_job = None
+        self.refresh(nodes)
+
+    def refresh(self, nodes):
+        """Realign to the engine's rows from scratch, after they were renumbered or edited unseen"""
+        rows = {node: row for row, node in enumerate(nodes)}
+        degrees = np.zeros(len(nodes), dtype=np.int32)
+        with self.graph_lock:
+            for node, row in rows.items():
+                if node in self.graph:
+                    degrees[row] = self.graph.degree(node)
+        with self.lock:
+            self.rows, self.size, self.degrees = rows, len(nodes), degrees
+            self._members = None
+            self._invalidate()
+
+    def update(self, nodes, touched):
+        """
+        Follow rows appended since the last refresh and graph edits around the touched nodes,
+        recomputing degree and group membership for those nodes only
+        """
+        added = {node: row for row, node in enumerate(nodes[self.size:], self.size)}
+        changed = set(added) | {node for node in touched if node in self.rows}
+        with self.graph_lock:
+            degrees = {node: self.graph.degree(node) if node in self.graph else 0 for node in changed}
+            incident = {node: self._incident(node) for node in changed} if self._members is not None else None
+        with self.lock:
+            self.rows.update(added)
+            if added:
+                self.degrees = np.concatenate([self.degrees, np.zeros(len(added), dtype=np.int32)])
+                self.size = len(self.degrees)
+            for node, degree in degrees.items():
+                self.degrees[self.rows[node]] = degree
+            if incident is not None and self._members is not None:
+                for node, edges in incident.items():
+                    row = self.rows[node]
+                    for key in self._row_groups.pop(row, ()):
+                        self._members[key].discard(row)
+                        self._arrays.pop(key, None)
+                    for data in edges:
+                        for key in self._edge_groups(data):
+                            self._join(key, row)
+            self._invalidate()
+
+    def _invalidate(self):
+        self._arrays = {}
+        self._centrality = {}
+        self.masks = LRUCache(FILTER_MASK_CACHE_SIZE)
+        self._ranks_stale = self._ranks is not None
+
+    def _incident(self, node):
+        if node not in self.graph:
+            return []
+        if self.graph.is_directed():
+            edges = list(self.graph.out_edges(node, data=True)) + list(self.graph.in_edges(node, data=True))
+        else:
+            edges = list(self.graph.edges(node, data=True))
+        return [data for _, _, data in edges]
+
+    @staticmethod
+    def _edge_groups(data):
+        relation = data.get("relation") or data.get("label")
+        dataset = data.get("dataset") or data.get("source")
+        if relation is not None:
+            yield ("relation", str(relation))
+        if dataset is not None:
+            yield ("dataset", str(dataset))
+
+    def _join(self, key, row):
+        self._members.setdefault(key, set()).add(row)
+        self._row_groups.setdefault(row, set()).add(key)
+        self._arrays.pop(key, None)
+
+    def memory_bytes(self):
+        total = self.degrees.nbytes + sum(values.nbytes for values in self._centrality.values())
+        return total + sum(rows.nbytes for rows in self._arrays.values())
+
+    def group_rows(self, field, name):
+        """Rows touching a relation or dataset name, or None"""
+        with self.lock:
+            if self._members is None:
+                with self.graph_lock:
+                    edges = list(self.graph.edges(data=True))
+                self._members, self._row_groups = {}, {}
+                for u, v, data in edges:
+                    for key in self._edge_groups(data):
+                        for node in (u, v):
+                            row = self.rows.get(node)
+                            if row is not None:
+                                self._join(key, row)
+            key = (field, name)
+            rows = self._arrays.get(key)
+            if rows is None and self._members.get(key):
+                rows = self._arrays[key] = np.fromiter(self._members[key], dtype=np.int64)
+            return rows
+
+    def _pagerank(self, previous=None):
+        # Ranked on a copy so edits are not blocked for the length of the computation
+        with self.graph_lock:
+            snapshot = self.graph.copy()
+        return nx.pagerank(snapshot, nstart=previous)
+
+    def _refresh_ranks(self):
+        try:
+            ranks = self._pagerank(self._ranks)
+        except Exception as e:
+            print(f"PageRank refresh failed: {e}")
+            return
+        with self.lock:
+            self._ranks = ranks
+            self._centrality.pop("pagerank", None)
+
+    def ranks(self):
+        """PageRank per node: computed on first use, then refreshed in the background after edits"""
+        with self.lock:
+            if self._ranks is None:
+                self._ranks = self._pagerank()
+            elif self._ranks_stale and (self._rank_job is None or not self._rank_job.is_alive()):
+                self._ranks_stale = False
+                self._rank_job = threading.Thread(target=self._refresh_ranks, name="pagerank", daemon=True)
+                self._rank_job.start()
+            return self._ranks
+
+    def centrality(self, kind):
+        """Per-row importance scaled to [0, 1]: log-scaled degree, or PageRank"""
+        values = self._centrality.get(kind)
+        if values is None:
+            if kind == "degree":
+                values = np.log1p(self.degrees.astype(np.float32))
+            else:
+                ranks = self.ranks()
+                values = np.zeros(self.size, dtype=np.float32)
+                for node, row in self.rows.items():
+                    values[row] = ranks.get(node, 0.0)
+            top = values.max() if self.size else 0
+            values = values / top if top > 0 else values
+            self._centrality[kind] = values
+        return values
+
+    def mask(self, filters):
+        cached = self.masks.get(filters)
+        if cached is not None:
+            return cached
+
+        mask = np.ones(self.size, dtype=bool)
+        for field, value in filters:
+            if field == "min_degree":
+                mask &= self.degrees >= value
+            elif field == "max_degree":
+                mask &= self.degrees <= value
+            else:
+                selected = np.zeros(self.size, dtype=bool)
+                for name in value:
+                    rows = self.group_rows(field, name)
+                    if rows is not None:
+                        selected[rows] = True
+                mask &= selected
+        self.masks.put(filters, mask)
+        return mask
+
+def triple_text(e1, relation, e2):
+    return f"{e1} {str(relation).replace('_', ' ')} {e2}"
+
+def verbalize_triples(graph):
+    """Map 'entity1 relation entity2' sentences to the (entity1, relation, entity2) edges they describe"""
+    texts = {}
+    for e1, e2, data in graph.edges(data=True):
+        relation = data.get("relation") or data.get("label") or "related_to"
+        texts.setdefault(triple_text(e1, relation, e2), []).append((e1, relation, e2))
+    return texts
+
+class SemanticSearchEngine:
+    def __init__(self, model=None, model_name=DEFAULT_MODEL_NAME, embedding_cache=None, query_cache=None,
+                 precision=EMBEDDING_PRECISION, query_encoder=None, bulk_encoder=None,
+                 reduce_dim=REDUCE_DIM, reduce_method=REDUCE_METHOD):
+        if precision not in EMBEDDING_DTYPES:
+            print(f"Unknown embedding precision '{precision}', using float32")
+            precision = "float32"
+        self.model = model
+        self.precision = precision
+        self.scale = None
+        self.reduce_dim = reduce_dim
+        self.reduce_method = reduce_method
+        self.reducer = None
+        self.node_embeddings = None
+        self.nodes = None
+        self.node_rows = {}
+        self.alive = None
+        self.tombstones = 0
+        self.graph = None
+        self.source = None
+        self.ann_index = None
+        self.lexical = None
+        self._buffer = None
+        self._alive_buffer = None
+        self.model_name = model_name
+        self.embedding_cache = embedding_cache
+        self.query_cache = query_cache if query_cache is not None else LRUCache(QUERY_CACHE_SIZE)
+        self.query_encoder = query_encoder
+        self.bulk_encoder = bulk_encoder
+        self.build_stats = None
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE)
+        self.subgraph_cache = LRUCache(SUBGRAPH_CACHE_SIZE)
+        self.range_cache = LRUCache(RANGE_CACHE_SIZE)
+        self.version = next(_graph_versions)
+        self._communities = None
+        self._community_lock = threading.Lock()
+        self._triples = None
+        self._features = None
+        # Nodes whose features changed since they were last refreshed; None if unknown
+        self._touched = set()
+        self.row_epoch = 0
+        self._neighbors = None
+        self._neighbor_job = None
+        self._lock = threading.RLock()
+        # Held while reading self.graph; the shared KB graph's own lock, since edits mutate it in place
+        self.graph_lock = threading.RLock()
+        if self.model is None:
+            self.model, self.embedding_cache = load_embedding_model(model_name)
+
+    def bump_version(self):
+        self.version = next(_graph_versions)
+        self.result_cache.clear()
+        self.subgraph_cache.clear()
+        self.range_cache.clear()
+
+    def memory_bytes(self):
+        """Resident size of the index arrays (embeddings, liveness mask and ANN structures)"""
+        total = 0
+        if self._buffer is not None:
+            total += self._buffer.nbytes
+        if self._alive_buffer is not None:
+            total += self._alive_buffer.nbytes
+        if self.ann_index is not None:
+            total += self.ann_index.memory_bytes()
+        if self.lexical is not None:
+            total += self.lexical.memory_bytes()
+        if self._triples is not None:
+            total += self._triples[1].memory_bytes()
+        if self._features is not None:
+            total += self._features[1].memory_bytes()
+        if self._neighbors is not None:
+            total += self._neighbors[1].nbytes + self._neighbors[2].nbytes
+        return total
+
+    def graph_memory_bytes(self):
+        """Rough resident size of the networkx graph the index was built from"""
+        if self.graph is None:
+            return 0
+        with self.graph_lock:
+            return (self.graph.number_of_nodes() * GRAPH_NODE_BYTES +
+                    self.graph.number_of_edges() * GRAPH_EDGE_BYTES)
+
+    def encode_texts(self, texts):
+        """Normalized float32 embeddings, reusing cached vectors for previously seen texts"""
+        def encode(batch):
+            if self.bulk_encoder is not None and len(batch) >= PARALLEL_ENCODE_MIN:
+                return self.bulk_encoder.encode(batch)
+            return self.model.encode(batch, show_progress_bar=False, convert_to_numpy=True)
+
+        if self.embedding_cache is not None:
+            return self.embedding_cache.get(texts, encode)
+        return normalize_rows(encode(texts))
+
+    def _project(self, vectors):
+        """Model-space vectors into the index's (possibly reduced) vector space"""
+        return self.reducer.transform(vectors) if self.reducer is not None else vectors
+
+    @property
+    def space(self):
+        """Identifies the vector space for persisted ANN indexes"""
+        return f"{self.model_name}|{self.reducer.signature if self.reducer is not None else 'full'}"
+
+    def _quantize(self, vectors):
+        """Convert normalized float32 vectors to the storage precision"""
+        if self.precision == "float16":
+            return vectors.astype(np.float16)
+        if self.precision == "int8":
+            if self.scale is None:
+                # Per-dimension symmetric scale, fixed at build time; later rows are clipped to it
+                self.scale = (np.maximum(np.abs(vectors).max(axis=0), 1e-6) / 127).astype(np.float32)
+            return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+        return vectors
+
+    def _dequantize(self, stored):
+        vectors = stored.astype(np.float32)
+        return vectors * self.scale if self.scale is not None else vectors
+
+    @property
+    def sharded(self):
+        return isinstance(self.ann_index, ShardedIndex)
+
+    @property
+    def dim(self):
+        if self._buffer is not None:
+            return self._buffer.shape[1]
+        return self.ann_index.dim if self.sharded else 0
+
+    def _stored(self, rows):
+        """Stored vectors of rows; a sharded index keeps them in its shards only"""
+        if self._buffer is None and self.sharded:
+            return self.ann_index.fetch(rows)
+        return self.node_embeddings[rows]
+
+    def _score_matrix(self, query_vectors, embeddings):
+        """(queries x rows) similarity scores against stored, possibly reduced-precision embeddings"""
+        if embeddings.dtype == np.float32:
+            return query_vectors @ embeddings.T
+        if self.scale is not None:
+            query_vectors = query_vectors * self.scale
+        scores = np.empty((len(query_vectors), len(embeddings)), dtype=np.float32)
+        for start in range(0, len(embeddings), DEQUANTIZE_BLOCK):
+            block = embeddings[start:start + DEQUANTIZE_BLOCK].astype(np.float32)
+            scores[:, start:start + len(block)] = query_vectors @ block.T
+        return scores
+
+    def _rescore(self, nodes, query_vector, indices, k):
+        """Exact float32 re-ranking of reduced-precision candidates using the embedding cache"""
+        exact = self.embedding_cache.lookup([str(nodes[i]) for i in indices]) if self.embedding_cache else None
+        if exact is None:
+            return None
+        scores = self._project(exact) @ query_vector
+        top = top_k_indices(scores, k)
+        return indices[top], scores[top]
+
+    def build_index(self, graph, index_path=None, neighbors=KNN_BACKGROUND, graph_lock=None):
+        """
+        Build semantic index from graph nodes (ANN index persisted next to index_path if given).
+        Pass graph_lock when another thread edits graph in place; reads of the graph then hold it.
+        """
+        if self.model is None:
+            print("Cannot build index: model not loaded")
+            return 0
+
+        with self._lock:
+            self.graph = graph
+            self.graph_lock = graph_lock if graph_lock is not None else threading.RLock()
+            self.source = index_path
+            if self._triples is not None:
+                self._triples[1].close()
+            self._triples = None
+            with self.graph_lock:
+                nodes = list(graph.nodes())
+            count = self.build_rows(nodes, index_path)
+            if count and neighbors:
+                self.schedule_neighbors()
+            return count
+
+    def close(self):
+        """Release worker processes held by the ANN index (sharded search) and the triple index"""
+        with self._lock:
+            if self.ann_index is not None and hasattr(self.ann_index, "close"):
+                self.ann_index.close()
+            self.ann_index = None
+            if self._triples is not None:
+                self._triples[1].close()
+
+    def build_rows(self, items, index_path=None, kind="nodes"):
+        """Index arbitrary items by their string form, encoding INDEX_BATCH_SIZE items at a time"""
+        with self._lock:
+            if self.ann_index is not None and hasattr(self.ann_index, "close"):
+                self.ann_index.close()
+            self.ann_index = None
+            self.lexical = None
+            self.scale = None
+            self.reducer = None
+            self._set_rows(items, None)
+            self.bump_version()
+
+            print(f"Building semantic index for {len(self.nodes)} {kind}...")
+
+            if not self.nodes:
+                print(f"No {kind} to index")
+                return 0
+
+            try:
+                # Stored L2-normalized so cosine similarity is a single matrix-vector product.
+                # Batches bound the float32 working set; an int8 scale is fixed by the first batch.
+                texts = [str(item) for item in self.nodes]
+                stored = None
+                start_time = time.perf_counter()
+                parallel = self.bulk_encoder is not None and len(texts) >= PARALLEL_ENCODE_MIN
+                if parallel and self.embedding_cache is not None:
+                    # Queue every cache miss on the pool at once; the batches below then read the cache
+                    try:
+                        self.embedding_cache.fill(texts, self.bulk_encoder.encode_chunks)
+                    except Exception as e:
+                        print(f"Parallel encoding failed, encoding per batch: {e}")
+                for start in range(0, len(texts), INDEX_BATCH_SIZE):
+                    vectors = self.encode_texts(texts[start:start + INDEX_BATCH_SIZE])
+                    if self.reducer is None and 0 < self.reduce_dim < vectors.shape[1]:
+                        # Like the int8 scale, the projection is fitted on the first batch
+                        self.reducer = VectorReducer(self.reduce_method, self.reduce_dim).fit(vectors)
+                    vectors = self._project(vectors)
+                    if stored is None:
+                        stored = np.empty((len(texts), vectors.shape[1]), dtype=EMBEDDING_DTYPES[self.precision])
+                    stored[start:start + len(vectors)] = self._quantize(vectors)
+                elapsed = time.perf_counter() - start_time
+                workers = self.bulk_encoder.workers if parallel else 0
+                self.build_stats = {
+                    "kind": kind,
+                    "items": len(texts),
+                    "encode_seconds": round(elapsed, 2),
+                    "items_per_second": round(len(texts) / elapsed, 1) if elapsed > 0 else None,
+                    "encoder": f"multi-process ({workers} workers)" if workers else "in-process"
+                }
+                print(f"Encoded {len(texts)} {kind} in {elapsed:.2f}s "
+                      f"({self.build_stats['items_per_second']} {kind}/sec, {self.build_stats['encoder']})")
+                self._set_rows(self.nodes, stored)
+                self._build_lexical()
+
+                try:
+                    vectors = stored if stored.dtype == np.float32 else self._dequantize(stored)
+                    self.ann_index = build_ann_index(vectors, self.nodes, index_path, salt=self.space)
+                    if self.ann_index is not None:
+                        self.ann_index.attach(self.node_embeddings, self.scale)
+                    if self.sharded:
+                        # The shards now hold the only copy of the rows
+                        self._buffer = None
+                        self._publish()
+                except Exception as e:
+                    print(f"ANN index unavailable, using exact search: {e}")
+                    self.ann_index = None
+
+                print(f"Semantic index built with {len(self.nodes)} {kind}")
+                return len(self.nodes)
+
+            except Exception as e:
+                print(f"Error building semantic index: {e}")
+                self._set_rows([], None)
+                return 0
+
+    def _build_lexical(self):
+        self.lexical = LexicalIndex([str(node) for node in self.nodes]) if HYBRID_LEXICAL_WEIGHT > 0 else None
+
+    @property
+    def node_count(self):
+        return len(self.node_rows)
+
+    @property
+    def triple_count(self):
+        return self._triples[1].node_count if self._triples is not None else 0
+
+    def _set_rows(self, nodes, embeddings):
+        """Replace the index contents with exactly these rows (no tombstones, no spare capacity)"""
+        # Rows are renumbered, so precomputed neighbor rows no longer apply
+        self.row_epoch += 1
+        self.nodes = list(nodes)
+        self.node_rows = {node: row for row, node in enumerate(self.nodes)}
+        self.tombstones = 0
+        self._buffer = embeddings
+        self._alive_buffer = np.ones(len(self.nodes), dtype=bool)
+        self._publish()
+
+    def _publish(self):
+        size = len(self.nodes)
+        self.node_embeddings = self._buffer[:size] if self._buffer is not None else None
+        self.alive = self._alive_buffer[:size]
+
+    def _ensure_capacity(self, size, dim):
+        if self._alive_buffer is not None and len(self._alive_buffer) >= size:
+            return
+        capacity = max(size, int(len(self._alive_buffer) * 1.5) if self._alive_buffer is not None else 0, 1024)
+        used = len(self.nodes)
+        alive = np.zeros(capacity, dtype=bool)
+        if self._alive_buffer is not None:
+            alive[:used] = self._alive_buffer[:used]
+        self._alive_buffer = alive
+        if not self.sharded:
+            buffer = np.zeros((capacity, dim), dtype=EMBEDDING_DTYPES[self.precision])
+            if self._buffer is not None and used:
+                buffer[:used] = self._buffer[:used]
+            self._buffer = buffer
+
+    def add_nodes(self, nodes):
+        """Embed and index nodes that are not indexed yet; returns how many were added"""
+        if self.model is None or self.nodes is None:
+            return 0
+
+        with self._lock:
+            new_nodes = [node for node in dict.fromkeys(nodes) if node not in self.node_rows]
+            if not new_nodes:
+                return 0
+
+            vectors = self._project(self.encode_texts([str(node) for node in new_nodes]))
+            stored = self._quantize(vectors)
+            start = len(self.nodes)
+            self._ensure_capacity(start + len(new_nodes), vectors.shape[1])
+            if self._buffer is not None:
+                self._buffer[start:start + len(new_nodes)] = stored
+            self._alive_buffer[start:start + len(new_nodes)] = True
+            rows = list(range(start, start + len(new_nodes)))
+            self.nodes.extend(new_nodes)
+            self.node_rows.update(zip(new_nodes, rows))
+            self._publish()
+
+            if self.sharded:
+                self.ann_index.add(rows, stored)
+            elif self.ann_index is not None:
+                self.ann_index.attach(self.node_embeddings, self.scale)
+                self.ann_index.add(rows, vectors)
+            if self.lexical is not None:
+                self.lexical.add(rows, [str(node) for node in new_nodes])
+
+            # Edges that came with the nodes are not known here
+            self._touched = None
+            self.bump_version()
+            return len(new_nodes)
+
+    def remove_nodes(self, nodes):
+        """Tombstone indexed nodes; storage is reclaimed by compact() once enough pile up"""
+        if self.nodes is None:
+            return 0
+
+        with self._lock:
+            rows = [self.node_rows.pop(node) for node in dict.fromkeys(nodes) if node in self.node_rows]
+            if not rows:
+                return 0
+
+            self._alive_buffer[rows] = False
+            self.tombstones += len(rows)
+            if self.ann_index is not None:
+                self.ann_index.remove(rows)
+            if self.lexical is not None:
+                self.lexical.remove(rows)
+
+            self._touched = None
+            self.bump_version()
+            if self.tombstones > COMPACT_TOMBSTONE_RATIO * len(self.nodes):
+                self.compact()
+            return len(rows)
+
+    def compact(self):
+        """Drop tombstoned rows and renumber the remaining ones"""
+        with self._lock:
+            if not self.tombstones:
+                return
+            keep = np.flatnonzero(self.alive)
+            print(f"Compacting semantic index: dropping {self.tombstones} tombstones")
+            stored = np.ascontiguousarray(self.node_embeddings[keep]) if self._buffer is not None else None
+            self._set_rows([self.nodes[row] for row in keep], stored)
+            if self.lexical is not None:
+                self._build_lexical()
+
+            if self.ann_index is not None:
+                index = self.ann_index.compact(keep)
+                if index is None:
+                    index = build_ann_index(self._dequantize(self.node_embeddings), self.nodes, salt=self.space)
+                if index is not None:
+                    index.attach(self.node_embeddings, self.scale)
+                self.ann_index = index
+            self.bump_version()
+
+    def sync_graph(self, graph):
+        """Point the index at a new version of the loaded graph, embedding only nodes that changed"""
+        with self._lock:
+            self.graph = graph
+            with self.graph_lock:
+                removed = [node for node in self.node_rows if node not in graph]
+                nodes = list(graph.nodes())
+            self.remove_nodes(removed)
+            added = self.add_nodes(nodes)
+            self._touched = None
+            self.bump_version()
+            print(f"Semantic index synced: +{added} / -{len(removed)} nodes")
+            return self.node_count
+
+    def apply_graph_change(self, change):
+        """
+        Follow an in-place edit of the loaded graph, given the change dict of
+        KnowledgeBaseGraph.apply(): index added nodes, tombstone orphaned ones, and apply the
+        triple delta to a built triple index instead of re-verbalizing every edge.
+        """
+        with self._lock:
+            triples = self._triples
+            current = triples is not None and triples[0] == self.version
+            touched = self._touched
+            self.remove_nodes(change["removed_nodes"])
+            self.add_nodes(change["added_nodes"])
+            if touched is not None:
+                # Only the endpoints of changed triples need their node features recomputed
+                touched.update(node for triple in change["added_triples"] + change["removed_triples"]
+                               for node in (triple[1], triple[3]))
+            self._touched = touched
+            # Edge-only changes still alter neighbourhoods and communities
+            self.bump_version()
+            if not current:
+                # Not built, or already behind: get_triple_index() resyncs it from the graph
+                return
+
+            _, engine, texts, keys = triples
+            removed, added = [], []
+            for triple_id, e1, rel, e2 in change["removed_triples"]:
+                if triple_id not in keys:
+                    continue
+                keys.discard(triple_id)
+                text = triple_text(e1, rel, e2)
+                # Lists are replaced, not mutated, so concurrent readers see either version
+                edges = list(texts.get(text, ()))
+                if (e1, rel, e2) in edges:
+                    edges.remove((e1, rel, e2))
+                if edges:
+                    texts[text] = edges
+                elif texts.pop(text, None) is not None:
+                    removed.append(text)
+            for triple_id, e1, rel, e2 in change["added_triples"]:
+                if triple_id in keys:
+                    continue
+                keys.add(triple_id)
+                text = triple_text(e1, rel, e2)
+                if text not in texts:
+                    added.append(text)
+                texts[text] = texts.get(text, []) + [(e1, rel, e2)]
+            engine.remove_nodes(removed)
+            engine.add_nodes(added)
+            self._triples = (self.version, engine, texts, keys)
+
+    def is_ready(self):
+        return (self.model is not None and
+                bool(self.nodes) and
+                (self.node_embeddings is not None or self.sharded))
+
+    def encode_queries(self, queries):
+        """Normalized query embeddings; repeated queries are served from the LRU cache"""
+        keys = [(self.model_name, normalize_text(query)) for query in queries]
+        vectors = [self.query_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+
+        if missing:
+            texts = [text for _, text in missing]
+            if self.query_encoder is not None:
+                encoded = normalize_rows(self.query_encoder.encode(texts))
+            else:
+                encoded = normalize_rows(self.model.encode(texts, show_progress_bar=False, convert_to_numpy=True))
+            fresh = dict(zip(missing, encoded))
+            for key, vector in fresh.items():
+                self.query_cache.put(key, vector)
+            vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+        return np.vstack(vectors).astype(np.float32, copy=False)
+
+    def _top_candidates(self, query_vectors, top_ks, effort=None, mask=None):
+        """(row indices, scores) of the best rows for each query vector, restricted to mask if given"""
+        nodes, embeddings, alive, ann_index = self.nodes, self.node_embeddings, self.alive, self.ann_index
+        subset = None
+        if mask is None:
+            mask = alive if self.tombstones else None
+        elif not isinstance(ann_index, ShardedIndex):
+            # Selective filters are cheaper to score directly over the matching rows
+            selected = np.flatnonzero(mask)
+            limit = FILTER_ANN_SUBSET_FRACTION if ann_index is not None else FILTER_SUBSET_FRACTION
+            if len(selected) <= limit * len(nodes):
+                subset, ann_index = selected, None
+
+        # Reduced-precision scores only shortlist; the shortlist is re-scored in float32
+        reduced = self.precision != "float32" and not isinstance(ann_index, HNSWIndex)
+        fetch_ks = [max(k * RESCORE_FACTOR, k + 10) for k in top_ks] if reduced else list(top_ks)
+
+        if isinstance(ann_index, ShardedIndex):
+            candidates = ann_index.search_batch(query_vectors, fetch_ks, mask)
+        elif ann_index is not None:
+            effort = effort or ANN_EFFORT or None
+            candidates = [ann_index.search(vector, k, effort, mask=mask) for vector, k in zip(query_vectors, fetch_ks)]
+        else:
+            rows = embeddings if subset is None else embeddings[subset]
+            # Score queries in chunks so the (queries x nodes) score matrix stays bounded
+            chunk = max(1, EXACT_SCORE_BLOCK // max(1, len(rows)))
+            candidates = []
+            for start in range(0, len(query_vectors), chunk):
+                scores = self._score_matrix(query_vectors[start:start + chunk], rows)
+                if mask is not None and subset is None:
+                    scores[:, ~mask] = -np.inf
+                for row, k in zip(scores, fetch_ks[start:start + chunk]):
+                    top = top_k_indices(row, k)
+                    candidates.append((top if subset is None else subset[top], row[top]))
+
+        if reduced:
+            for i, (vector, k) in enumerate(zip(query_vectors, top_ks)):
+                indices, scores = candidates[i]
+                indices, scores = indices[np.isfinite(scores)], scores[np.isfinite(scores)]
+                candidates[i] = self._rescore(nodes, vector, indices, k) or (indices[:k], scores[:k])
+        return candidates
+
+    def precision_report(self, k=10, sample_queries=100, sample_nodes=20000):
+        """
+        Memory saved by the storage precision and its recall@k against float32, on a node sample.
+        Raises ValueError unless 1 <= k <= MAX_REPORT_K.
+        """
+        if not 1 <= k <= MAX_REPORT_K:
+            raise ValueError(f"k must be between 1 and {MAX_REPORT_K}")
+        if not self.is_ready():
+            return None
+
+        alive_rows = np.flatnonzero(self.alive)
+        rng = np.random.default_rng(42)
+        subset = rng.choice(alive_rows, size=min(len(alive_rows), sample_nodes), replace=False)
+        exact = self.embedding_cache.lookup([str(self.nodes[row]) for row in subset]) if self.embedding_cache else None
+        if exact is not None:
+            exact = self._project(exact)
+        elif self.precision == "float32":
+            exact = self._stored(subset)
+        if exact is None:
+            return {"error": "float32 reference vectors unavailable (embedding cache disabled)"}
+
+        # Queries are blends of two random nodes, so they rarely coincide with a stored vector
+        pairs = rng.integers(0, len(subset), size=(min(sample_queries, len(subset)), 2))
+        queries = normalize_rows(exact[pairs[:, 0]] + exact[pairs[:, 1]])
+        k = min(k, len(subset))
+        stored = self._stored(subset)
+        true_scores = queries @ exact.T
+        approx_scores = self._score_matrix(queries, stored)
+
+        hits_approx = hits_rescored = 0
+        for true_row, approx_row in zip(true_scores, approx_scores):
+            truth = set(top_k_indices(true_row, k).tolist())
+            hits_approx += len(truth & set(top_k_indices(approx_row, k).tolist()))
+            shortlist = top_k_indices(approx_row, max(k * RESCORE_FACTOR, k + 10))
+            rescored = shortlist[top_k_indices(true_row[shortlist], k)]
+            hits_rescored += len(truth & set(rescored.tolist()))
+
+        rows, dim = len(self.nodes), self.dim
+        float32_bytes = rows * dim * 4
+        stored_bytes = (rows * dim * np.dtype(EMBEDDING_DTYPES[self.precision]).itemsize +
+                        (self.scale.nbytes if self.scale is not None else 0))
+        return {
+            "precision": self.precision,
+            "nodes": int(rows),
+            "dimensions": int(dim),
+            "embedding_memory_mb": round(stored_bytes / 1024 / 1024, 2),
+            "float32_memory_mb": round(float32_bytes / 1024 / 1024, 2),
+            "memory_saved_mb": round((float32_bytes - stored_bytes) / 1024 / 1024, 2),
+            "k": int(k),
+            "sampled_nodes": int(len(subset)),
+            "sampled_queries": int(len(queries)),
+            "recall_at_k": round(hits_approx / (len(queries) * k), 4),
+            "recall_at_k_rescored": round(hits_rescored / (len(queries) * k), 4)
+        }
+
+    def get_node_features(self):
+        """Degree / centrality / relation / dataset features of the current rows, refreshed once per graph version"""
+        if self.graph is None or self.nodes is None:
+            return None
+        with self._lock:
+            if self._features is None or self._features[1].graph is not self.graph:
+                features = NodeFeatureIndex(self.graph, self.nodes, self.graph_lock)
+            else:
+                version, features, epoch = self._features
+                if version == self.version:
+                    return features
+                if self._touched is None or epoch != self.row_epoch:
+                    features.refresh(self.nodes)
+                else:
+                    features.update(self.nodes, self._touched)
+            self._touched = set()
+            self._features = (self.version, features, self.row_epoch)
+            return features
+
+    def filter_mask(self, filters):
+        """Boolean row mask of live rows matching filters (see parse_search_filters), or None"""
+        if not filters:
+            return None
+        mask = self.get_node_features().mask(filters)
+        return mask & self.alive if self.tombstones else mask
+
+    def _lexical_fast_path(self, query, k, mask=None):
+        """Lexical-only results for identifier-like queries that exactly match a node label"""
+        lexical = self.lexical
+        if lexical is None or not looks_like_identifier(query):
+            return None
+        exact = lexical.exact_rows(query)
+        if not any(mask is None or mask[row] for row in exact):
+            return None
+        return lexical.search(query, k, mask)
+
+    def _fuse(self, query, query_vector, candidates, k, mask=None):
+        """
+        Blend semantic candidates with lexical matches. A lexical score lifts the semantic score
+        towards 1 (fused = s + w * l * (1 - s)), so pure semantic hits keep their score;
+        exact label matches always score 1.
+        """
+        lexical = self.lexical
+        if lexical is None:
+            return candidates
+        lex_rows, lex_scores = lexical.search(query, k, mask)
+        if not len(lex_rows):
+            return candidates
+
+        indices, scores = candidates
+        finite = np.isfinite(scores)
+        semantic = dict(zip(indices[finite].tolist(), scores[finite].tolist()))
+        missing = [row for row in lex_rows.tolist() if row not in semantic]
+        if missing:
+            extra = self._score_matrix(query_vector[None, :], self._stored(missing))[0]
+            semantic.update(zip(missing, extra.tolist()))
+
+        lex = dict(zip(lex_rows.tolist(), lex_scores.tolist()))
+        rows = np.fromiter(semantic.keys(), dtype=np.int64, count=len(semantic))
+        sem = np.fromiter(semantic.values(), dtype=np.float32, count=len(semantic))
+        lex = np.array([lex.get(row, 0.0) for row in semantic], dtype=np.float32)
+        fused = sem + HYBRID_LEXICAL_WEIGHT * lex * (1 - np.clip(sem, 0, 1))
+        fused[lex >= 1.0] = 1.0
+        top = top_k_indices(fused, k)
+        return rows[top], fused[top]
+
+    def mode_used(self, mode):
+        """
+        The mode a search in mode actually runs in. Without a lexical index (KNOWMAP_LEXICAL_WEIGHT=0)
+        hybrid search is purely semantic, and lexical search raises ValueError.
+        """
+        if mode == "semantic" or self.lexical is not None:
+            return mode
+        if mode == "lexical":
+            raise ValueError("lexical search is disabled (KNOWMAP_LEXICAL_WEIGHT=0)")
+        return "semantic"
+
+    def _search_candidates(self, queries, top_ks, effort=None, mode="hybrid", filters=None):
+        """(row indices, scores) per query for the given search mode and filters"""
+        mode = self.mode_used(mode)
+        mask = self.filter_mask(filters)
+        candidates = [None] * len(queries)
+        if mode != "semantic":
+            for i, (query, k) in enumerate(zip(queries, top_ks)):
+                if mode == "lexical":
+                    candidates[i] = self.lexical.search(query, k, mask)
+                else:
+                    candidates[i] = self._lexical_fast_path(query, k, mask)
+
+        pending = [i for i, found in enumerate(candidates) if found is None]
+        if pending:
+            query_vectors = self._project(self.encode_queries([queries[i] for i in pending]))
+            semantic = self._top_candidates(query_vectors, [top_ks[i] for i in pending], effort, mask)
+            for i, vector, found in zip(pending, query_vectors, semantic):
+                candidates[i] = self._fuse(queries[i], vector, found, top_ks[i], mask) if mode == "hybrid" else found
+        return candidates
+
+    def reduction_benchmark(self, dims=(256, 128, 64), methods=("pca", "random"), k=10,
+                            sample_queries=100, sample_nodes=20000):
+        """
+        Recall@k, exact-search latency and index memory of reduced-dimension variants against the
+        model's full vectors, on a node sample; memory is projected to the whole index.
+        Raises ValueError unless 1 <= k <= MAX_REPORT_K and every dim is within the model's.
+        """
+        if not 1 <= k <= MAX_REPORT_K:
+            raise ValueError(f"k must be between 1 and {MAX_REPORT_K}")
+        if not self.is_ready():
+            return None
+
+        alive_rows = np.flatnonzero(self.alive)
+        rng = np.random.default_rng(42)
+        subset = rng.choice(alive_rows, size=min(len(alive_rows), sample_nodes), replace=False)
+        texts = [str(self.nodes[row]) for row in subset]
+        full = self.encode_texts(texts)
+        model_dim = full.shape[1]
+        if any(not 1 <= dim <= model_dim for dim in dims):
+            raise ValueError(f"dims must be between 1 and {model_dim}")
+
+        start = time.perf_counter()
+        self.model.encode(texts[:64], show_progress_bar=False, convert_to_numpy=True)
+        encode_ms = (time.perf_counter() - start) * 1000 / min(64, len(texts))
+
+        pairs = rng.integers(0, len(subset), size=(min(sample_queries, len(subset)), 2))
+        queries = normalize_rows(full[pairs[:, 0]] + full[pairs[:, 1]])
+        k = min(k, len(subset))
+        truth = [set(top_k_indices(row, k).tolist()) for row in queries @ full.T]
+
+        bytes_per_value = np.dtype(EMBEDDING_DTYPES[self.precision]).itemsize
+        configs = [("none", model_dim)] + [(m, d) for m in methods for d in dims if 0 < d < model_dim]
+        report = []
+        for method, dim in configs:
+            if method == "none":
+                vectors, query_vectors = full, queries
+            else:
+                reducer = VectorReducer(method, dim).fit(full)
+                vectors, query_vectors = reducer.transform(full), reducer.transform(queries)
+
+            start = time.perf_counter()
+            found = [set(top_k_indices(row, k).tolist()) for row in query_vectors @ vectors.T]
+            search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            report.append({
+                "method": method,
+                "dimensions": int(vectors.shape[1]),
+                "recall_at_k": round(sum(len(t & f) for t, f in zip(truth, found)) / (len(truth) * k), 4),
+                "search_ms_per_query": round(search_ms * self.node_count / len(subset), 3),
+                "memory_mb": round(self.node_count * vectors.shape[1] * bytes_per_value / 1024 / 1024, 2)
+            })
+
+        return {
+            "model": self.model_name,
+            "model_dimensions": int(model_dim),
+            "active_reduction": self.reducer.signature if self.reducer is not None else None,
+            "precision": self.precision,
+            "encode_ms_per_text": round(encode_ms, 3),
+            "nodes": self.node_count,
+            "sampled_nodes": int(len(subset)),
+            "sampled_queries": int(len(queries)),
+            "k": int(k),
+            "configurations": report
+        }
+
+    def _format_results(self, nodes, top_indices, top_scores, min_score, ranking="similarity", top_k=None):
+        """
+        Result dicts for candidate rows. Non-similarity rankings blend each candidate's similarity
+        with its centrality ((1 - w) * similarity + w * centrality) and keep the best top_k;
+        min_score always applies to similarity.
+        """
+        features = self.get_node_features()
+        keep = top_scores >= min_score
+        top_indices, similarity = top_indices[keep], top_scores[keep]
+        scores = similarity
+
+        if ranking != "similarity" and features is not None and len(top_indices):
+            scores = (1 - CENTRALITY_WEIGHT) * similarity + CENTRALITY_WEIGHT * features.centrality(ranking)[top_indices]
+            order = top_k_indices(scores, top_k or len(scores))
+            top_indices, similarity, scores = top_indices[order], similarity[order], scores[order]
+
+        results = []
+        for idx, score, sim in zip(top_indices, scores, similarity):
+            result = {
+                'node': nodes[idx],
+                'score': float(score),
+                'degree': int(features.degrees[idx]) if features is not None and idx < features.size else 0,
+                'rank': len(results) + 1
+            }
+            if ranking != "similarity":
+                result['similarity'] = float(sim)
+            results.append(result)
+        return results
+
+    def search_nodes(self, query, top_k=5, min_score=0.3, effort=None, mode="hybrid", filters=None,
+                     ranking="similarity"):
+        """
+        Search for most similar nodes (effort trades ANN recall for latency).
+        mode: 'hybrid' (embedding + lexical fusion), 'semantic' or 'lexical'
+        filters: from parse_search_filters, applied during scoring
+        ranking: 'similarity', or 'degree' / 'pagerank' to blend in node centrality
+        """
+        if not self.is_ready():
+            return []
+
+        if not query or not query.strip():
+            return []
+
+        try:
+            version, nodes = self.version, self.nodes
+            cache_key = (version, normalize_text(query), top_k, min_score, effort, mode, filters, ranking)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return list(cached)
+
+            fetch_k = top_k * CENTRALITY_FETCH_FACTOR if ranking != "similarity" else top_k
+            top_indices, top_scores = self._search_candidates([query.strip()], [fetch_k], effort, mode, filters)[0]
+            results = self._format_results(nodes, top_indices, top_scores, min_score, ranking, top_k)
+            self.result_cache.put(cache_key, results)
+            return list(results)
+
+        except Exception as e:
+            print(f"Search error: {e}")
+            return []
+
+    def search_nodes_batch(self, requests, effort=None, mode="hybrid", filters=None, ranking="similarity"):
+        """
+        Run many searches with one encoder pass and blocked matrix scoring.
+        requests: list of (query, top_k, min_score); returns one result list per request.
+        """
+        if not self.is_ready():
+            return [[] for _ in requests]
+
+        version, nodes = self.version, self.nodes
+        all_results = [[] for _ in requests]
+        pending = []
+        for i, (query, top_k, min_score) in enumerate(requests):
+            if not query or not query.strip():
+                continue
+            cached = self.result_cache.get((version, normalize_text(query), top_k, min_score, effort, mode, filters,
+                                            ranking))
+            if cached is not None:
+                all_results[i] = list(cached)
+            else:
+                pending.append(i)
+
+        if not pending:
+            return all_results
+
+        factor = CENTRALITY_FETCH_FACTOR if ranking != "similarity" else 1
+        candidates = self._search_candidates([requests[i][0].strip() for i in pending],
+                                             [requests[i][1] * factor for i in pending], effort, mode, filters)
+        for i, (top_indices, top_scores) in zip(pending, candidates):
+            query, top_k, min_score = requests[i]
+            results = self._format_results(nodes, top_indices, top_scores, min_score, ranking, top_k)
+            self.result_cache.put((version, normalize_text(query), top_k, min_score, effort, mode, filters, ranking),
+                                  results)
+            all_results[i] = list(results)
+        return all_results
+
+    def _range_candidates(self, query_vector, threshold, mask=None):
+        """
+        (row indices, scores) of every row scoring >= threshold, best first and capped at
+        RANGE_MAX_RESULTS, plus whether the cap dropped matches
+        """
+        nodes, embeddings, ann_index = self.nodes, self.node_embeddings, self.ann_index
+        subset = None
+        if mask is None:
+            mask = self.alive if self.tombstones else None
+        elif not isinstance(ann_index, ShardedIndex):
+            selected = np.flatnonzero(mask)
+            limit = FILTER_ANN_SUBSET_FRACTION if ann_index is not None else FILTER_SUBSET_FRACTION
+            if len(selected) <= limit * len(nodes):
+                subset, ann_index = selected, None
+
+        reduced = self.precision != "float32" and not isinstance(ann_index, HNSWIndex)
+        floor = threshold - RANGE_RESCORE_MARGIN if reduced else threshold
+
+        if isinstance(ann_index, (IVFIndex, ShardedIndex)):
+            indices, scores = ann_index.range_search(query_vector, floor, mask)
+        elif ann_index is not None:
+            # Grow k until the weakest hit falls below the threshold (or the cap is exceeded)
+            k = RANGE_INITIAL_K
+            while True:
+                indices, scores = ann_index.search(query_vector, k, mask=mask)
+                if len(indices) < k or not len(scores) or scores.min() < floor or k > RANGE_MAX_RESULTS:
+                    break
+                k = min(2 * k, RANGE_MAX_RESULTS + 1)
+            keep = scores >= floor
+            indices, scores = indices[keep], scores[keep]
+        else:
+            rows = embeddings if subset is None else embeddings[subset]
+            scores = self._score_matrix(query_vector[None, :], rows)[0]
+            if mask is not None and subset is None:
+                scores[~mask] = -np.inf
+            indices = np.flatnonzero(scores >= floor)
+            scores = scores[indices]
+            if subset is not None:
+                indices = subset[indices]
+
+        if reduced and len(indices):
+            indices, scores = self._rescore(nodes, query_vector, indices, len(indices)) or (indices, scores)
+            keep = scores >= threshold
+            indices, scores = indices[keep], scores[keep]
+
+        top = top_k_indices(scores, RANGE_MAX_RESULTS)
+        return indices[top], scores[top], len(indices) > RANGE_MAX_RESULTS
+
+    def search_range_batch(self, queries, min_score, limit=RANGE_PAGE_SIZE, offset=0, filters=None):
+        """
+        Every node whose semantic similarity to each query is >= min_score, best first. Returns one
+        {results, total, truncated} page per query; total counts matches kept under RANGE_MAX_RESULTS.
+        """
+        empty = {"results": [], "total": 0, "truncated": False}
+        if not self.is_ready():
+            return [dict(empty) for _ in queries]
+
+        version, nodes = self.version, self.nodes
+        matches = [None] * len(queries)
+        pending = []
+        for i, query in enumerate(queries):
+            if query and query.strip():
+                matches[i] = self.range_cache.get((version, normalize_text(query), min_score, filters))
+                if matches[i] is None:
+                    pending.append(i)
+
+        if pending:
+            mask = self.filter_mask(filters)
+            query_vectors = self._project(self.encode_queries([queries[i].strip() for i in pending]))
+            for i, vector in zip(pending, query_vectors):
+                matches[i] = self._range_candidates(vector, min_score, mask)
+                self.range_cache.put((version, normalize_text(queries[i]), min_score, filters), matches[i])
+
+        pages = []
+        for found in matches:
+            if found is None:
+                pages.append(dict(empty))
+                continue
+            indices, scores, truncated = found
+            results = self._format_results(nodes, indices[offset:offset + limit], scores[offset:offset + limit],
+                                           min_score)
+            for result in results:
+                result['rank'] += offset
+            pages.append({"results": results, "total": len(indices), "truncated": truncated})
+        return pages
+
+    def search_range(self, query, min_score, limit=RANGE_PAGE_SIZE, offset=0, filters=None):
+        return self.search_range_batch([query], min_score, limit, offset, filters)[0]
+
+    def search_to_subgraph(self, query, top_k=3, radius=1):
+        """Generate subgraph from search results"""
+        top_nodes = self.search_nodes(query, top_k, min_score=0.1)
+
+        if not top_nodes or not self.graph:
+            return None, []
+
+        node_names = [result['node'] for result in top_nodes]
+
+        subgraphs = []
+        with self.graph_lock:
+            for node in node_names:
+                if node in self.graph:
+                    try:
+                        ego_graph = nx.ego_graph(self.graph, node, radius=radius, undirected=True)
+                        subgraphs.append(ego_graph)
+                    except:
+                        continue
+
+            if subgraphs:
+                union_subgraph = nx.compose_all(subgraphs)
+                return union_subgraph, top_nodes
+        return None, top_nodes
+
+    def compute_neighbors(self, k=KNN_K):
+        """
+        (neighbor rows, scores) of every row's k nearest live rows, computed in bounded blocks:
+        per IVF cluster against its nearest clusters, in HNSW batches, or exact row blocks.
+        Missing neighbors are -1 with score -inf.
+        """
+        embeddings, alive, ann_index = self.node_embeddings, self.alive.copy(), self.ann_index
+        count = len(alive)
+        neighbors = np.full((count, k), -1, dtype=np.int32)
+        scores = np.full((count, k), -np.inf, dtype=np.float16)
+
+        def store(rows, candidates, block_scores):
+            block_scores[:, ~alive[candidates]] = -np.inf
+            block_scores[rows[:, None] == candidates[None, :]] = -np.inf
+            width = min(k, len(candidates))
+            if width < len(candidates):
+                top = np.argpartition(-block_scores, width - 1, axis=1)[:, :width]
+            else:
+                top = np.tile(np.arange(width), (len(rows), 1))
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+            found = candidates[top]
+            found[~np.isfinite(top_scores)] = -1
+            neighbors[rows, :width] = found
+            scores[rows, :width] = top_scores
+
+        if isinstance(ann_index, HNSWIndex):
+            for start in range(0, count, INDEX_BATCH_SIZE):
+                rows = np.arange(start, min(count, start + INDEX_BATCH_SIZE))
+                labels, distances = ann_index.index.knn_query(self._dequantize(embeddings[rows]),
+                                                              k=min(k + 1, ann_index.index.get_current_count()))
+                for row, row_labels, row_distances in zip(rows, labels, distances):
+                    keep = [(int(n), 1.0 - d) for n, d in zip(row_labels, row_distances) if n != row and alive[n]][:k]
+                    neighbors[row, :len(keep)] = [n for n, _ in keep]
+                    scores[row, :len(keep)] = [d for _, d in keep]
+            return neighbors, scores
+
+        if isinstance(ann_index, ShardedIndex):
+            for start in range(0, count, 1024):
+                rows = np.arange(start, min(count, start + 1024))
+                found = ann_index.search_batch(self._dequantize(ann_index.fetch(rows)), [k + 1] * len(rows), alive)
+                for row, (row_neighbors, row_scores) in zip(rows, found):
+                    keep = row_neighbors != row
+                    row_neighbors, row_scores = row_neighbors[keep][:k], row_scores[keep][:k]
+                    neighbors[row, :len(row_neighbors)] = row_neighbors
+                    scores[row, :len(row_neighbors)] = row_scores
+            return neighbors, scores
+
+        if isinstance(ann_index, IVFIndex):
+            blocks = ann_index.neighbor_blocks(ann_index.default_nprobe * KNN_NPROBE_FACTOR)
+        else:
+            blocks = [(np.arange(count), np.arange(count))]
+        for rows, candidates in blocks:
+            rows = rows[alive[rows]]
+            step = max(1, EXACT_SCORE_BLOCK // max(1, len(candidates)))
+            for start in range(0, len(rows), step):
+                chunk = rows[start:start + step]
+                block_scores = self._score_matrix(self._dequantize(embeddings[chunk]), embeddings[candidates])
+                store(chunk, candidates, block_scores)
+        return neighbors, scores
+
+    def schedule_neighbors(self, k=KNN_K):
+        """Start the background kNN job for the current rows unless one is already running"""
+        with self._lock:
+            if self._neighbor_job is not None and self._neighbor_job.is_alive():
+                return
+            epoch = self.row_epoch
+
+            def job():
+                try:
+                    start = time.perf_counter()
+                    neighbors, scores = self.compute_neighbors(k)
+                    with self._lock:
+                        if self.row_epoch == epoch:
+                            self._neighbors = (epoch, neighbors, scores)
+                    print(f"Computed {k} nearest neighbors for {len(neighbors)} rows "
+                          f"in {time.perf_counter() - start:.2f}s")
+                except Exception as e:
+                    print(f"Nearest-neighbor job failed: {e}")
+
+            self._neighbor_job = threading.Thread(target=job, name="knn-graph", daemon=True)
+            self._neighbor_job.start()
+
+    def similar_nodes(self, node, top_k=KNN_K):
+        """
+        Nodes nearest to node in embedding space, from the precomputed kNN graph when it covers
+        the node (constant time), otherwise by scoring its stored vector; never calls the model.
+        Returns (results, source) or (None, None) if the node is not indexed.
+        """
+        nodes, row = self.nodes, self.node_rows.get(node)
+        if row is None:
+            return None, None
+
+        precomputed = self._neighbors
+        if precomputed is not None and precomputed[0] == self.row_epoch and row < len(precomputed[1]) \
+                and top_k <= precomputed[1].shape[1]:
+            rows, scores = precomputed[1][row], precomputed[2][row].astype(np.float32)
+            keep = (rows >= 0) & self.alive[np.maximum(rows, 0)]
+            rows, scores, source = rows[keep][:top_k].astype(np.int64), scores[keep][:top_k], "precomputed"
+        else:
+            if precomputed is None or precomputed[0] != self.row_epoch:
+                self.schedule_neighbors()
+            vector = self._dequantize(self._stored([row]))
+            rows, scores = self._top_candidates(vector, [top_k + 1])[0]
+            keep = rows != row
+            rows, scores, source = rows[keep][:top_k], scores[keep][:top_k], "live"
+
+        features = self.get_node_features()
+        results = [{
+            'node': nodes[r],
+            'score': float(score),
+            'degree': int(features.degrees[r]) if features is not None and r < features.size else 0,
+            'rank': rank
+        } for rank, (r, score) in enumerate(zip(rows, scores), 1)]
+        return results, source
+
+    def get_triple_index(self, build=True):
+        """
+        (engine, verbalized texts) for the graph's edges: a nested engine whose rows are triple
+        sentences, sharing this engine's encoder and caches. Built on first use and synced
+        incrementally when the graph version changes.
+        """
+        if self.graph is None or self.model is None:
+            return None
+        with self._lock:
+            if self._triples is not None and self._triples[0] == self.version:
+                return self._triples[1], self._triples[2]
+            if self._triples is None and not build:
+                return None
+
+            with self.graph_lock:
+                texts = verbalize_triples(self.graph)
+                # Edge keys (KB triple ids) let apply_graph_change() apply each delta exactly once
+                keys = {key for _, _, key in self.graph.edges(keys=True)} if self.graph.is_multigraph() else set()
+            if self._triples is None:
+                engine = SemanticSearchEngine(model=self.model, model_name=self.model_name,
+                                              embedding_cache=self.embedding_cache, query_cache=self.query_cache,
+                                              precision=self.precision, query_encoder=self.query_encoder,
+                                              bulk_encoder=self.bulk_encoder, reduce_dim=self.reduce_dim,
+                                              reduce_method=self.reduce_method)
+                path = os.path.splitext(self.source)[0] + "_triples.json" if self.source else None
+                engine.build_rows(list(texts), path, kind="triples")
+            else:
+                engine = self._triples[1]
+                engine.remove_nodes([text for text in engine.node_rows if text not in texts])
+                engine.add_nodes(list(texts))
+            self._triples = (self.version, engine, texts, keys)
+            return engine, texts
+
+    def search_triples_batch(self, requests, effort=None, mode="hybrid"):
+        """Like search_nodes_batch, but ranks edges by their verbalized 'entity1 relation entity2' text"""
+        index = self.get_triple_index()
+        if index is None:
+            return [[] for _ in requests]
+        engine, texts = index
+
+        all_results = []
+        for (query, top_k, _), hits in zip(requests, engine.search_nodes_batch(requests, effort, mode)):
+            results = []
+            for hit in hits:
+                for e1, relation, e2 in texts.get(hit['node'], ()):
+                    results.append({
+                        'entity1': e1,
+                        'relation': relation,
+                        'entity2': e2,
+                        'score': hit['score'],
+                        'rank': len(results) + 1
+                    })
+            all_results.append(results[:top_k])
+        return all_results
+
+    def search_triples(self, query, top_k=5, min_score=0.3, effort=None, mode="hybrid"):
+        if not query or not query.strip():
+            return []
+        return self.search_triples_batch([(query, top_k, min_score)], effort, mode)[0]
+
+    def get_communities(self):
+        """Community partition of the loaded graph, computed once per graph version"""
+        if self.graph is None:
+            return None
+        # Detection runs on a snapshot without holding the engine or graph lock, so searches
+        # and KB edits go on meanwhile; one thread computes while the others wait for its result
+        with self._community_lock:
+            with self._lock:
+                current = self._communities
+                if current is not None and current[0] == self.version:
+                    return current[1]
+                version, graph = self.version, self.graph
+                with self.graph_lock:
+                    undirected = nx.Graph(graph)
+                    degrees = dict(graph.degree())
+
+            communities = CommunityIndex(undirected, degrees=degrees)
+            with self._lock:
+                if self.graph is graph and (self._communities is None or self._communities[0] < version):
+                    self._communities = (version, communities)
+            return communities
+
+INDEX_MEMORY_BUDGET_MB = int(os.getenv("KNOWMAP_INDEX_MEMORY_MB", "2048"))
+KB_INDEX_KEY = "kb"
+# Approximate footprint of a networkx node / edge with a small attribute dict
+GRAPH_NODE_BYTES = 600
+GRAPH_EDGE_BYTES = 900
+
+class SearchEngineRegistry:
+    """
+    Semantic indexes per user graph (plus one for the shared KB graph), all using one encoder.
+    Resident indexes are kept in LRU order and evicted once their memory (index arrays plus
+    the graph they own) exceeds the budget; an evicted index is rebuilt from its loader the
+    next time its user searches.
+
+    load(), active_engine() and get() hand out a reference that the caller must release();
+    an evicted index is only closed once nobody holds it any more.
+    """
+
+    def __init__(self, memory_budget_mb=INDEX_MEMORY_BUDGET_MB, model_name=DEFAULT_MODEL_NAME,
+                 precision=EMBEDDING_PRECISION):
+        self.budget = memory_budget_mb * 1024 * 1024
+        self.model_name = model_name
+        self.precision = precision
+        self.model, self.embedding_cache = load_embedding_model(model_name)
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE)
+        self.query_encoder = (MicroBatchEncoder(self.model)
+                              if self.model is not None and QUERY_BATCH_WINDOW_MS > 0 else None)
+        self.bulk_encoder = (ParallelEncoder(model_name)
+                             if self.model is not None and ENCODE_PROCESSES not in ("", "0") else None)
+        self.engines = OrderedDict()
+        self.loaders = {}
+        self.active = {}
+        # Serializes building/syncing per key so concurrent loads share one engine
+        self.build_locks = {}
+        # References handed out per engine, and evicted engines waiting for theirs to be released
+        self.users = {}
+        self.retired = set()
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def graph_key(user_id, graph_path):
+        return f"user:{user_id}:{os.path.basename(graph_path)}"
+
+    def _new_engine(self):
+        return SemanticSearchEngine(model=self.model, model_name=self.model_name,
+                                    embedding_cache=self.embedding_cache, query_cache=self.query_cache,
+                                    precision=self.precision, query_encoder=self.query_encoder,
+                                    bulk_encoder=self.bulk_encoder)
+
+    def load(self, user_id, key, loader, index_path=None, graph=None, graph_lock=None):
+        """
+        Make key the user's active index and return it held. A resident index is reused (and
+        synced to graph if one is passed); otherwise the graph (or loader()) is indexed from
+        scratch. graph_lock guards a graph that is edited in place (the KB graph).
+        """
+        with self.lock:
+            self.loaders[key] = (loader, index_path, graph_lock)
+            self.active[user_id] = key
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self.lock:
+                engine = self.engines.get(key)
+                if engine is not None:
+                    self._hold(engine)
+            try:
+                if engine is None:
+                    built = self._new_engine()
+                    try:
+                        built.build_index(graph if graph is not None else loader(), index_path=index_path,
+                                          graph_lock=graph_lock)
+                    except Exception:
+                        built.close()
+                        raise
+                    with self.lock:
+                        engine = self.engines.get(key)
+                        if engine is None:
+                            engine = self.engines[key] = built
+                            built = None
+                        self._hold(engine)
+                    if built is not None:
+                        # Another index for key became resident meanwhile; keep that one
+                        built.close()
+                elif graph is not None:
+                    engine.sync_graph(graph)
+            except Exception:
+                self.release(engine)
+                raise
+
+        with self.lock:
+            if self.engines.get(key) is engine:
+                self.engines.move_to_end(key)
+            idle = self._evict(keep=key)
+        for evicted in idle:
+            evicted.close()
+        return engine
+
+    def get(self, key):
+        """Resident index for key, held, without loading or touching LRU order"""
+        with self.lock:
+            return self._hold(self.engines.get(key))
+
+    def active_engine(self, user_id):
+        """The index the user last loaded, held, rebuilding it if it was evicted"""
+        with self.lock:
+            key = self.active.get(user_id)
+            if key is None:
+                return None
+            engine = self.engines.get(key)
+            if engine is not None:
+                self.engines.move_to_end(key)
+                return self._hold(engine)
+            if key not in self.loaders:
+                return None
+            loader, index_path, graph_lock = self.loaders[key]
+
+        print(f"Reloading evicted index {key}")
+        return self.load(user_id, key, loader, index_path=index_path, graph_lock=graph_lock)
+
+    def _hold(self, engine):
+        if engine is not None:
+            self.users[engine] = self.users.get(engine, 0) + 1
+        return engine
+
+    def release(self, engine):
+        """Drop a reference from load/get/active_engine, closing the engine if it was evicted meanwhile"""
+        if engine is None:
+            return
+        with self.lock:
+            count = self.users.get(engine, 0) - 1
+            if count > 0:
+                self.users[engine] = count
+                return
+            self.users.pop(engine, None)
+            if engine not in self.retired:
+                return
+            self.retired.discard(engine)
+        engine.close()
+
+    def memory_bytes(self, key, engine):
+        """Index arrays plus the graph, unless the graph is shared (the KB graph outlives its index)"""
+        owns_graph = self.loaders.get(key, (None, None, None))[2] is None
+        return engine.memory_bytes() + (engine.graph_memory_bytes() if owns_graph else 0)
+
+    def _evict(self, keep=None):
+        """Drop least recently used indexes over budget; returns the unused ones for the caller to close"""
+        sizes = {key: self.memory_bytes(key, engine) for key, engine in self.engines.items()}
+        total = sum(sizes.values())
+        idle = []
+        for key in list(self.engines):
+            if total <= self.budget:
+                break
+            if key == keep:
+                continue
+            engine = self.engines.pop(key)
+            if self.users.get(engine):
+                self.retired.add(engine)
+            else:
+                idle.append(engine)
+            total -= sizes[key]
+            print(f"Evicted index {key} ({sizes[key] / 1024 / 1024:.1f} MB) to stay within memory budget")
+        return idle
+
+    def stats(self):
+        with self.lock:
+            indexes = [
+                {
+                    "key": key,
+                    "nodes": engine.node_count,
+                    "triples": engine.triple_count,
+                    "build": engine.build_stats,
+                    "memory_mb": round(self.memory_bytes(key, engine) / 1024 / 1024, 2),
+                    "ann_index": engine.ann_index.name if engine.ann_index is not None else "exact",
+                    "precision": engine.precision,
+                    "dimensions": int(engine.dim) if engine.is_ready() else 0,
+                    "reduction": engine.reducer.signature if engine.reducer is not None else None,
+                    "result_cache": engine.result_cache.stats(),
+                    "subgraph_cache": engine.subgraph_cache.stats()
+                }
+                for key, engine in self.engines.items()
+            ]
+        return {
+            "resident_indexes": indexes,
+            "memory_mb": round(sum(i["memory_mb"] for i in indexes), 2),
+            "budget_mb": round(self.budget / 1024 / 1024, 2),
+            "query_cache": self.query_cache.stats(),
+            "query_encoder": self.query_encoder.stats() if self.query_encoder is not None else None
+        }
+
+def load_graph_file(path):
+    """Read a saved graph (.gpickle or node-link _graph.json)"""
+    if path.endswith('.gpickle'):
+        # networkx 3 dropped read_gpickle; a .gpickle file is a plain pickled graph
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    with open(path, 'r') as f:
+        graph_data = json.load(f)
+    return nx.node_link_graph(graph_data)
+
+# ===============================================================
+# Offline Query CLI
+# ===============================================================
+
+CLI_BATCH_SIZE = 1024
+
+def read_queries(stream):
+    """Yield (id, query) per non-empty line; a line may be plain text or {"id": ..., "query": ...}"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+                yield record.get("id", line_number), str(record.get("query", ""))
+                continue
+            except ValueError:
+                pass
+        yield line_number, line
+
+def run_query_file(engine, queries, out, target="nodes", top_k=5, min_score=0.3, mode="hybrid",
+                   filters=None, ranking="similarity", effort=None, batch_size=CLI_BATCH_SIZE, range_search=False):
+    """
+    Search every (id, query) in batch_size chunks and write one NDJSON line per query; returns the
+    count. range_search returns every node scoring >= min_score instead of the top_k.
+    """
+    def flush(batch):
+        if range_search:
+            pages = engine.search_range_batch([query for _, query in batch], min_score, RANGE_MAX_RESULTS,
+                                              filters=filters)
+            for (query_id, query), page in zip(batch, pages):
+                out.write(json.dumps({"id": query_id, "query": query, "results": page["results"],
+                                      "truncated": page["truncated"]}, default=str) + "\n")
+            return
+        requests = [(query, top_k, min_score) for _, query in batch]
+        if target == "triples":
+            results = engine.search_triples_batch(requests, effort, mode)
+        else:
+            results = engine.search_nodes_batch(requests, effort, mode, filters, ranking)
+        for (query_id, query), hits in zip(batch, results):
+            out.write(json.dumps({"id": query_id, "query": query, "results": hits}, default=str) + "\n")
+
+    count, batch = 0, []
+    for item in queries:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            flush(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        flush(batch)
+        count += len(batch)
+    out.flush()
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run semantic searches against a saved graph and write NDJSON results, one line per query")
+    parser.add_argument("graph", help="saved graph (.gpickle or node-link _graph.json)")
+    parser.add_argument("-q", "--queries", default="-", help="query file, one per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file ('-' for stdout)")
+    parser.add_argument("--target", choices=SEARCH_TARGETS, default="nodes")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-score", type=float, default=0.3)
+    parser.add_argument("--range", action="store_true",
+                        help=f"return every node with similarity >= --min-score (up to {RANGE_MAX_RESULTS}) instead of --top-k")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default="hybrid")
+    parser.add_argument("--rank-by", choices=RANKINGS, default="similarity")
+    parser.add_argument("--filters", help='JSON object, e.g. {"relation": "founded by", "min_degree": 2}')
+    parser.add_argument("--effort", type=int, default=None, help="ANN recall/latency knob")
+    parser.add_argument("--batch-size", type=int, default=CLI_BATCH_SIZE, help="queries encoded and scored together")
+    parser.add_argument("--processes", default=ENCODE_PROCESSES,
+                        help="encoding worker processes, 'auto', or 0 to encode in-process")
+    args = parser.parse_args(argv)
+
+    try:
+        spec = json.loads(args.filters) if args.filters else None
+    except ValueError as e:
+        parser.error(f"--filters is not valid JSON: {e}")
+    filters, error = parse_search_filters(spec)
+    if error:
+        parser.error(error)
+    if (filters or args.range) and args.target == "triples":
+        parser.error("filters and --range are only supported for node search")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be positive")
+    _, error = parse_ann_effort(args.effort)
+    if error:
+        parser.error(error.replace("ann_effort", "--effort"))
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    # Progress messages go to stderr so stdout carries nothing but results
+    with contextlib.redirect_stdout(sys.stderr):
+        engine = SemanticSearchEngine(precision=EMBEDDING_PRECISION)
+        if engine.model is None:
+            return 1
+        if str(args.processes) not in ("", "0"):
+            # Large query batches benefit from the encoding pool as much as index builds do
+            engine.bulk_encoder = engine.query_encoder = ParallelEncoder(engine.model_name, args.processes)
+        # The embedding cache and the persisted ANN index make repeat runs over a graph skip re-encoding
+        if not engine.build_index(load_graph_file(args.graph), index_path=args.graph, neighbors=False):
+            print(f"No searchable nodes in {args.graph}")
+            return 1
+        try:
+            engine.mode_used(args.mode)
+        except ValueError as e:
+            engine.close()
+            parser.error(str(e))
+
+        stream = sys.stdin if args.queries == "-" else open(args.queries, "r", encoding="utf-8")
+        try:
+            start_time = time.perf_counter()
+            count = run_query_file(engine, read_queries(stream), out, args.target, args.top_k, args.min_score,
+                                   args.mode, filters, args.rank_by, args.effort, args.batch_size, args.range)
+            elapsed = time.perf_counter() - start_time
+            print(f"Searched {count} queries in {elapsed:.2f}s"
+                  f" ({count / elapsed if elapsed > 0 else 0:.1f} queries/sec)")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if out is not sys.stdout:
+                out.close()
+            engine.close()
+    return 0
+
+WORKER_ROLES = {"encode": encode_worker, "shard": shard_worker}
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        sys.exit(run_worker(sys.argv[2:]))
+    if sys.argv[1:2] == ["--serve-shard"]:
+        if len(sys.argv) != 3:
+            sys.exit("usage: semantic_search.py --serve-shard [host:]port")
+        sys.exit(serve_shard(sys.argv[2]))
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base import KnowledgeBaseGraph
+from semantic_search import EmbeddingCache, SemanticSearchEngine, normalize_rows, normalize_text
+
+DIM = 32
+
+def text_vector(text, dim=DIM):
+    """Deterministic pseudo-embedding: equal normalized texts get equal vectors"""
+    seed = int(hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+class FakeModel:
+    """Stands in for a SentenceTransformer; counts the texts it is asked to encode"""
+
+    def __init__(self, dim=DIM):
+        self.dim = dim
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        return np.array([text_vector(text, self.dim) for text in texts], dtype=np.float32).reshape(-1, self.dim)
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+@pytest.fixture
+def embedding_cache(tmp_path):
+    return EmbeddingCache("fake-model", cache_dir=str(tmp_path / "cache"))
+
+@pytest.fixture
+def kb(tmp_path):
+    """A loaded KB graph over three drug triples"""
+    db_path = str(tmp_path / "kb.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE triples (id INTEGER PRIMARY KEY, entity1 TEXT, relation TEXT, entity2 TEXT)")
+    conn.executemany("INSERT INTO triples VALUES (?, ?, ?, ?)", [
+        (1, "aspirin", "treats", "headache"),
+        (2, "ibuprofen", "treats", "headache"),
+        (3, "aspirin", "inhibits", "cox-1"),
+    ])
+    conn.commit()
+    conn.close()
+    kb = KnowledgeBaseGraph(db_path)
+    kb.load()
+    return kb
+
+@pytest.fixture
+def make_engine(model):
+    def make(graph=None, **kwargs):
+        engine = SemanticSearchEngine(model=model, model_name="fake-model", **kwargs)
+        if graph is not None:
+            engine.build_index(graph, neighbors=False)
+        return engine
+    return make
+
+def clustered_vectors(n, dim=DIM, clusters=20, spread=0.3, seed=0):
+    """Normalized vectors drawn around random centers, so ANN partitions are meaningful"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    points = centers[rng.integers(clusters, size=n)] + spread * rng.standard_normal((n, dim))
+    return normalize_rows(points)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import semantic_search
+from semantic_search import MAX_ANN_EFFORT, IVFIndex, build_ann_index, parse_ann_effort, top_k_indices
+from conftest import clustered_vectors
+
+def exact_top(vectors, query, k):
+    return set(top_k_indices(vectors @ query, k).tolist())
+
+def test_ivf_recall_against_exact_search():
+    vectors = clustered_vectors(5000)
+    queries = clustered_vectors(50, seed=1)
+    index = IVFIndex.build(vectors)
+
+    hits = 0
+    for query in queries:
+        rows, scores = index.search(query, 10, effort=index.default_nprobe * 4)
+        np.testing.assert_allclose(scores, vectors[rows] @ query, rtol=1e-5)
+        hits += len(set(rows.tolist()) & exact_top(vectors, query, 10))
+    assert hits / (len(queries) * 10) >= 0.9
+
+def test_ivf_mask_and_added_rows():
+    vectors = clustered_vectors(2000)
+    index = IVFIndex.build(vectors[:1500])
+    index.attach(vectors)
+    index.add(np.arange(1500, 2000), vectors[1500:])
+
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[1500:] = True
+    rows, _ = index.search(vectors[1700], 5, effort=len(index.centroids), mask=mask)
+    assert rows[0] == 1700 and (rows >= 1500).all()
+
+def test_index_is_persisted_and_reused(tmp_path, monkeypatch):
+    monkeypatch.setattr(semantic_search, "ANN_MIN_NODES", 100)
+    vectors = clustered_vectors(1000)
+    labels = [f"node {i}" for i in range(len(vectors))]
+    index_path = str(tmp_path / "graph.json")
+
+    built = build_ann_index(vectors, labels, index_path, backend="ivf", salt="model")
+    assert (tmp_path / "graph.ivf.npz").exists()
+    loaded = build_ann_index(vectors, labels, index_path, backend="ivf", salt="model")
+    np.testing.assert_array_equal(built.order, loaded.order)
+    np.testing.assert_array_equal(built.centroids, loaded.centroids)
+
+    # Another vector space or label set must not reuse the stored index
+    assert IVFIndex.load(str(tmp_path / "graph.ivf.npz"), "stale") is None
+
+def test_small_graphs_use_exact_search():
+    assert build_ann_index(clustered_vectors(50), list(range(50)), backend="ivf") is None
+
+def test_filtered_search_widens_probe_to_fill_top_k():
+    vectors = clustered_vectors(5000)
+    index = IVFIndex.build(vectors)
+    query = clustered_vectors(1, seed=3)[0]
+    # Only members of a cluster far from the query match, so the default probe finds none of them
+    far = next(c for c in np.argsort(index.centroids @ query) if len(index._posting_list(c)) >= 20)
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[index._posting_list(far)] = True
+
+    rows, _ = index.search(query, 10, mask=mask)
+    assert len(rows) == 10 and mask[rows].all()
+
+    # With every cluster probed the result is the exact filtered top-k
+    exact = np.flatnonzero(mask)[top_k_indices(vectors[mask] @ query, 10)]
+    full, _ = index.search(query, 10, effort=len(index.centroids), mask=mask)
+    np.testing.assert_array_equal(full, exact)
+
+def test_filtered_search_exhausts_all_clusters():
+    vectors = clustered_vectors(2000)
+    index = IVFIndex.build(vectors)
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[[3, 900, 1999]] = True
+
+    rows, _ = index.search(vectors[0], 10, mask=mask)
+    assert sorted(rows.tolist()) == [3, 900, 1999]
+
+def test_parse_ann_effort():
+    assert parse_ann_effort(None) == (None, None)
+    assert parse_ann_effort(8) == (8, None) and parse_ann_effort("16") == (16, None)
+
+@pytest.mark.parametrize("effort", [0, -3, MAX_ANN_EFFORT + 1, "many", 2.5, True, [4]])
+def test_invalid_ann_effort_is_rejected(effort):
+    value, error = parse_ann_effort(effort)
+    assert value is None and error
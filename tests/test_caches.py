@@ -0,0 +1,73 @@
+import networkx as nx
+import pytest
+
+from semantic_search import LRUCache
+
+@pytest.fixture
+def engine(make_engine):
+    graph = nx.MultiDiGraph()
+    for i in range(30):
+        graph.add_edge(f"gene {i}", f"protein {i}", relation="encodes")
+    return make_engine(graph)
+
+def test_lru_drops_the_least_recently_used_entry():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1}
+
+def test_zero_size_cache_stores_nothing():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert cache.get("a") is None and cache.stats()["size"] == 0
+
+def test_repeated_queries_are_encoded_once(engine, model):
+    encoded = model.encoded
+    engine.encode_queries(["gene 3", " gene  3", "protein 4"])
+    assert model.encoded == encoded + 2
+    engine.encode_queries(["gene 3 ", "protein 4"])
+    assert model.encoded == encoded + 2
+
+def test_result_cache_serves_repeats_without_encoding(engine, model):
+    first = engine.search_nodes("gene 3", top_k=3, min_score=0.0, mode="semantic")
+    encoded, hits = model.encoded, engine.result_cache.hits
+    assert engine.search_nodes(" gene  3 ", top_k=3, min_score=0.0, mode="semantic") == first
+    assert model.encoded == encoded and engine.result_cache.hits == hits + 1
+
+    # Callers get a copy, so editing one response leaves the cached results alone
+    first.clear()
+    assert len(engine.search_nodes("gene 3", top_k=3, min_score=0.0, mode="semantic")) == 3
+
+def test_different_parameters_are_cached_separately(engine):
+    top = engine.search_nodes("gene 3", top_k=1, min_score=0.0, mode="semantic")
+    assert len(top) == 1
+    assert len(engine.search_nodes("gene 3", top_k=5, min_score=0.0, mode="semantic")) == 5
+    batch = engine.search_nodes_batch([("gene 3", 1, 0.0), ("gene 3", 2, 0.0)], mode="semantic")
+    assert batch[0] == top and len(batch[1]) == 2
+
+def test_index_changes_invalidate_cached_results(engine):
+    assert engine.search_nodes("tp53", top_k=1, min_score=0.0, mode="semantic")[0]["node"] != "tp53"
+    engine.subgraph_cache.put((engine.version, "tp53", 3, 1, False, ()), b"{}")
+    version = engine.version
+
+    engine.add_nodes(["tp53"])
+    assert engine.version > version
+    assert engine.result_cache.stats()["size"] == 0 and engine.subgraph_cache.stats()["size"] == 0
+    assert engine.search_nodes("tp53", top_k=1, min_score=0.0, mode="semantic")[0]["node"] == "tp53"
+
+    engine.remove_nodes(["tp53"])
+    assert engine.search_nodes("tp53", top_k=1, min_score=0.0, mode="semantic")[0]["node"] != "tp53"
+
+def test_kb_edits_invalidate_cached_results(kb, make_engine):
+    engine = make_engine()
+    engine.build_index(kb.graph, neighbors=False, graph_lock=kb.lock)
+    kb.add_listener(engine.apply_graph_change)
+    assert [r["node"] for r in engine.search_nodes("fever", top_k=1, min_score=0.0, mode="semantic")] != ["fever"]
+
+    kb.add_triple(4, "paracetamol", "treats", "fever")
+    assert [r["node"] for r in engine.search_nodes("fever", top_k=1, min_score=0.0, mode="semantic")] == ["fever"]
+    kb.remove_triple(4)
+    assert "fever" not in [r["node"] for r in engine.search_nodes("fever", top_k=5, min_score=-1.0, mode="semantic")]
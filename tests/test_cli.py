@@ -0,0 +1,80 @@
+import io
+import json
+import pickle
+
+import networkx as nx
+import pytest
+
+import semantic_search
+from semantic_search import EmbeddingCache, main, read_queries, run_query_file
+from conftest import FakeModel
+
+NODES = [f"entity {i}" for i in range(40)]
+
+@pytest.fixture
+def graph_file(tmp_path, monkeypatch):
+    cache = EmbeddingCache("fake-model", cache_dir=str(tmp_path / "cache"))
+    monkeypatch.setattr(semantic_search, "load_embedding_model", lambda *args: (FakeModel(), cache))
+    graph = nx.MultiDiGraph()
+    for i, node in enumerate(NODES[1:], 1):
+        graph.add_edge(NODES[0] if i % 2 else NODES[i - 1], node, relation="related to")
+    path = tmp_path / "kb.gpickle"
+    with open(path, "wb") as f:
+        pickle.dump(graph, f)
+    return path
+
+def run_cli(tmp_path, graph_file, lines, *args):
+    queries, output = tmp_path / "queries.txt", tmp_path / "results.ndjson"
+    queries.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    code = main([str(graph_file), "-q", str(queries), "-o", str(output), "--processes", "0", *args])
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()] if output.exists() else []
+    return code, records
+
+def test_read_queries_accepts_text_and_json_lines():
+    stream = io.StringIO('entity 1\n\n{"id": "q2", "query": "entity 2"}\n{not json\n')
+    assert list(read_queries(stream)) == [(1, "entity 1"), ("q2", "entity 2"), (4, "{not json")]
+
+def test_cli_writes_one_line_per_query(tmp_path, graph_file):
+    code, records = run_cli(tmp_path, graph_file, ["entity 3", '{"id": "x", "query": "entity 7"}', "entity 12"],
+                            "--top-k", "2", "--min-score", "0.0", "--mode", "semantic", "--batch-size", "2")
+    assert code == 0
+    assert [record["id"] for record in records] == [1, "x", 3]
+    assert [record["results"][0]["node"] for record in records] == ["entity 3", "entity 7", "entity 12"]
+    assert all(len(record["results"]) == 2 for record in records)
+
+def test_cli_range_search(tmp_path, graph_file):
+    code, records = run_cli(tmp_path, graph_file, ["entity 5"], "--range", "--min-score", "0.99", "--mode", "semantic")
+    assert code == 0
+    assert [r["node"] for r in records[0]["results"]] == ["entity 5"] and records[0]["truncated"] is False
+
+def test_cli_applies_filters(tmp_path, graph_file):
+    code, records = run_cli(tmp_path, graph_file, ["entity 5"], "--min-score", "0.0", "--top-k", "5",
+                            "--mode", "semantic", "--filters", '{"min_degree": 3}')
+    assert code == 0
+    assert [r["node"] for r in records[0]["results"]] == [NODES[0]]
+
+@pytest.mark.parametrize("args", [
+    ["--filters", "{bad"],
+    ["--filters", '{"colour": "red"}'],
+    ["--target", "triples", "--range"],
+    ["--batch-size", "0"],
+    ["--effort", "0"],
+])
+def test_cli_rejects_bad_arguments(tmp_path, graph_file, args):
+    with pytest.raises(SystemExit) as error:
+        run_cli(tmp_path, graph_file, ["entity 1"], *args)
+    assert error.value.code == 2
+
+def test_cli_rejects_lexical_mode_without_a_lexical_index(tmp_path, graph_file, monkeypatch):
+    monkeypatch.setattr(semantic_search, "HYBRID_LEXICAL_WEIGHT", 0)
+    with pytest.raises(SystemExit) as error:
+        run_cli(tmp_path, graph_file, ["entity 1"], "--mode", "lexical")
+    assert error.value.code == 2
+
+def test_run_query_file_batches(make_engine):
+    engine = make_engine(nx.path_graph(NODES, create_using=nx.MultiDiGraph))
+    out = io.StringIO()
+    count = run_query_file(engine, [(i, node) for i, node in enumerate(NODES[:5])], out,
+                           top_k=1, min_score=0.0, mode="semantic", batch_size=2)
+    assert count == 5
+    assert [json.loads(line)["results"][0]["node"] for line in out.getvalue().splitlines()] == NODES[:5]
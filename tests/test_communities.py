@@ -0,0 +1,65 @@
+import threading
+
+import networkx as nx
+
+from semantic_search import CommunityIndex, parse_community_ids
+
+def two_cliques():
+    graph = nx.MultiDiGraph()
+    for group in ("a", "b"):
+        members = [f"{group}{i}" for i in range(5)]
+        for i, u in enumerate(members):
+            for v in members[i + 1:]:
+                graph.add_edge(u, v, relation=f"{group}-rel")
+    graph.add_edge("a0", "b0", relation="bridge")
+    return graph
+
+def test_summarize_collapses_and_expands():
+    graph = two_cliques()
+    communities = CommunityIndex(graph)
+    assert len(communities.members) == 2
+    a = communities.community_of("a1")
+
+    collapsed = communities.summarize(graph)
+    assert {node["type"] for node in collapsed["nodes"]} == {"community"}
+    assert sum(node["internal_edges"] for node in collapsed["nodes"]) == 20
+    assert [link["relations"] for link in collapsed["links"]] == [{"bridge": 1}]
+
+    expanded = communities.summarize(graph, expand=[a])
+    plain = {node["id"] for node in expanded["nodes"] if node["type"] == "node"}
+    assert plain == {f"a{i}" for i in range(5)}
+
+def test_detection_does_not_hold_the_graph_lock(make_engine, monkeypatch):
+    engine = make_engine(two_cliques())
+    started, release = threading.Event(), threading.Event()
+    louvain = nx.community.louvain_communities
+
+    def slow_louvain(graph, **kwargs):
+        started.set()
+        assert release.wait(5)
+        return louvain(graph, **kwargs)
+    monkeypatch.setattr(nx.community, "louvain_communities", slow_louvain)
+
+    result = []
+    worker = threading.Thread(target=lambda: result.append(engine.get_communities()))
+    worker.start()
+    assert started.wait(5)
+    # Edits and searches go on while the partition is computed
+    with engine.graph_lock:
+        engine.graph.add_edge("b1", "c0", relation="late")
+    engine.bump_version()
+    assert engine.search_nodes("a1", top_k=1, min_score=-1.0, mode="semantic")
+    release.set()
+    worker.join(5)
+
+    # The partition computed before the edit is not published as current
+    assert len(result[0].members) == 2
+    monkeypatch.undo()
+    assert engine.get_communities().community_of("c0") != -1
+
+def test_parse_community_ids():
+    assert parse_community_ids(None) == ((), None)
+    assert parse_community_ids([3, "1", 3]) == ((1, 3), None)
+    for bad in ("1", [True], ["x"], [1.5], {"id": 1}):
+        ids, error = parse_community_ids(bad)
+        assert ids == () and error
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from semantic_search import EmbeddingCache, normalize_rows
+from conftest import DIM, text_vector
+
+def encoder(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([text_vector(text) for text in texts])
+    return encode
+
+def test_only_unseen_texts_are_encoded(embedding_cache):
+    calls = []
+    first = embedding_cache.get(["alpha", "beta", "alpha"], encoder(calls))
+    second = embedding_cache.get([" beta ", "gamma"], encoder(calls))
+
+    assert calls == [["alpha", "beta"], ["gamma"]]
+    np.testing.assert_allclose(first[0], first[2])
+    np.testing.assert_allclose(second[0], first[1])
+    np.testing.assert_allclose(second[1], normalize_rows(text_vector("gamma")), rtol=1e-6)
+    assert embedding_cache.lookup(["alpha", "delta"]) is None
+
+def test_reopened_cache_serves_stored_vectors(embedding_cache):
+    expected = embedding_cache.get(["alpha", "beta"], encoder([]))
+    reopened = EmbeddingCache("fake-model", cache_dir=os.path.dirname(embedding_cache.folder))
+    np.testing.assert_array_equal(reopened.lookup(["beta", "alpha"]), expected[::-1])
+
+def test_torn_append_is_cut_off(embedding_cache):
+    embedding_cache.get(["alpha", "beta"], encoder([]))
+    # A crash after writing vectors but before (all of) their keys
+    with open(embedding_cache.vectors_path, "ab") as f:
+        f.write(np.ones((2, DIM), dtype=np.float32).tobytes())
+    with open(embedding_cache.keys_path, "a") as f:
+        f.write("deadbeef")
+
+    reopened = EmbeddingCache("fake-model", cache_dir=os.path.dirname(embedding_cache.folder))
+    assert reopened.count == 2 and "deadbeef" not in reopened.rows
+
+    gamma = reopened.get(["gamma"], encoder([]))
+    assert reopened.rows[EmbeddingCache.key("gamma")] == 2
+    np.testing.assert_array_equal(reopened.lookup(["gamma"]), gamma)
+    assert os.path.getsize(reopened.vectors_path) == 3 * DIM * 4
+    with open(reopened.keys_path) as f:
+        assert len(f.read().split()) == 3
+
+def test_appends_from_another_process_are_picked_up(embedding_cache):
+    other = EmbeddingCache("fake-model", cache_dir=os.path.dirname(embedding_cache.folder))
+    embedding_cache.get(["alpha"], encoder([]))
+    calls = []
+    other.get(["alpha", "beta"], encoder(calls))
+    embedding_cache.get(["gamma"], encoder([]))
+
+    # Rows are numbered by the shared files, not by what one instance has seen
+    assert other.rows[EmbeddingCache.key("beta")] == 1
+    assert embedding_cache.rows[EmbeddingCache.key("gamma")] == 2
+    np.testing.assert_array_equal(embedding_cache.lookup(["beta"]), other.lookup(["beta"]))
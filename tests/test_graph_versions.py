@@ -0,0 +1,80 @@
+import json
+
+import networkx as nx
+
+import knowledge_base
+from knowledge_base import GraphVersionStore
+
+ATTRIBUTES = json.dumps({"dataset": "paper.txt", "source": "extraction"})
+
+def rows(triples):
+    return {(e1, rel, e2, ATTRIBUTES) for e1, rel, e2 in triples}
+
+def graph_of(triples):
+    return GraphVersionStore.triples_to_graph(rows(triples))
+
+def test_commit_materialize_and_diff(tmp_path):
+    store = GraphVersionStore(str(tmp_path), "paper")
+    v1 = {("a", "cites", "b"), ("b", "uses", "c")}
+    v2 = {("a", "cites", "b"), ("c", "part_of", "d")}
+
+    assert store.commit(graph_of(v1))[0] == 1
+    version, delta = store.commit(graph_of(v2))
+    assert version == 2
+    expected = {"added": sorted(rows({("c", "part_of", "d")})), "removed": sorted(rows({("b", "uses", "c")}))}
+    assert delta == expected
+
+    assert store.materialize(1) == rows(v1) and store.materialize(2) == rows(v2)
+    assert store.materialize(3) is None
+    assert store.diff(1, 2) == expected
+
+def test_unchanged_graph_is_not_a_new_version(tmp_path):
+    store = GraphVersionStore(str(tmp_path), "paper")
+    triples = {("a", "cites", "b")}
+    store.commit(graph_of(triples))
+    assert store.commit(graph_of(triples)) == (1, {"added": [], "removed": []})
+    assert len(store.versions()) == 1
+
+def test_rebase_and_restore(tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base, "GRAPH_REBASE_INTERVAL", 3)
+    store = GraphVersionStore(str(tmp_path), "paper")
+    history = [{("n0", "r", f"n{i}") for i in range(1, size + 1)} for size in range(1, 8)]
+    for triples in history:
+        store.commit(graph_of(triples))
+
+    assert [e["type"] for e in store.versions()] == ["base", "delta", "delta", "base", "delta", "delta", "base"]
+    for version, triples in enumerate(history, start=1):
+        assert store.materialize(version) == rows(triples)
+
+    # Restoring commits the old triple set as the newest version
+    version, delta = store.commit(GraphVersionStore.triples_to_graph(store.materialize(2)))
+    assert version == 8 and not delta["added"]
+    assert store.materialize(8) == rows(history[1])
+
+def test_restore_keeps_edge_attributes(tmp_path):
+    store = GraphVersionStore(str(tmp_path), "paper")
+    original = nx.DiGraph()
+    original.add_edge("a", "b", label="cites", relation="cites", source="extraction", dataset="paper.txt")
+    store.commit(original)
+    changed = nx.DiGraph(original)
+    changed.edges["a", "b"]["dataset"] = "other.csv"
+    assert store.commit(changed)[0] == 2
+
+    restored = GraphVersionStore.triples_to_graph(store.materialize(1))
+    assert restored.edges["a", "b"] == original.edges["a", "b"]
+
+def test_versions_without_attributes_still_load(tmp_path):
+    store = GraphVersionStore(str(tmp_path), "paper")
+    store._write("v1.base.json", {"triples": [["a", "cites", "b"]]})
+    store._write("manifest.json", {"versions": [{"version": 1, "type": "base", "file": "v1.base.json"}]})
+
+    restored = GraphVersionStore.triples_to_graph(store.materialize(1))
+    assert restored.edges["a", "b"] == {"label": "cites", "relation": "cites", "source": "extraction"}
+
+def test_dataset_filter_matches_a_restored_graph(tmp_path, make_engine):
+    store = GraphVersionStore(str(tmp_path), "paper")
+    store.commit(graph_of({("a", "cites", "b"), ("b", "uses", "c")}))
+    engine = make_engine(GraphVersionStore.triples_to_graph(store.materialize(1)))
+
+    found = engine.search_nodes("a", top_k=5, min_score=-1.0, mode="semantic", filters=(("dataset", ("paper.txt",)),))
+    assert sorted(r["node"] for r in found) == ["a", "b", "c"]
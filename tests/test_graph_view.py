@@ -0,0 +1,48 @@
+import networkx as nx
+import pytest
+
+from semantic_search import GRAPH_VIEW_STRATEGIES, sample_graph_view
+
+def mixed_graph():
+    """A dense 'cites' hub plus a few edges of two rare relations"""
+    graph = nx.MultiDiGraph()
+    for i in range(60):
+        graph.add_edge("hub", f"paper {i}", relation="cites")
+        graph.add_edge(f"paper {i}", f"paper {(i + 1) % 60}", relation="cites")
+    graph.add_edge("drug a", "disease a", relation="treats")
+    graph.add_edge("gene a", "protein a", relation="encodes")
+    return graph
+
+@pytest.mark.parametrize("strategy", GRAPH_VIEW_STRATEGIES)
+def test_view_stays_within_budget(strategy):
+    graph = mixed_graph()
+    view = sample_graph_view(graph, max_nodes=20, max_edges=15, strategy=strategy)
+    ids = {node["id"] for node in view["nodes"]}
+
+    assert view["strategy"] == strategy
+    assert view["sampled_nodes"] == len(ids) <= 20 and view["sampled_edges"] == len(view["edges"]) <= 15
+    assert (view["total_nodes"], view["total_edges"]) == (graph.number_of_nodes(), graph.number_of_edges())
+    assert all(edge["source"] in ids and edge["target"] in ids for edge in view["edges"])
+    assert all(isinstance(node["x"], float) and isinstance(node["y"], float) for node in view["nodes"])
+
+def test_relation_strategy_keeps_rare_relations():
+    graph = mixed_graph()
+    assert {e["relation"] for e in sample_graph_view(graph, max_nodes=10, strategy="degree")["edges"]} == {"cites"}
+    relations = {e["relation"] for e in sample_graph_view(graph, max_nodes=10, strategy="relation")["edges"]}
+    assert relations == {"cites", "treats", "encodes"}
+
+def test_kcore_strategy_prefers_the_dense_core():
+    graph = nx.complete_graph(6)
+    nx.add_star(graph, ["star"] + [f"leaf {i}" for i in range(12)])
+    graph.add_edge(0, "star")
+    assert "star" in {node["id"] for node in sample_graph_view(graph, max_nodes=6, strategy="degree")["nodes"]}
+    view = sample_graph_view(graph, max_nodes=6, strategy="kcore")
+    assert {node["id"] for node in view["nodes"]} == set(range(6))
+
+def test_unknown_strategy_falls_back_to_degree():
+    view = sample_graph_view(mixed_graph(), max_nodes=1, strategy="spiral")
+    assert view["strategy"] == "degree" and [node["id"] for node in view["nodes"]] == ["hub"]
+
+def test_empty_graph():
+    view = sample_graph_view(nx.MultiDiGraph())
+    assert view["nodes"] == [] and view["edges"] == [] and view["sampled_nodes"] == 0
@@ -0,0 +1,54 @@
+import networkx as nx
+import pytest
+
+import semantic_search
+
+def chain_graph(n):
+    return nx.path_graph([f"entity {i}" for i in range(n)], create_using=nx.MultiDiGraph)
+
+def found(engine, node, top_k=3):
+    return [r["node"] for r in engine.search_nodes(node, top_k=top_k, min_score=0.0, mode="semantic")]
+
+@pytest.fixture(params=["exact", "ivf"])
+def engine(request, make_engine, monkeypatch):
+    if request.param == "ivf":
+        monkeypatch.setattr(semantic_search, "ANN_MIN_NODES", 50)
+    engine = make_engine(chain_graph(200))
+    assert (engine.ann_index is not None) == (request.param == "ivf")
+    return engine
+
+def test_removed_nodes_are_tombstoned(engine):
+    assert found(engine, "entity 7")[0] == "entity 7"
+
+    assert engine.remove_nodes(["entity 7", "not indexed"]) == 1
+    assert engine.tombstones == 1 and engine.node_count == 199
+    assert "entity 7" not in found(engine, "entity 7", top_k=10)
+
+    assert engine.add_nodes(["entity 7", "entity 8"]) == 1
+    assert found(engine, "entity 7")[0] == "entity 7"
+
+def test_compaction_drops_tombstones(engine):
+    epoch = engine.row_epoch
+    removed = [f"entity {i}" for i in range(0, 200, 3)]
+    engine.remove_nodes(removed[:40])
+    assert engine.tombstones == 40 and len(engine.nodes) == 200
+
+    # Crossing COMPACT_TOMBSTONE_RATIO compacts automatically
+    engine.remove_nodes(removed[40:])
+    assert engine.tombstones == 0
+    assert len(engine.nodes) == engine.node_count == 200 - len(removed)
+    assert engine.row_epoch > epoch
+
+    for node in ("entity 1", "entity 100", "entity 199"):
+        assert found(engine, node)[0] == node
+    assert not set(found(engine, "entity 3", top_k=20)) & set(removed)
+
+def test_sync_graph_embeds_only_changes(engine, model):
+    graph = chain_graph(200)
+    graph.remove_node("entity 5")
+    graph.add_edge("entity 4", "entity 5b")
+    encoded = model.encoded
+
+    assert engine.sync_graph(graph) == 200
+    assert model.encoded == encoded + 1
+    assert "entity 5" not in engine.node_rows and "entity 5b" in engine.node_rows
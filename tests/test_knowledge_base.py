@@ -0,0 +1,67 @@
+import threading
+
+from knowledge_base import TripleStore
+
+def test_apply_reports_added_and_orphaned_nodes(kb):
+    changes = []
+    kb.add_listener(changes.append)
+
+    change = kb.apply(added=[(4, "aspirin", "treats", "fever")], removed=[2])
+
+    assert change["added_nodes"] == ["fever"]
+    assert change["removed_nodes"] == ["ibuprofen"]
+    assert change["removed_triples"] == [(2, "ibuprofen", "treats", "headache")]
+    assert changes == [change]
+    assert "ibuprofen" not in kb.graph and kb.graph.has_edge("aspirin", "fever", key=4)
+
+def test_update_keeps_shared_nodes(kb):
+    version = kb.version
+    change = kb.update_triple(3, "aspirin", "inhibits", "cox-2")
+
+    assert change["removed_nodes"] == ["cox-1"] and change["added_nodes"] == ["cox-2"]
+    assert kb.version > version
+
+def test_engine_reads_wait_for_kb_edits(kb, make_engine):
+    engine = make_engine()
+    engine.build_index(kb.graph, neighbors=False, graph_lock=kb.lock)
+    assert engine.graph_lock is kb.lock
+
+    done = threading.Event()
+    with kb.lock:
+        reader = threading.Thread(target=lambda: (engine.get_communities(), done.set()))
+        reader.start()
+        assert not done.wait(0.2)
+    reader.join(5)
+    assert done.is_set()
+
+def test_store_loaded_before_a_pending_change_counts_it_once(kb):
+    store = TripleStore(kb)
+    # The first listener loads the store while the change is still being delivered
+    kb.add_listener(lambda change: store.ensure_loaded())
+    kb.add_listener(store.on_kb_change)
+
+    kb.add_triple(4, "aspirin", "treats", "fever")
+    kb.remove_triple(4)
+    assert store.match_terms("aspirin", "treats", "fever") == []
+
+def test_concurrent_edits_reach_listeners_in_order(kb):
+    seen, first_delivered, release = [], threading.Event(), threading.Event()
+
+    def slow_listener(change):
+        seen.append(change["version"])
+        if len(seen) == 1:
+            first_delivered.set()
+            release.wait(5)
+
+    kb.add_listener(slow_listener)
+    first = threading.Thread(target=kb.add_triple, args=(4, "aspirin", "treats", "fever"))
+    first.start()
+    assert first_delivered.wait(5)
+    second = threading.Thread(target=kb.remove_triple, args=(4,))
+    second.start()
+    second.join(0.2)
+    assert seen == [kb.version - 1]
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert seen == [kb.version - 1, kb.version]
@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+import pytest
+
+from semantic_search import MicroBatchEncoder
+from conftest import FakeModel
+
+class RecordingModel(FakeModel):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return super().encode(texts, **kwargs)
+
+def encode_concurrently(encoder, requests):
+    results, start = [None] * len(requests), threading.Barrier(len(requests))
+
+    def run(i):
+        start.wait(5)
+        results[i] = encoder.encode(requests[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+def test_concurrent_queries_share_one_forward_pass():
+    model = RecordingModel()
+    encoder = MicroBatchEncoder(model, window_ms=500)
+    requests = [["aspirin"], ["ibuprofen", "aspirin"], ["fever"], ["aspirin"]]
+    results = encode_concurrently(encoder, requests)
+
+    assert len(model.calls) == 1 and sorted(model.calls[0]) == ["aspirin", "fever", "ibuprofen"]
+    reference = FakeModel()
+    for texts, encoded in zip(requests, results):
+        np.testing.assert_array_equal(encoded, reference.encode(texts))
+    assert encoder.stats()["batches"] == 1 and encoder.stats()["texts"] == 3
+
+def test_batch_stops_at_max_batch():
+    model = RecordingModel()
+    encoder = MicroBatchEncoder(model, window_ms=500, max_batch=2)
+    encode_concurrently(encoder, [["a", "b"], ["c", "d"]])
+    assert sorted(len(call) for call in model.calls) == [2, 2]
+
+def test_encode_errors_reach_every_caller():
+    class BrokenModel:
+        def encode(self, texts, **kwargs):
+            raise RuntimeError("out of memory")
+
+    encoder = MicroBatchEncoder(BrokenModel(), window_ms=1)
+    with pytest.raises(RuntimeError, match="out of memory"):
+        encoder.encode(["aspirin"])
+    # The worker survives a failed batch
+    encoder.model = FakeModel()
+    assert encoder.encode(["aspirin"]).shape == (1, FakeModel().dim)
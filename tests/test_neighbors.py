@@ -0,0 +1,48 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+NODES = [f"entity {i}" for i in range(80)]
+
+@pytest.fixture
+def engine(make_engine):
+    return make_engine(nx.path_graph(NODES, create_using=nx.MultiDiGraph))
+
+def brute_force(engine, row, k):
+    scores = engine.node_embeddings @ engine.node_embeddings[row]
+    scores[row] = -np.inf
+    return np.argsort(-scores)[:k]
+
+def test_compute_neighbors_matches_brute_force(engine):
+    engine.remove_nodes([NODES[5]])
+    neighbors, scores = engine.compute_neighbors(k=4)
+    assert neighbors.shape == (len(NODES), 4)
+    for row in (0, 17, 63):
+        alive = [r for r in brute_force(engine, row, 5) if r != 5][:4]
+        assert neighbors[row].tolist() == alive
+        assert (np.diff(scores[row].astype(np.float32)) <= 0).all()
+    assert 5 not in neighbors
+
+def test_similar_nodes_switch_to_the_precomputed_graph(engine, model):
+    encoded = model.encoded
+    live, source = engine.similar_nodes(NODES[10], top_k=5)
+    assert source == "live" and NODES[10] not in [r["node"] for r in live]
+
+    # The live lookup scheduled the background kNN job
+    engine._neighbor_job.join(5)
+    precomputed, source = engine.similar_nodes(NODES[10], top_k=5)
+    assert source == "precomputed"
+    assert [r["node"] for r in precomputed] == [r["node"] for r in live]
+    np.testing.assert_allclose([r["score"] for r in precomputed], [r["score"] for r in live], atol=1e-3)
+    assert model.encoded == encoded
+
+def test_removed_nodes_drop_out_of_precomputed_neighbors(engine):
+    engine.schedule_neighbors()
+    engine._neighbor_job.join(5)
+    first = engine.similar_nodes(NODES[10], top_k=1)[0][0]["node"]
+    engine.remove_nodes([first])
+    results, source = engine.similar_nodes(NODES[10], top_k=3)
+    assert source == "precomputed" and first not in [r["node"] for r in results]
+
+def test_unknown_node_has_no_neighbors(engine):
+    assert engine.similar_nodes("missing") == (None, None)
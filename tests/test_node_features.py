@@ -0,0 +1,103 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from semantic_search import NodeFeatureIndex
+
+def hub_graph():
+    graph = nx.MultiDiGraph()
+    for i in range(20):
+        graph.add_edge(f"paper {i}", "hub", relation="cites", dataset="arxiv")
+    graph.add_edge("paper 0", "paper 1", relation="extends", dataset="acl")
+    return graph
+
+@pytest.fixture
+def pagerank_calls(monkeypatch):
+    calls = []
+    pagerank = nx.pagerank
+
+    def counting(graph, **kwargs):
+        calls.append(kwargs.get("nstart"))
+        return pagerank(graph, **kwargs)
+    monkeypatch.setattr(nx, "pagerank", counting)
+    return calls
+
+def test_filters_and_degrees(make_engine):
+    engine = make_engine(hub_graph())
+    features = engine.get_node_features()
+    rows = engine.node_rows
+
+    assert features.degrees[rows["hub"]] == 20
+    mask = features.mask((("dataset", ("acl",)),))
+    assert set(np.flatnonzero(mask)) == {rows["paper 0"], rows["paper 1"]}
+    assert features.mask((("min_degree", 2),)).sum() == 3
+
+def test_features_are_refreshed_not_rebuilt(make_engine, pagerank_calls):
+    graph = hub_graph()
+    engine = make_engine(graph)
+    features = engine.get_node_features()
+    ranks = features.centrality("pagerank")
+    assert ranks[engine.node_rows["hub"]] == 1.0 and len(pagerank_calls) == 1
+
+    graph.add_edge("paper 5", "newcomer", relation="cites", dataset="acl")
+    engine.add_nodes(["newcomer"])
+
+    assert engine.get_node_features() is features
+    assert features.degrees[engine.node_rows["paper 5"]] == 2
+    assert features.mask((("dataset", ("acl",)),))[engine.node_rows["newcomer"]]
+
+    # Stale ranks are served while PageRank reruns in the background, warm-started from them
+    stale = features.centrality("pagerank")
+    assert stale[engine.node_rows["newcomer"]] == 0.0
+    features._rank_job.join(10)
+    assert len(pagerank_calls) == 2 and "hub" in pagerank_calls[1]
+    assert features.centrality("pagerank")[engine.node_rows["newcomer"]] > 0.0
+
+    # Versions without any PageRank query do not trigger a recomputation
+    engine.bump_version()
+    engine.get_node_features()
+    assert len(pagerank_calls) == 2
+
+def test_new_graph_gets_new_features(make_engine):
+    engine = make_engine(hub_graph())
+    features = engine.get_node_features()
+    engine.build_index(hub_graph(), neighbors=False)
+    assert engine.get_node_features() is not features
+
+def test_pagerank_ranking_prefers_central_nodes(make_engine):
+    engine = make_engine(hub_graph())
+    for query in ("paper 3", "paper 12", "unrelated question"):
+        similarity = [r["node"] for r in engine.search_nodes(query, top_k=22, min_score=-1.0, mode="semantic")]
+        ranked = engine.search_nodes(query, top_k=22, min_score=-1.0, mode="semantic", ranking="pagerank")
+        order = [r["node"] for r in ranked]
+        assert sorted(order) == sorted(similarity)
+        assert order.index("hub") < similarity.index("hub") or similarity.index("hub") == 0
+
+def test_kb_edits_update_only_touched_nodes(kb, make_engine, monkeypatch):
+    engine = make_engine()
+    engine.build_index(kb.graph, neighbors=False, graph_lock=kb.lock)
+    kb.add_listener(engine.apply_graph_change)
+    features = engine.get_node_features()
+    assert features.mask((("relation", ("treats",)),)).sum() == 3
+
+    recomputed = []
+    incident = NodeFeatureIndex._incident
+
+    def tracked(self, node):
+        recomputed.append(node)
+        return incident(self, node)
+    monkeypatch.setattr(NodeFeatureIndex, "_incident", tracked)
+    monkeypatch.setattr(NodeFeatureIndex, "refresh", lambda self, nodes: pytest.fail("features were rebuilt"))
+
+    kb.apply(added=[(4, "paracetamol", "inhibits", "cox-1")], removed=[2])
+    assert engine.get_node_features() is features
+    assert sorted(recomputed) == ["cox-1", "headache", "ibuprofen", "paracetamol"]
+
+    # The incrementally updated features match ones built from scratch
+    monkeypatch.undo()
+    fresh = NodeFeatureIndex(kb.graph, engine.nodes, kb.lock)
+    alive = engine.alive
+    np.testing.assert_array_equal(features.degrees[alive], fresh.degrees[alive])
+    for filters in ((("relation", ("treats",)),), (("relation", ("inhibits",)),), (("dataset", ("kb",)),),
+                    (("min_degree", 2),)):
+        np.testing.assert_array_equal(features.mask(filters) & alive, fresh.mask(filters) & alive)
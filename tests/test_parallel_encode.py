@@ -0,0 +1,63 @@
+import os
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import semantic_search
+from semantic_search import ParallelEncoder, normalize_rows
+from conftest import text_vector
+
+FAKE_SENTENCE_TRANSFORMERS = '''
+import os
+from conftest import text_vector
+import numpy as np
+
+class _Device:
+    type = "cpu"
+
+class SentenceTransformer:
+    def __init__(self, name, device=None):
+        self.device = _Device()
+
+    def encode(self, texts, **kwargs):
+        if "boom" in texts:
+            raise ValueError("cannot encode boom")
+        return np.array([text_vector(text) for text in texts])
+'''
+
+@pytest.fixture
+def encoder(tmp_path, monkeypatch):
+    """A two-worker pool whose workers import a stand-in sentence_transformers module"""
+    (tmp_path / "sentence_transformers.py").write_text(FAKE_SENTENCE_TRANSFORMERS)
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join([str(tmp_path), tests_dir]))
+    monkeypatch.setattr(semantic_search, "ENCODE_CHUNK_MIN", 7)
+    encoder = ParallelEncoder("fake-model", processes=2)
+    yield encoder
+    encoder.stop()
+
+def test_chunks_cover_every_text(encoder):
+    texts = [f"text number {i}" * (i % 5 + 1) for i in range(60)]
+    chunks = list(encoder.encode_chunks(texts))
+
+    assert encoder.workers == 2 and len(chunks) >= 4
+    assert sorted(np.concatenate([positions for positions, _ in chunks]).tolist()) == list(range(60))
+    encoded = encoder.encode(texts)
+    np.testing.assert_allclose(encoded, [text_vector(text) for text in texts], rtol=1e-6)
+
+def test_worker_errors_restart_the_pool(encoder):
+    with pytest.raises(RuntimeError, match="cannot encode boom"):
+        encoder.encode(["fine"] * 20 + ["boom"])
+    np.testing.assert_allclose(encoder.encode(["fine"]), [text_vector("fine")], rtol=1e-6)
+
+def test_index_build_fills_cache_from_pool(encoder, make_engine, model, embedding_cache, monkeypatch):
+    monkeypatch.setattr(semantic_search, "PARALLEL_ENCODE_MIN", 10)
+    graph = nx.path_graph([f"node {i}" for i in range(100)], create_using=nx.MultiDiGraph)
+    engine = make_engine(embedding_cache=embedding_cache, bulk_encoder=encoder)
+    engine.build_index(graph, neighbors=False)
+
+    assert model.encoded == 0
+    assert embedding_cache.count == 100
+    assert engine.build_stats["encoder"] == "multi-process (2 workers)"
+    np.testing.assert_allclose(engine.node_embeddings[42], normalize_rows(text_vector("node 42")), rtol=1e-6)
@@ -0,0 +1,56 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+import semantic_search
+
+def star_graph(n):
+    graph = nx.MultiDiGraph()
+    for i in range(1, n):
+        graph.add_edge("hub", f"topic {i}", relation="covers")
+    return graph
+
+QUERIES = [f"question {i}" for i in range(20)]
+
+def ranked(engine, query):
+    return engine.search_nodes(query, top_k=10, min_score=-1.0, mode="semantic")
+
+@pytest.fixture
+def reference(make_engine, embedding_cache):
+    return make_engine(star_graph(400), embedding_cache=embedding_cache)
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_rescoring_restores_float32_ranking(make_engine, embedding_cache, reference, precision):
+    engine = make_engine(star_graph(400), embedding_cache=embedding_cache, precision=precision)
+    assert engine.node_embeddings.dtype == np.dtype(precision)
+
+    for query in QUERIES:
+        expected, actual = ranked(reference, query), ranked(engine, query)
+        assert [r["node"] for r in actual] == [r["node"] for r in expected]
+        np.testing.assert_allclose([r["score"] for r in actual], [r["score"] for r in expected], atol=1e-4)
+
+def test_without_cache_reduced_scores_are_used(make_engine, reference):
+    engine = make_engine(star_graph(400), precision="int8")
+    assert engine.embedding_cache is None
+
+    hits = 0
+    for query in QUERIES:
+        expected = {r["node"] for r in ranked(reference, query)}
+        hits += len(expected & {r["node"] for r in ranked(engine, query)})
+    assert hits / (10 * len(QUERIES)) >= 0.8
+
+def test_precision_report(make_engine, embedding_cache):
+    engine = make_engine(star_graph(400), embedding_cache=embedding_cache, precision="int8")
+    report = engine.precision_report(k=10, sample_queries=20)
+
+    assert report["precision"] == "int8" and report["nodes"] == 400
+    assert report["embedding_memory_mb"] < report["float32_memory_mb"] / 3
+    assert report["recall_at_k_rescored"] >= report["recall_at_k"]
+    assert report["recall_at_k_rescored"] >= 0.95
+
+@pytest.mark.parametrize("k", [0, -1, semantic_search.MAX_REPORT_K + 1])
+def test_precision_report_rejects_bad_k(make_engine, embedding_cache, k):
+    engine = make_engine(star_graph(50), embedding_cache=embedding_cache, precision="int8")
+    with pytest.raises(ValueError):
+        engine.precision_report(k=k)
+    assert "recall_at_k" in engine.precision_report(k=1)
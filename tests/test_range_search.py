@@ -0,0 +1,61 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+import semantic_search
+from semantic_search import IVFIndex
+from conftest import clustered_vectors
+
+def star_graph(n):
+    graph = nx.MultiDiGraph()
+    for i in range(1, n):
+        graph.add_edge("hub", f"topic {i}", relation="covers")
+    return graph
+
+def matched(page):
+    return [(r["node"], r["score"]) for r in page["results"]]
+
+@pytest.mark.parametrize("threshold", [0.5, 0.8, 0.95])
+def test_ivf_range_search_is_exact(threshold):
+    vectors = clustered_vectors(4000)
+    index = IVFIndex.build(vectors)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[::3] = False
+
+    for query in clustered_vectors(10, seed=2):
+        scores = vectors @ query
+        rows, found = index.range_search(query, threshold)
+        assert set(rows.tolist()) == set(np.flatnonzero(scores >= threshold).tolist())
+        np.testing.assert_allclose(found, scores[rows], rtol=1e-5)
+
+        rows, _ = index.range_search(query, threshold, mask=mask)
+        assert set(rows.tolist()) == set(np.flatnonzero((scores >= threshold) & mask).tolist())
+
+def test_pages_cover_every_match_best_first(make_engine):
+    engine = make_engine(star_graph(500))
+    full = engine.search_range("question", 0.2, limit=1000)
+    assert full["total"] == len(full["results"]) > 10 and not full["truncated"]
+    scores = [r["score"] for r in full["results"]]
+    assert scores == sorted(scores, reverse=True) and min(scores) >= 0.2
+
+    pages = [engine.search_range("question", 0.2, limit=7, offset=offset) for offset in range(0, full["total"], 7)]
+    assert sum((matched(page) for page in pages), []) == matched(full)
+    assert [r["rank"] for r in pages[1]["results"]] == list(range(8, 8 + len(pages[1]["results"])))
+
+def test_matches_beyond_the_cap_are_truncated(make_engine, monkeypatch):
+    monkeypatch.setattr(semantic_search, "RANGE_MAX_RESULTS", 25)
+    engine = make_engine(star_graph(500))
+    page = engine.search_range("question", -1.0, limit=1000)
+    assert page["truncated"] and page["total"] == 25
+    # The cap keeps the best matches
+    assert page["results"][0]["score"] >= max(r["score"] for r in engine.search_nodes(
+        "question", top_k=1, min_score=-1.0, mode="semantic"))
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_reduced_precision_range_matches_float32(make_engine, embedding_cache, precision):
+    reference = make_engine(star_graph(500), embedding_cache=embedding_cache)
+    engine = make_engine(star_graph(500), embedding_cache=embedding_cache, precision=precision)
+    for query in [f"question {i}" for i in range(10)]:
+        expected, actual = reference.search_range(query, 0.3, limit=1000), engine.search_range(query, 0.3, limit=1000)
+        assert [node for node, _ in matched(actual)] == [node for node, _ in matched(expected)]
+        np.testing.assert_allclose([s for _, s in matched(actual)], [s for _, s in matched(expected)], atol=1e-4)
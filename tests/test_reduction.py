@@ -0,0 +1,37 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from semantic_search import MAX_REPORT_K, VectorReducer
+from conftest import DIM, clustered_vectors
+
+def chain_graph(n):
+    return nx.path_graph([f"entity {i}" for i in range(n)], create_using=nx.MultiDiGraph)
+
+@pytest.mark.parametrize("method", ["pca", "random"])
+def test_reducer_projects_to_normalized_rows(method):
+    vectors = clustered_vectors(500)
+    reducer = VectorReducer(method, 8).fit(vectors)
+    reduced = reducer.transform(vectors)
+    assert reduced.shape == (500, 8) and reducer.signature == f"{method}-8"
+    np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1.0, rtol=1e-5)
+
+def test_engine_searches_in_the_reduced_space(make_engine):
+    engine = make_engine(chain_graph(200), reduce_dim=16)
+    assert engine.dim == 16 and engine.reducer.signature == "pca-16"
+    results = engine.search_nodes("entity 42", top_k=1, min_score=0.0, mode="semantic")
+    assert results[0]["node"] == "entity 42"
+
+def test_reduction_benchmark(make_engine):
+    engine = make_engine(chain_graph(200))
+    report = engine.reduction_benchmark(dims=[16, 8], k=5)
+    configs = [(row["method"], row["dimensions"]) for row in report["configurations"]]
+    assert configs == [("none", DIM), ("pca", 16), ("pca", 8), ("random", 16), ("random", 8)]
+    assert report["configurations"][0]["recall_at_k"] == 1.0
+
+@pytest.mark.parametrize("dims, k", [([16], 0), ([16], -2), ([16], MAX_REPORT_K + 1), ([0], 5), ([-8], 5),
+                                     ([DIM + 1], 5)])
+def test_reduction_benchmark_rejects_bad_parameters(make_engine, dims, k):
+    engine = make_engine(chain_graph(50))
+    with pytest.raises(ValueError):
+        engine.reduction_benchmark(dims=dims, k=k)
@@ -0,0 +1,74 @@
+import threading
+
+import networkx as nx
+import pytest
+
+import semantic_search
+from semantic_search import GRAPH_EDGE_BYTES, GRAPH_NODE_BYTES, SearchEngineRegistry, SemanticSearchEngine
+from conftest import FakeModel
+
+@pytest.fixture
+def closed(monkeypatch):
+    engines = []
+    close = SemanticSearchEngine.close
+
+    def tracked(self):
+        engines.append(self)
+        close(self)
+    monkeypatch.setattr(SemanticSearchEngine, "close", tracked)
+    return engines
+
+@pytest.fixture
+def registry(monkeypatch, embedding_cache):
+    monkeypatch.setattr(semantic_search, "load_embedding_model", lambda *args: (FakeModel(), embedding_cache))
+    monkeypatch.setattr(semantic_search, "QUERY_BATCH_WINDOW_MS", 0)
+    return SearchEngineRegistry(memory_budget_mb=0, model_name="fake-model")
+
+def path(n, prefix="node"):
+    return nx.path_graph([f"{prefix} {i}" for i in range(n)], create_using=nx.MultiDiGraph)
+
+def test_concurrent_loads_share_one_engine(registry, closed):
+    calls, entered = [], threading.Barrier(2)
+
+    def loader():
+        calls.append(1)
+        return path(20)
+
+    results = []
+    def load(user_id):
+        entered.wait(5)
+        results.append(registry.load(user_id, "user:1:kb.gpickle", loader))
+    threads = [threading.Thread(target=load, args=(user_id,)) for user_id in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1 and results[0] is results[1] and not closed
+    assert registry.users[results[0]] == 2
+
+def test_evicted_engine_is_closed_once_released(registry, closed):
+    first = registry.load(1, "a", lambda: path(20, "a"))
+    second = registry.load(2, "b", lambda: path(20, "b"))
+    # Over budget: "a" is evicted but still in use
+    assert list(registry.engines) == ["b"] and not closed
+
+    registry.release(first)
+    assert closed == [first]
+    registry.release(second)
+    assert closed == [first] and registry.get("b") is second
+
+def test_idle_engine_is_closed_on_eviction(registry, closed):
+    first = registry.load(1, "a", lambda: path(20, "a"))
+    registry.release(first)
+    registry.release(registry.load(2, "b", lambda: path(20, "b")))
+    assert closed == [first]
+    # The evicted index is rebuilt for its user on the next search
+    rebuilt = registry.active_engine(1)
+    assert rebuilt is not first and rebuilt.node_count == 20
+
+def test_budget_counts_owned_graphs_only(registry, kb):
+    owned = registry.load(1, "a", lambda: path(20))
+    shared = registry.load(2, "kb", kb.get_graph, graph_lock=kb.lock)
+    assert registry.memory_bytes("a", owned) == owned.memory_bytes() + 20 * GRAPH_NODE_BYTES + 19 * GRAPH_EDGE_BYTES
+    assert registry.memory_bytes("kb", shared) == shared.memory_bytes()
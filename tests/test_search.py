@@ -0,0 +1,76 @@
+import networkx as nx
+import pytest
+
+import semantic_search
+from semantic_search import MAX_TOP_K, LexicalIndex, looks_like_identifier, parse_search_limits
+
+@pytest.fixture
+def engine(make_engine):
+    graph = nx.MultiDiGraph()
+    for i in range(30):
+        graph.add_edge(f"gene {i}", f"protein {i}", relation="encodes")
+    return make_engine(graph)
+
+def test_parse_search_limits():
+    assert parse_search_limits(5, 0.3) == ((5, 0.3), None)
+    assert parse_search_limits("7", "0") == ((7, 0.0), None)
+    for top_k, min_score in ((0, 0.3), (MAX_TOP_K + 1, 0.3), (5, 1.5), (5, -2), ("many", 0.3), (5, None)):
+        limits, error = parse_search_limits(top_k, min_score)
+        assert limits is None and error
+
+def test_batch_applies_per_query_limits(engine):
+    requests = [("gene 3", 1, 0.0), ("protein 4", 4, 0.0), ("gene 5", 10, 0.99)]
+    results = engine.search_nodes_batch(requests, mode="semantic")
+
+    assert [r["node"] for r in results[0]] == ["gene 3"]
+    assert len(results[1]) == 4 and results[1][0]["node"] == "protein 4"
+    assert [r["node"] for r in results[2]] == ["gene 5"]
+    assert results == [engine.search_nodes(q, k, s, mode="semantic") for q, k, s in requests]
+
+def test_search_reports_the_mode_it_ran_in(make_engine, monkeypatch):
+    monkeypatch.setattr(semantic_search, "HYBRID_LEXICAL_WEIGHT", 0)
+    graph = nx.MultiDiGraph()
+    graph.add_edge("gene 1", "protein 1", relation="encodes")
+    engine = make_engine(graph)
+
+    assert engine.lexical is None
+    assert engine.mode_used("semantic") == "semantic" and engine.mode_used("hybrid") == "semantic"
+    with pytest.raises(ValueError):
+        engine.mode_used("lexical")
+    # A lexical search is not silently answered with semantic results
+    assert engine.search_nodes("gene 1", top_k=1, min_score=-1.0, mode="lexical") == []
+    with pytest.raises(ValueError):
+        engine.search_nodes_batch([("gene 1", 1, -1.0)], mode="lexical")
+
+def test_lexical_index_ranks_tokens_typos_and_exact_labels():
+    index = LexicalIndex(["has_alpha_3_code", "alpha centauri", "Beta blocker", "ISO 3166"])
+    rows, scores = index.search("alpha 3", 2)
+    assert rows.tolist()[0] == 0 and scores[0] == pytest.approx(0.8)
+    # No token matches, so character trigrams catch the typo
+    assert index.search("betta blockr", 1)[0].tolist() == [2]
+    rows, scores = index.search("iso 3166", 1)
+    assert rows.tolist() == [3] and scores[0] == 1.0
+
+    index.remove([3])
+    assert index.search("iso 3166", 1)[0].tolist() == []
+    index.add([4], ["ISO 3166"])
+    assert index.exact_rows("iso  3166") == [4]
+
+def test_lexical_and_hybrid_modes_match_label_tokens(engine):
+    lexical = engine.search_nodes("12 protein", top_k=2, min_score=0.0, mode="lexical")
+    assert [r["node"] for r in lexical] == ["protein 12", "gene 12"]
+    hybrid = engine.search_nodes("12 protein", top_k=1, min_score=0.0, mode="hybrid")
+    semantic = engine.search_nodes("12 protein", top_k=1, min_score=0.0, mode="semantic")
+    assert hybrid[0]["node"] == "protein 12" != semantic[0]["node"]
+
+def test_identifier_queries_take_the_lexical_fast_path(engine, model):
+    assert looks_like_identifier("BRCA1") and looks_like_identifier("has_alpha") and not looks_like_identifier("gene 3")
+    engine.add_nodes(["TP53"])
+    encoded = model.encoded
+    # An exact label match is answered without encoding the query
+    assert engine.search_nodes("tp53", top_k=1, min_score=0.0)[0] == {"node": "TP53", "score": 1.0, "degree": 0,
+                                                                       "rank": 1}
+    assert model.encoded == encoded
+    # Without one the query goes through the embedding search as usual
+    engine.search_nodes("TP63", top_k=1, min_score=0.0)
+    assert model.encoded == encoded + 1
@@ -0,0 +1,132 @@
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import semantic_search
+from semantic_search import ShardedIndex, serve_shard, shard_address, top_k_indices
+from conftest import clustered_vectors
+
+@pytest.fixture
+def shards():
+    index = ShardedIndex.build(shards=2)
+    yield index
+    index.close()
+
+def test_local_shards_match_exact_search(shards):
+    vectors = clustered_vectors(3000)
+    shards.attach(vectors)
+    queries = clustered_vectors(5, seed=1)
+
+    for (rows, scores), query in zip(shards.search_batch(queries, [10] * len(queries)), queries):
+        exact = top_k_indices(vectors @ query, 10)
+        np.testing.assert_array_equal(rows, exact)
+        np.testing.assert_allclose(scores, vectors[exact] @ query, rtol=1e-5)
+
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[::7] = True
+    rows, _ = shards.search(queries[0], 10, mask=mask)
+    np.testing.assert_array_equal(rows, np.flatnonzero(mask)[top_k_indices(vectors[mask] @ queries[0], 10)])
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def shard_server():
+    port = free_port()
+    threading.Thread(target=serve_shard, args=(str(port), b"secret"), daemon=True).start()
+    address = f"127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return address
+        except OSError:
+            time.sleep(0.05)
+    pytest.fail("shard server did not start")
+
+def test_shard_server_requires_authkey(monkeypatch):
+    monkeypatch.setattr(semantic_search, "SHARD_AUTHKEY", b"")
+    assert serve_shard(str(free_port())) == 1
+    with pytest.raises(ValueError):
+        ShardedIndex.build(addresses=["127.0.0.1:1"])
+
+def test_shard_address_defaults_to_localhost():
+    assert shard_address("7070") == ("127.0.0.1", 7070)
+    assert shard_address("0.0.0.0:7070") == ("0.0.0.0", 7070)
+
+def test_remote_shards_are_served_concurrently(shard_server):
+    vectors = clustered_vectors(1000)
+    # Both connections stay open at once; each is its own shard
+    index = ShardedIndex.build(addresses=[shard_server, shard_server], authkey=b"secret")
+    try:
+        index.attach(vectors)
+        rows, _ = index.search(vectors[10], 5)
+        assert rows[0] == 10
+        np.testing.assert_array_equal(rows, top_k_indices(vectors @ vectors[10], 5))
+    finally:
+        index.close()
+
+def test_wrong_authkey_is_rejected(shard_server):
+    with pytest.raises(AuthenticationError):
+        ShardedIndex.build(addresses=[shard_server], authkey=b"guess")
+    # The server keeps accepting after a failed handshake
+    ShardedIndex.build(addresses=[shard_server], authkey=b"secret").close()
+
+def test_serve_shard_cli_refuses_without_authkey(monkeypatch):
+    monkeypatch.delenv("KNOWMAP_SHARD_AUTHKEY", raising=False)
+    result = subprocess.run([sys.executable, semantic_search.__file__, "--serve-shard", str(free_port())],
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 1 and "KNOWMAP_SHARD_AUTHKEY" in result.stdout
+
+@pytest.fixture
+def sharded_engine(make_engine, monkeypatch):
+    monkeypatch.setattr(semantic_search, "SEARCH_SHARDS", 2)
+    monkeypatch.setattr(semantic_search, "SHARD_MIN_NODES", 50)
+    graph = nx.path_graph([f"entity {i}" for i in range(300)], create_using=nx.MultiDiGraph)
+    engine = make_engine(graph, precision="int8")
+    yield engine
+    engine.close()
+
+def found(engine, node, top_k=3):
+    return [r["node"] for r in engine.search_nodes(node, top_k=top_k, min_score=0.0, mode="semantic")]
+
+def test_sharded_engine_keeps_rows_only_in_shards(sharded_engine):
+    engine = sharded_engine
+    assert isinstance(engine.ann_index, ShardedIndex)
+    assert engine.node_embeddings is None and engine.is_ready()
+
+    # int8 rows plus int64 row ids, held by the shards
+    shard_bytes = engine.ann_index.memory_bytes()
+    assert shard_bytes == 300 * (engine.dim + 8)
+    assert engine.memory_bytes() >= shard_bytes
+
+    assert found(engine, "entity 7")[0] == "entity 7"
+    results, source = engine.similar_nodes("entity 7", top_k=5)
+    assert source == "live" and len(results) == 5 and "entity 7" not in [r["node"] for r in results]
+
+    page = engine.search_range("entity 7", 0.99)
+    assert [r["node"] for r in page["results"]] == ["entity 7"]
+
+def test_sharded_engine_add_remove_compact(sharded_engine):
+    engine = sharded_engine
+    assert engine.add_nodes(["new entity"]) == 1
+    assert found(engine, "new entity")[0] == "new entity"
+    assert engine.ann_index.memory_bytes() == 301 * (engine.dim + 8)
+
+    removed = [f"entity {i}" for i in range(0, 300, 2)]
+    engine.remove_nodes(removed)
+    # Crossing COMPACT_TOMBSTONE_RATIO renumbers the shards' rows
+    assert engine.tombstones == 0 and len(engine.nodes) == 151
+    assert isinstance(engine.ann_index, ShardedIndex)
+    assert engine.ann_index.memory_bytes() == 151 * (engine.dim + 8)
+    for node in ("entity 1", "entity 151", "new entity"):
+        assert found(engine, node)[0] == node
+    assert not set(found(engine, "entity 4", top_k=20)) & set(removed)
@@ -0,0 +1,60 @@
+import networkx as nx
+import pytest
+
+import semantic_search
+
+@pytest.fixture
+def engine(kb, make_engine, monkeypatch):
+    engine = make_engine()
+    engine.build_index(kb.graph, neighbors=False, graph_lock=kb.lock)
+    kb.add_listener(engine.apply_graph_change)
+    engine.get_triple_index()
+
+    def no_full_scan(graph):
+        raise AssertionError("the triple index was re-verbalized")
+    monkeypatch.setattr(semantic_search, "verbalize_triples", no_full_scan)
+    return engine
+
+def triples(engine, query="treats"):
+    return {(r["entity1"], r["relation"], r["entity2"])
+            for r in engine.search_triples(query, top_k=10, min_score=-1.0, mode="semantic")}
+
+def test_kb_edits_update_the_triple_index_incrementally(kb, engine):
+    kb.apply(added=[(4, "paracetamol", "treats", "fever")], removed=[2])
+    assert triples(engine) == {("aspirin", "treats", "headache"), ("paracetamol", "treats", "fever"),
+                               ("aspirin", "inhibits", "cox-1")}
+    assert engine.triple_count == 3
+    assert "ibuprofen" not in engine.node_rows and "paracetamol" in engine.node_rows
+
+    kb.update_triple(3, "aspirin", "inhibits", "cox-2")
+    assert ("aspirin", "inhibits", "cox-2") in triples(engine)
+    assert ("aspirin", "inhibits", "cox-1") not in triples(engine)
+
+def test_duplicate_triples_share_one_row(kb, engine):
+    kb.add_triple(5, "aspirin", "treats", "headache")
+    assert engine.triple_count == 3
+    hits = engine.search_triples("aspirin treats headache", top_k=10, min_score=-1.0, mode="semantic")
+    assert [(r["entity1"], r["entity2"]) for r in hits].count(("aspirin", "headache")) == 2
+
+    # Removing one copy keeps the sentence indexed for the other
+    kb.remove_triple(1)
+    assert ("aspirin", "treats", "headache") in triples(engine)
+    kb.remove_triple(5)
+    assert ("aspirin", "treats", "headache") not in triples(engine) and engine.triple_count == 2
+
+def test_a_change_already_in_the_index_is_not_applied_twice(kb, engine):
+    change = kb.add_triple(4, "paracetamol", "treats", "fever")
+    engine.apply_graph_change(change)
+    hits = engine.search_triples("paracetamol treats fever", top_k=10, min_score=-1.0, mode="semantic")
+    assert [(r["entity1"], r["entity2"]) for r in hits].count(("paracetamol", "fever")) == 1
+
+def test_replaced_graph_is_resynced_from_its_edges(make_engine):
+    graph = nx.MultiDiGraph()
+    graph.add_edge("a", "b", relation="cites")
+    engine = make_engine(graph)
+    engine.get_triple_index()
+
+    replacement = nx.MultiDiGraph()
+    replacement.add_edge("a", "c", relation="extends")
+    engine.sync_graph(replacement)
+    assert triples(engine, "a extends c") == {("a", "extends", "c")}
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from knowledge_base import TripleStore
+
+class FakeKB:
+    """The parts of KnowledgeBaseGraph a TripleStore reads"""
+
+    def __init__(self, edges):
+        self.lock = threading.RLock()
+        self.edges = dict(enumerate(edges, start=1))
+        self.version = 1
+
+    def get_graph(self):
+        return None
+
+@pytest.fixture
+def store():
+    store = TripleStore(FakeKB([
+        ("aspirin", "treats", "headache"),
+        ("ibuprofen", "treats", "headache"),
+        ("headache", "symptom_of", "flu"),
+        ("aspirin", "inhibits", "cox-1"),
+    ]))
+    store.load()
+    return store
+
+def test_join_binds_variables(store):
+    results = store.query([("?drug", "treats", "?symptom"), ("?symptom", "symptom_of", "flu")])
+    assert sorted(r["drug"] for r in results) == ["aspirin", "ibuprofen"]
+    assert all(r["symptom"] == "headache" for r in results)
+
+def test_wildcards_are_not_returned(store):
+    results = store.query([("aspirin", "*", "?target")])
+    assert sorted(results, key=lambda r: r["target"]) == [{"target": "cox-1"}, {"target": "headache"}]
+
+@pytest.mark.parametrize("patterns", [
+    [],
+    [("aspirin", "treats", "flu")],
+    [("aspirin", "*", "headache"), ("flu", "*", "*")],
+    [("aspirin", "treats", "headache"), ("ibuprofen", "inhibits", "*")],
+    [("?drug", "inhibits", "?target"), ("?target", "symptom_of", "*")],
+    [("unknown", "treats", "?x")],
+])
+def test_no_match_returns_empty(store, patterns):
+    assert store.query(patterns) == []
+
+def test_variable_free_match(store):
+    assert store.query([("aspirin", "treats", "headache"), ("headache", "*", "flu")]) == [{}]
+
+def test_updates_follow_kb_changes(store):
+    store.on_kb_change({"removed_triples": [(2, "ibuprofen", "treats", "headache")],
+                        "added_triples": [(5, "paracetamol", "treats", "headache")], "version": 2})
+    drugs = sorted(r["drug"] for r in store.query([("?drug", "treats", "headache")]))
+    assert drugs == ["aspirin", "paracetamol"]
+    assert store.match_terms("ibuprofen") == []
+    assert store.match_terms(relation="inhibits") == [
+        {"entity1": "aspirin", "relation": "inhibits", "entity2": "cox-1"}
+    ]
+
+def test_changes_already_loaded_are_skipped(store):
+    # A change at or below the loaded version is already in the store
+    store.on_kb_change({"removed_triples": [], "added_triples": [(1, "aspirin", "treats", "headache")], "version": 1})
+    store.on_kb_change({"removed_triples": [(1, "aspirin", "treats", "headache")], "added_triples": [], "version": 2})
+    assert store.match_terms("aspirin", "treats") == []